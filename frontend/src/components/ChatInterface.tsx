@@ -28,6 +28,26 @@ interface Message {
   dbId?: string; // Database ID for deletion
 }
 
+interface HistoryEntry {
+  id: string;
+  query: string;
+  response: string;
+  timestamp: string;
+}
+
+const HISTORY_PAGE_SIZE = 50;
+
+// History pages arrive newest first; the chat shows oldest first
+const historyToMessages = (history: HistoryEntry[]): Message[] => {
+  const loaded: Message[] = [];
+  for (const entry of [...history].reverse()) {
+    const timestamp = entry.timestamp.endsWith("Z") ? entry.timestamp : entry.timestamp + "Z";
+    loaded.push({ id: `user-${entry.id}`, role: "user", content: entry.query, timestamp });
+    loaded.push({ id: `bot-${entry.id}`, role: "bot", content: entry.response, timestamp, dbId: entry.id });
+  }
+  return loaded;
+};
+
 interface ChatInterfaceProps {
   chatbotName?: string;
   organizationId?: string;
@@ -43,7 +63,10 @@ const ChatInterface = ({ chatbotName, organizationId, onMessageUpdate, onClose }
   const [showClearConfirm, setShowClearConfirm] = useState(false);
   const [selectedIds, setSelectedIds] = useState<Set<string>>(new Set());
   const [messageToDelete, setMessageToDelete] = useState<string | null>(null);
+  const [olderCursor, setOlderCursor] = useState<string | null>(null);
+  const [isLoadingOlder, setIsLoadingOlder] = useState(false);
   const scrollViewportRef = useRef<HTMLDivElement>(null);
+  const skipAutoScrollRef = useRef(false);
 
   // Scroll to bottom when messages change
   const scrollToBottom = () => {
@@ -57,6 +80,11 @@ const ChatInterface = ({ chatbotName, organizationId, onMessageUpdate, onClose }
   };
 
   useEffect(() => {
+    // Prepending older history shouldn't jump to the bottom
+    if (skipAutoScrollRef.current) {
+      skipAutoScrollRef.current = false;
+      return;
+    }
     // Small timeout to ensure DOM is updated before scrolling
     const timeoutId = setTimeout(scrollToBottom, 50);
     return () => clearTimeout(timeoutId);
@@ -72,7 +100,7 @@ const ChatInterface = ({ chatbotName, organizationId, onMessageUpdate, onClose }
       try {
         console.log(`Loading history for org: ${organizationId}`);
         const token = localStorage.getItem("smartbot_token");
-        const response = await fetch(`${BASE_URL}/api/bot/${organizationId}/chat-history`, {
+        const response = await fetch(`${BASE_URL}/api/bot/${organizationId}/chat-history?limit=${HISTORY_PAGE_SIZE}`, {
           headers: {
             Authorization: `Bearer ${token}`,
           },
@@ -82,25 +110,8 @@ const ChatInterface = ({ chatbotName, organizationId, onMessageUpdate, onClose }
           const data = await response.json();
           console.log("Loaded chat history:", data);
 
-          const loadedMessages: Message[] = [];
-          if (data.history) {
-            const history = [...data.history].reverse();
-            for (const entry of history) {
-              loadedMessages.push({
-                id: `user-${entry.id}`,
-                role: "user",
-                content: entry.query,
-                timestamp: entry.timestamp.endsWith("Z") ? entry.timestamp : entry.timestamp + "Z",
-              });
-              loadedMessages.push({
-                id: `bot-${entry.id}`,
-                role: "bot",
-                content: entry.response,
-                timestamp: entry.timestamp.endsWith("Z") ? entry.timestamp : entry.timestamp + "Z",
-                dbId: entry.id,
-              });
-            }
-          }
+          const loadedMessages = data.history ? historyToMessages(data.history) : [];
+          setOlderCursor(data.next_cursor || null);
 
           if (loadedMessages.length > 0) {
             setMessages(loadedMessages);
@@ -139,6 +150,31 @@ const ChatInterface = ({ chatbotName, organizationId, onMessageUpdate, onClose }
     loadHistory();
   }, [organizationId]);
 
+  const loadOlderHistory = async () => {
+    if (!organizationId || !olderCursor || isLoadingOlder) return;
+    setIsLoadingOlder(true);
+    try {
+      const token = localStorage.getItem("smartbot_token");
+      const params = new URLSearchParams({ limit: String(HISTORY_PAGE_SIZE), cursor: olderCursor });
+      const response = await fetch(`${BASE_URL}/api/bot/${organizationId}/chat-history?${params}`, {
+        headers: {
+          Authorization: `Bearer ${token}`,
+        },
+      });
+      if (!response.ok) throw new Error(`status ${response.status}`);
+
+      const data = await response.json();
+      skipAutoScrollRef.current = true;
+      setMessages(prev => [...historyToMessages(data.history || []), ...prev]);
+      setOlderCursor(data.next_cursor || null);
+    } catch (error) {
+      console.error("Error loading older history:", error);
+      toast.error("Failed to load earlier messages");
+    } finally {
+      setIsLoadingOlder(false);
+    }
+  };
+
   const handleSendMessage = async (e: React.FormEvent) => {
     e.preventDefault();
 
@@ -373,6 +409,7 @@ const ChatInterface = ({ chatbotName, organizationId, onMessageUpdate, onClose }
           content: "Hello! I'm here to help. How can I assist you today?",
           timestamp: new Date().toLocaleTimeString()
         }]);
+        setOlderCursor(null);
         toast.success("Chat history cleared");
 
         if (onMessageUpdate && organizationId && messagesToRemove > 0) {
@@ -540,6 +577,13 @@ const ChatInterface = ({ chatbotName, organizationId, onMessageUpdate, onClose }
         <CardContent className="flex-1 flex flex-col p-0 overflow-hidden min-h-0">
           <ScrollArea className="flex-1 h-full w-full p-4" viewportRef={scrollViewportRef}>
             <div className="space-y-4 pb-4">
+              {olderCursor && (
+                <div className="flex justify-center">
+                  <Button variant="ghost" size="sm" onClick={loadOlderHistory} disabled={isLoadingOlder}>
+                    {isLoadingOlder ? "Loading..." : "Load earlier messages"}
+                  </Button>
+                </div>
+              )}
               {messages.map((message, index) => {
                 const showDateSeparator = index === 0 || getMessageDate(message.timestamp) !== getMessageDate(messages[index - 1].timestamp);
 
@@ -30,12 +30,14 @@ interface ChatbotCardProps {
   description: string;
   createdAt: string;
   location: string;
+  status?: string;
   onChat: () => void;
   onDelete: (id: string) => void;
   onRefresh?: () => void;
 }
 
-const ChatbotCard = ({ id, name, description, createdAt, location, onChat, onDelete, onRefresh }: ChatbotCardProps) => {
+const ChatbotCard = ({ id, name, description, createdAt, location, status = "ready", onChat, onDelete, onRefresh }: ChatbotCardProps) => {
+  const isProcessing = status === "pending" || status === "processing";
 
 
 
@@ -74,10 +76,9 @@ const ChatbotCard = ({ id, name, description, createdAt, location, onChat, onDel
 
       if (!response.ok) throw new Error('Export failed');
 
-      const data = await response.json();
-
-      // Create and download file
-      const blob = new Blob([JSON.stringify(data, null, 2)], { type: 'application/json' });
+      // The server streams the export file; save it as-is
+      const blob = await response.blob();
+      const total = response.headers.get('X-Total-Messages');
       const url = URL.createObjectURL(blob);
       const a = document.createElement('a');
       a.href = url;
@@ -87,7 +88,7 @@ const ChatbotCard = ({ id, name, description, createdAt, location, onChat, onDel
       document.body.removeChild(a);
       URL.revokeObjectURL(url);
 
-      toast.success('Chat history exported!', { description: `${data.total_messages} messages saved` });
+      toast.success('Chat history exported!', total ? { description: `${total} messages saved` } : undefined);
     } catch (error) {
       toast.error('Failed to export chat history');
     }
@@ -114,6 +115,12 @@ const ChatbotCard = ({ id, name, description, createdAt, location, onChat, onDel
               <Globe className="h-3 w-3" />
               <span>{location}</span>
             </div>
+            {isProcessing && (
+              <div className="mt-2 text-xs text-primary animate-pulse">Processing document…</div>
+            )}
+            {status === "failed" && (
+              <div className="mt-2 text-xs text-destructive">Document processing failed</div>
+            )}
           </div>
         </div>
       </CardHeader>
@@ -179,6 +186,7 @@ const ChatbotCard = ({ id, name, description, createdAt, location, onChat, onDel
               size="sm"
               variant="outline"
               onClick={onChat}
+              disabled={status !== "ready"}
               className="group-hover:bg-primary group-hover:text-primary-foreground group-hover:border-primary transition-all duration-300"
             >
               <MessageSquare className="h-4 w-4 mr-2" />
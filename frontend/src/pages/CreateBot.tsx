@@ -164,7 +164,9 @@ const CreateBot = () => {
       }
 
       toast.success("Chatbot created successfully!", {
-        description: `${result.name} is ready to chat`,
+        description: response.status === 202
+          ? `${result.name} is processing your document and will be ready shortly`
+          : `${result.name} is ready to chat`,
       });
 
       setBotName("");
@@ -22,8 +22,13 @@ interface Chatbot {
   createdAt: string;
   location: string;
   message_count: number;
+  status: string;
 }
 
+// How often, and for how long, to poll while a document is processing
+const POLL_INTERVAL_MS = 3000;
+const POLL_LIMIT_MS = 20 * 60 * 1000;
+
 const Dashboard = () => {
   const [chatbots, setChatbots] = useState<Chatbot[]>([]);
   const [selectedChatbot, setSelectedChatbot] = useState<string | null>(null);
@@ -75,7 +80,8 @@ const Dashboard = () => {
           description: org.description,
           createdAt: new Date(org.created_at).toISOString().split('T')[0],
           location: org.location || "Global",
-          message_count: org.message_count || 0
+          message_count: org.message_count || 0,
+          status: org.ingestion_status || "ready"
         }));
         setChatbots(formattedBots);
         sessionStorage.setItem('dashboard_chatbots', JSON.stringify(formattedBots));
@@ -87,6 +93,23 @@ const Dashboard = () => {
     }
   };
 
+  // Poll while any bot is still processing its uploaded document. The server
+  // fails jobs a restart abandoned, but stop after POLL_LIMIT_MS regardless;
+  // reloading the page starts polling again.
+  const hasProcessingBots = chatbots.some(bot => bot.status === "pending" || bot.status === "processing");
+  useEffect(() => {
+    if (!hasProcessingBots) return;
+    const startedAt = Date.now();
+    const intervalId = setInterval(() => {
+      if (Date.now() - startedAt > POLL_LIMIT_MS) {
+        clearInterval(intervalId);
+        return;
+      }
+      fetchChatbots();
+    }, POLL_INTERVAL_MS);
+    return () => clearInterval(intervalId);
+  }, [hasProcessingBots]);
+
   const handleMessageUpdate = (botId: string, delta: number) => {
     setChatbots(prev => {
       const updated = prev.map(bot => {
@@ -331,6 +354,7 @@ const Dashboard = () => {
                   description={bot.description}
                   createdAt={bot.createdAt}
                   location={bot.location}
+                  status={bot.status}
                   onChat={() => handleChatWithBot(bot.id, bot.name)}
                   onDelete={handleDeleteBot}
                 />
@@ -0,0 +1,272 @@
+"""Pre-aggregated chat analytics.
+
+chat_log writes each batch of chats together with increments to
+chat_rollups (messages and response characters per bot per hour and per
+day) and chat_rollup_visitors (distinct source IPs per bucket). Analytics
+reads those small tables, so a dashboard load costs O(buckets in range)
+instead of scanning chat_history. Migration 6 builds rollups for history
+written before they existed; `flask --app app backfill-rollups` rebuilds
+them on demand.
+"""
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import bindparam, func, select, delete, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import db, ChatHistory, ChatRollup, ChatRollupVisitor
+
+PERIODS = ('hour', 'day')
+MAX_POINTS = {'hour': 24 * 14, 'day': 366}
+
+
+def bucket_start(ts, period):
+    if period == 'hour':
+        return ts.replace(minute=0, second=0, microsecond=0)
+    return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _insert(model):
+    # Both supported databases have INSERT ... ON CONFLICT
+    dialect = postgresql if db.engine.dialect.name == 'postgresql' else sqlite
+    return dialect.insert(model)
+
+
+def _aggregate(rows):
+    """Group (org_id, timestamp, source_ip, response_chars) into rollup and visitor rows."""
+    totals = defaultdict(lambda: [0, 0])
+    visitors = set()
+    for org_id, ts, source_ip, response_chars in rows:
+        for period in PERIODS:
+            key = (org_id, period, bucket_start(ts, period))
+            totals[key][0] += 1
+            totals[key][1] += response_chars or 0
+            if source_ip:
+                visitors.add(key + (source_ip,))
+
+    rollups = [
+        {'organization_id': org_id, 'period': period, 'bucket': bucket,
+         'messages': messages, 'response_chars': chars}
+        for (org_id, period, bucket), (messages, chars) in totals.items()
+    ]
+    visitor_rows = [
+        {'organization_id': org_id, 'period': period, 'bucket': bucket, 'source_ip': ip}
+        for org_id, period, bucket, ip in visitors
+    ]
+    return rollups, visitor_rows
+
+
+def _write(rollups, visitor_rows):
+    if rollups:
+        stmt = _insert(ChatRollup)
+        db.session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=['organization_id', 'period', 'bucket'],
+                set_={
+                    'messages': ChatRollup.messages + stmt.excluded.messages,
+                    'response_chars': ChatRollup.response_chars + stmt.excluded.response_chars,
+                }
+            ),
+            rollups
+        )
+    if visitor_rows:
+        db.session.execute(_insert(ChatRollupVisitor).on_conflict_do_nothing(), visitor_rows)
+
+
+def record_chats(rows):
+    """Add newly written chat_history rows (dicts) to the rollups; the caller commits."""
+    _write(*_aggregate(
+        (row['organization_id'], row['timestamp'], row['source_ip'], len(row['response'] or ''))
+        for row in rows
+    ))
+
+
+def forget_chat(chat):
+    """Take a deleted chat_history row out of its rollups; the caller commits.
+
+    Visitor rows are left alone since another chat may share the IP.
+    """
+    for period in PERIODS:
+        db.session.execute(
+            update(ChatRollup)
+            .where(ChatRollup.organization_id == chat.organization_id, ChatRollup.period == period,
+                   ChatRollup.bucket == bucket_start(chat.timestamp, period))
+            .values(messages=ChatRollup.messages - 1,
+                    response_chars=ChatRollup.response_chars - len(chat.response or ''))
+        )
+
+
+def forget_chats(rows):
+    """Take deleted chats, as (org_id, timestamp, source_ip, response_chars), out of the rollups.
+
+    Used for batch deletes; visitor rows are left to clear(). The caller commits.
+    """
+    rollups, _ = _aggregate(row for row in rows if row[1] is not None)
+    if not rollups:
+        return
+    table = ChatRollup.__table__
+    db.session.execute(
+        update(table)
+        .where(table.c.organization_id == bindparam('b_org'), table.c.period == bindparam('b_period'),
+               table.c.bucket == bindparam('b_bucket'))
+        .values(messages=table.c.messages - bindparam('b_messages'),
+                response_chars=table.c.response_chars - bindparam('b_chars')),
+        [{'b_org': r['organization_id'], 'b_period': r['period'], 'b_bucket': r['bucket'],
+          'b_messages': r['messages'], 'b_chars': r['response_chars']} for r in rollups]
+    )
+
+
+def clear(org_id, before=None):
+    """Drop a bot's rollups; the caller commits.
+
+    With `before`, only buckets that end by then are dropped (their chats are
+    gone), along with any emptied by forget_chats and their visitors. Newer
+    buckets are kept.
+    """
+    if before is None:
+        for model in (ChatRollup, ChatRollupVisitor):
+            db.session.execute(delete(model).where(model.organization_id == org_id))
+        return
+    for period in PERIODS:
+        ended = bucket_start(before, period) - _step(period)
+        for model in (ChatRollup, ChatRollupVisitor):
+            db.session.execute(delete(model).where(
+                model.organization_id == org_id, model.period == period, model.bucket <= ended))
+    db.session.execute(delete(ChatRollup).where(
+        ChatRollup.organization_id == org_id, ChatRollup.messages <= 0))
+    # Visitors of buckets left without chats
+    db.session.execute(delete(ChatRollupVisitor).where(
+        ChatRollupVisitor.organization_id == org_id,
+        ~select(ChatRollup.bucket).where(
+            ChatRollup.organization_id == ChatRollupVisitor.organization_id,
+            ChatRollup.period == ChatRollupVisitor.period,
+            ChatRollup.bucket == ChatRollupVisitor.bucket,
+        ).exists()
+    ))
+
+
+def backfill(org_id=None, batch_size=5000):
+    """Rebuild rollups from chat_history for one bot or all of them; returns chats counted.
+
+    Existing rollups for the affected bots are replaced. Chats written while
+    this runs may be counted twice or missed, so run it during quiet hours.
+    """
+    stmt = select(
+        ChatHistory.organization_id, ChatHistory.timestamp, ChatHistory.source_ip,
+        func.length(ChatHistory.response)
+    ).execution_options(yield_per=batch_size)
+    if org_id:
+        stmt = stmt.where(ChatHistory.organization_id == org_id)
+
+    # Aggregated while streaming, so memory grows with buckets rather than chats
+    rollups, visitor_rows = _aggregate(row for row in db.session.execute(stmt) if row[1] is not None)
+    counted = sum(r['messages'] for r in rollups if r['period'] == 'day')
+
+    for model in (ChatRollup, ChatRollupVisitor):
+        clear = delete(model)
+        if org_id:
+            clear = clear.where(model.organization_id == org_id)
+        db.session.execute(clear)
+    for start in range(0, len(rollups), batch_size):
+        _write(rollups[start:start + batch_size], [])
+    for start in range(0, len(visitor_rows), batch_size):
+        _write([], visitor_rows[start:start + batch_size])
+    db.session.commit()
+    return counted
+
+
+def _step(period):
+    return timedelta(hours=1) if period == 'hour' else timedelta(days=1)
+
+
+def series(org_id, start, end, period='day'):
+    """Zero-filled per-bucket stats for buckets starting in [start, end]."""
+    start, end = bucket_start(start, period), bucket_start(end, period)
+
+    totals = {
+        bucket: (messages, chars)
+        for bucket, messages, chars in db.session.execute(
+            select(ChatRollup.bucket, ChatRollup.messages, ChatRollup.response_chars)
+            .where(ChatRollup.organization_id == org_id, ChatRollup.period == period,
+                   ChatRollup.bucket.between(start, end))
+        )
+    }
+    visitors = dict(db.session.execute(
+        select(ChatRollupVisitor.bucket, func.count())
+        .where(ChatRollupVisitor.organization_id == org_id, ChatRollupVisitor.period == period,
+               ChatRollupVisitor.bucket.between(start, end))
+        .group_by(ChatRollupVisitor.bucket)
+    ).all())
+
+    points = []
+    bucket = start
+    while bucket <= end:
+        messages, chars = totals.get(bucket, (0, 0))
+        points.append({
+            'bucket': bucket.isoformat(),
+            'messages': messages,
+            'unique_visitors': visitors.get(bucket, 0),
+            'avg_response_length': round(chars / messages, 1) if messages else 0,
+        })
+        bucket += _step(period)
+    return points
+
+
+def summary(org_id, since=None):
+    """Totals over day buckets (all time, or from `since`)."""
+    filters = [ChatRollup.organization_id == org_id, ChatRollup.period == 'day']
+    visitor_filters = [ChatRollupVisitor.organization_id == org_id, ChatRollupVisitor.period == 'day']
+    if since is not None:
+        filters.append(ChatRollup.bucket >= bucket_start(since, 'day'))
+        visitor_filters.append(ChatRollupVisitor.bucket >= bucket_start(since, 'day'))
+
+    messages, chars = db.session.execute(
+        select(func.coalesce(func.sum(ChatRollup.messages), 0),
+               func.coalesce(func.sum(ChatRollup.response_chars), 0)).where(*filters)
+    ).one()
+    unique_visitors = db.session.scalar(
+        select(func.count(func.distinct(ChatRollupVisitor.source_ip))).where(*visitor_filters)
+    )
+    return {
+        'messages': int(messages),
+        'unique_visitors': unique_visitors or 0,
+        'avg_response_length': round(int(chars) / messages, 1) if messages else 0,
+    }
+
+
+def parse_timestamp(value):
+    """Parse an ISO timestamp into naive UTC, the way chat timestamps are stored; raises ValueError."""
+    # fromisoformat only accepts a trailing 'Z' from Python 3.11
+    ts = datetime.fromisoformat(value[:-1] + '+00:00' if value.endswith('Z') else value)
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return ts
+
+
+def parse_range(args, now=None):
+    """Read ?range=7d|24h (or ?start=&end= ISO dates) and ?interval=hour|day.
+
+    Returns (start, end, period) or raises ValueError with a user-facing message.
+    """
+    now = now or datetime.utcnow()
+    spec = args.get('range', '7d')
+    period = args.get('interval', 'hour' if spec.endswith('h') else 'day')
+    if period not in PERIODS:
+        raise ValueError("interval must be 'hour' or 'day'")
+
+    if args.get('start'):
+        start = parse_timestamp(args['start'])
+        end = parse_timestamp(args['end']) if args.get('end') else now
+    else:
+        unit = {'h': timedelta(hours=1), 'd': timedelta(days=1)}.get(spec[-1:])
+        if not unit or not spec[:-1].isdigit() or int(spec[:-1]) < 1:
+            raise ValueError("range must look like '24h' or '30d'")
+        end = now
+        # '7d' means today and the six days before it
+        start = end - unit * (int(spec[:-1]) - 1)
+
+    if start > end:
+        raise ValueError("start must be before end")
+    if (end - start) // _step(period) + 1 > MAX_POINTS[period]:
+        raise ValueError(f"too many {period} buckets requested (max {MAX_POINTS[period]})")
+    return start, end, period
@@ -0,0 +1,160 @@
+"""Per-bot answer cache for repeated questions.
+
+Answers are keyed by (org_id, content version, normalized query), so any
+change to a bot's content produces new keys and old answers simply age out.
+The default backend is an in-process LRU with a TTL. Setting
+ANSWER_CACHE_URL=redis://... shares the cache between all gunicorn workers
+(size is then bounded by the Redis maxmemory policy).
+"""
+from collections import OrderedDict
+import hashlib
+import os
+import re
+import threading
+import time
+
+ANSWER_CACHE_ENABLED = os.getenv('ANSWER_CACHE_ENABLED', 'true').lower() == 'true'
+ANSWER_CACHE_TTL = int(os.getenv('ANSWER_CACHE_TTL', 3600))
+ANSWER_CACHE_SIZE = int(os.getenv('ANSWER_CACHE_SIZE', 2048))
+ANSWER_CACHE_URL = os.getenv('ANSWER_CACHE_URL')
+
+_PUNCT_RE = re.compile(r"[^\w\s]")
+
+
+def normalize_query(query):
+    """Lowercase, drop punctuation and collapse whitespace."""
+    return ' '.join(_PUNCT_RE.sub(' ', query.lower()).split())
+
+
+class MemoryBackend:
+    """Thread-safe LRU with per-entry expiry."""
+
+    def __init__(self, max_size=ANSWER_CACHE_SIZE):
+        self.max_size = max_size
+        self.evictions = 0
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if not entry:
+                return None
+            if entry[0] < time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (time.time() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete_prefix(self, prefix):
+        with self._lock:
+            for key in [k for k in self._data if k.startswith(prefix)]:
+                del self._data[key]
+
+    def size(self):
+        return len(self._data)
+
+
+class RedisBackend:
+    """Shared backend for multiple workers/instances (requires the redis package)."""
+
+    def __init__(self, url):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.evictions = 0
+
+    def get(self, key):
+        value = self.client.get(key)
+        return value.decode('utf-8') if value is not None else None
+
+    def set(self, key, value, ttl):
+        self.client.setex(key, ttl, value)
+
+    def delete_prefix(self, prefix):
+        keys = list(self.client.scan_iter(match=prefix + '*', count=500))
+        if keys:
+            self.client.delete(*keys)
+
+    def size(self):
+        return None
+
+
+class AnswerCache:
+    """Answer cache with hit/miss accounting."""
+
+    def __init__(self, backend, ttl=ANSWER_CACHE_TTL, enabled=True):
+        self.backend = backend
+        self.ttl = ttl
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _key(self, org_id, version, query):
+        digest = hashlib.sha1(normalize_query(query).encode('utf-8')).hexdigest()
+        return f"answer:{org_id}:{version}:{digest}"
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, org_id, version, query):
+        """Return a cached answer or None."""
+        if not self.enabled:
+            return None
+        try:
+            value = self.backend.get(self._key(org_id, version, query))
+        except Exception as e:
+            print(f"Answer cache get error: {str(e)}")
+            value = None
+        self._count(value is not None)
+        return value
+
+    def set(self, org_id, version, query, response):
+        if not self.enabled or not response:
+            return
+        try:
+            self.backend.set(self._key(org_id, version, query), response, self.ttl)
+        except Exception as e:
+            print(f"Answer cache set error: {str(e)}")
+
+    def invalidate(self, org_id):
+        """Drop every cached answer for a bot, whatever its content version."""
+        try:
+            self.backend.delete_prefix(f"answer:{org_id}:")
+        except Exception as e:
+            print(f"Answer cache invalidate error: {str(e)}")
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'enabled': self.enabled,
+            'backend': type(self.backend).__name__,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total, 4) if total else 0.0,
+            'evictions': self.backend.evictions,
+            'size': self.backend.size(),
+        }
+
+
+def create_cache():
+    """Build the answer cache from environment configuration."""
+    backend = None
+    if ANSWER_CACHE_URL:
+        try:
+            backend = RedisBackend(ANSWER_CACHE_URL)
+        except Exception as e:
+            print(f"Warning: shared answer cache unavailable ({str(e)}), using in-process cache")
+    return AnswerCache(backend or MemoryBackend(), enabled=ANSWER_CACHE_ENABLED)
@@ -1,141 +1,352 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Blueprint, jsonify, request, Response, stream_with_context
 from flask_cors import CORS
+import click
 from dotenv import load_dotenv
 import os
-from sqlalchemy import text
+import json
+import base64
+from sqlalchemy import tuple_
+from sqlalchemy.orm import load_only
 from datetime import datetime
 from werkzeug.utils import secure_filename
-import tempfile
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.middleware.proxy_fix import ProxyFix
 from pathlib import Path
 
-from groq import Groq
-import pypdf
-import docx2txt
-
-from models import db, Organization, ChatHistory, WidgetConfig, User
+from models import db, Organization, ChatHistory, WidgetConfig, Job
 from auth import auth_bp
 from email_service import mail
 from middleware import jwt_required, jwt_optional
+import retrieval
+import bot_context
+from bot_context import SYSTEM_PROMPT
+import jobs
+import chat_log
+import analytics
+import exports
+import retention
+import uploads
+import documents
+import auth_cache
+import passwords
+import rate_limit
+import widget_asset
+import widget_config
+import migrations
+import metrics
+from extraction import extract_text, ExtractionTimeout, SUPPORTED_EXTENSIONS
+from llm_client import get_client, LLM_MODEL
+from answer_cache import create_cache
+from semantic_cache import SemanticCache, SEED_LIMIT as SEMANTIC_SEED_LIMIT
 
 load_dotenv()
 
-app = Flask(__name__)
-CORS(app, resources={r"/api/*": {"origins": "*"}})
-
-# Database configuration - Neon PostgreSQL
-# Database configuration - Neon PostgreSQL
-database_url = os.getenv("DATABASE_URL")
-if not database_url:
-    print("Warning: DATABASE_URL not set in .env")
-
-if database_url and database_url.startswith("postgres://"):
-    database_url = database_url.replace("postgres://", "postgresql://", 1)
-
-app.config['SQLALCHEMY_DATABASE_URI'] = database_url
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
-    'pool_pre_ping': True,      # Test connections before using (fixes Neon SSL drops)
-    'pool_recycle': 300,         # Recycle connections every 5 minutes
-    'pool_size': 5,              # Keep pool small for free tier
-    'max_overflow': 2,           # Allow 2 extra connections under load
-}
-app.config['SECRET_KEY'] = os.getenv('JWT_SECRET', 'dev-secret-key')
-
-# Email configuration
-app.config['MAIL_SERVER'] = 'smtp.gmail.com'
-app.config['MAIL_PORT'] = 587
-app.config['MAIL_USE_TLS'] = True
-app.config['MAIL_USERNAME'] = os.getenv('MAIL_USERNAME')
-app.config['MAIL_PASSWORD'] = os.getenv('MAIL_PASSWORD')
-app.config['MAIL_DEFAULT_SENDER'] = os.getenv('MAIL_USERNAME')
-
-# Initialize extensions
-db.init_app(app)
-mail.init_app(app)
-
-# Register blueprints
-app.register_blueprint(auth_bp)
-
-# AI Configuration
-groq_api_key = os.getenv("GROQ_API_KEY")
-llm = None
-
-if groq_api_key:
-    llm = Groq(api_key=groq_api_key)
-
-def get_context_text(org):
-    """Extract context text from organization data for LLM queries."""
-    if org.mode == 'automatic' and org.data and org.data.get('content'):
-        return org.data['content']
-    elif org.mode == 'manual' and org.data:
-        d = org.data
-        text = f"Organization Name: {d.get('name', '')}\n"
-        text += f"Website: {d.get('website', '')}\n"
-        text += f"Industry: {d.get('industry', '')}\n"
-        text += f"About: {d.get('about', '')}\n\nEmployees:\n"
-        for emp in d.get('employees', []):
-            text += f"- {emp.get('name', '')}: {emp.get('role', '')}\n"
-        text += "\nProducts:\n"
-        for prod in d.get('products', []):
-            text += f"- {prod.get('name', '')}: {prod.get('details', '')}\n"
-        text += "\nServices:\n"
-        for serv in d.get('services', []):
-            text += f"- {serv.get('name', '')}: {serv.get('details', '')}\n"
-        return text
-    return ''
-
-# Create tables
-with app.app_context():
-    print("Attempting to connect to database...")
+# Platforms without a release step can set AUTO_MIGRATE=true to migrate at boot
+AUTO_MIGRATE = os.getenv('AUTO_MIGRATE', 'false').lower() in ('1', 'true', 'yes')
+# Reverse proxies in front of the app (Render, Hugging Face, nginx) whose
+# X-Forwarded-For / X-Forwarded-Proto are trusted. Rate limits and chat
+# history use the client IP they report; set 0 if clients connect directly,
+# or they could spoof their address.
+TRUSTED_PROXY_HOPS = int(os.getenv('TRUSTED_PROXY_HOPS', 1))
+
+api = Blueprint('api', __name__, cli_group=None)
+
+def create_app():
+    """Build the Flask app.
+
+    Nothing here touches the database; schema changes are applied once per
+    deploy with `flask --app app migrate` (see migrations.py).
+    """
+    app = Flask(__name__)
+    if TRUSTED_PROXY_HOPS > 0:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_HOPS, x_proto=TRUSTED_PROXY_HOPS)
+    CORS(app, resources={r"/api/*": {"origins": "*"}})
+
+    # Database configuration - Neon PostgreSQL
+    database_url = os.getenv("DATABASE_URL")
+    if not database_url:
+        print("Warning: DATABASE_URL not set in .env")
+
+    if database_url and database_url.startswith("postgres://"):
+        database_url = database_url.replace("postgres://", "postgresql://", 1)
+
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        'pool_pre_ping': True,      # Test connections before using (fixes Neon SSL drops)
+        'pool_recycle': 300,         # Recycle connections every 5 minutes
+        'pool_size': int(os.getenv('DB_POOL_SIZE', 5)),        # Keep pool small for free tier
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 2)),  # Allow extra connections under load
+        'pool_timeout': int(os.getenv('DB_POOL_TIMEOUT', 30)),
+    }
+    app.config['SECRET_KEY'] = os.getenv('JWT_SECRET', 'dev-secret-key')
+
+    # Email configuration
+    app.config['MAIL_SERVER'] = 'smtp.gmail.com'
+    app.config['MAIL_PORT'] = 587
+    app.config['MAIL_USE_TLS'] = True
+    app.config['MAIL_USERNAME'] = os.getenv('MAIL_USERNAME')
+    app.config['MAIL_PASSWORD'] = os.getenv('MAIL_PASSWORD')
+    app.config['MAIL_DEFAULT_SENDER'] = os.getenv('MAIL_USERNAME')
+
+    # Initialize extensions
+    db.init_app(app)
+    mail.init_app(app)
+    jobs.init_app(app)
+    uploads.init_app(app)
+    chat_log.init_app(app)
+    retention.init_app(app)
+    metrics.init_app(app)
+
+    # Register blueprints
+    app.register_blueprint(auth_bp)
+    app.register_blueprint(api)
+
+    if AUTO_MIGRATE:
+        with app.app_context():
+            migrations.migrate()
+    return app
+
+# The LLM client (LLM_BACKEND=fake uses an offline stand-in) is created on
+# first use by llm_client.get_client()
+
+# Cache of answers to repeated questions (ANSWER_CACHE_URL shares it across workers)
+answer_cache = create_cache()
+# Opt-in per bot: reuse answers to paraphrased questions
+semantic_cache = SemanticCache()
+# Token buckets and in-flight caps for the query endpoints (RATE_LIMIT_URL shares them)
+rate_limiter = rate_limit.create_limiter()
+
+# Chat history is served in pages (keyset pagination)
+HISTORY_PAGE_SIZE = int(os.getenv('HISTORY_PAGE_SIZE', 50))
+HISTORY_MAX_PAGE_SIZE = int(os.getenv('HISTORY_MAX_PAGE_SIZE', 200))
+
+def build_llm_messages(org_id, context, query):
+    """Build the chat messages for a query, using only the relevant context."""
+    system_prompt = context.system_prompt
+    if system_prompt is None:
+        # Only send the chunks relevant to this query (small bots are precompiled whole)
+        selected = retrieval.select_context(org_id, context.text, query, version=context.version)
+        system_prompt = SYSTEM_PROMPT.format(context=selected)
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": query},
+    ]
+
+def recent_exchanges(org_id, version):
+    """Latest stored question/answer pairs given from this content version, for warming the semantic cache."""
+    return db.session.query(ChatHistory.query, ChatHistory.response)\
+        .filter_by(organization_id=org_id, context_version=version)\
+        .order_by(ChatHistory.timestamp.desc())\
+        .limit(SEMANTIC_SEED_LIMIT).all()
+
+def lookup_cached_answer(org, version, query):
+    """Return (response, cache_info) from the exact or semantic cache, or (None, None)."""
+    response = answer_cache.get(org.id, version, query)
+    if response is not None:
+        return response, {"cache": "exact"}
+
+    threshold = org.semantic_cache_threshold
+    if threshold:
+        response, similarity = semantic_cache.lookup(
+            org.id, version, query, threshold, seed=lambda: recent_exchanges(org.id, version)
+        )
+        if response is not None:
+            return response, {"cache": "semantic", "similarity": round(similarity, 4)}
+    return None, None
+
+def remember_answer(org, version, query, response):
+    """Store a fresh LLM answer in the caches."""
+    answer_cache.set(org.id, version, query, response)
+    if org.semantic_cache_threshold:
+        semantic_cache.add(org.id, version, query, response, seed=lambda: recent_exchanges(org.id, version))
+
+def ingest_document(org_id, source, file_ext):
+    """Background job: extract an uploaded document and index it for retrieval."""
     try:
-        db.create_all()
-        print("Database tables created/verified.")
-        
-        # Migration for is_deleted
-        print("Checking migrations...")
-        with db.engine.connect() as conn:
-            conn.execute(text("ALTER TABLE organizations ADD COLUMN IF NOT EXISTS is_deleted BOOLEAN DEFAULT FALSE"))
-            conn.commit()
-            print("Migration checking complete")
+        org = db.session.get(Organization, org_id)
+        org.ingestion_status = 'processing'
+        db.session.commit()
+
+        try:
+            full_text = jobs.offload(extract_text, source, file_ext)
+        except ExtractionTimeout:
+            raise jobs.JobError("The document took too long to read. Try a smaller or text-based file.")
+
+        org = db.session.get(Organization, org_id)
+        org.document_id = documents.store(full_text)
+        context = bot_context.compile_context(org)
+        db.session.commit()
+
+        retrieval.index_organization(org_id, context.text, version=context.version, offload=jobs.offload)
+
+        org.ingestion_status = 'ready'
+        db.session.commit()
     except Exception as e:
-        print(f"Startup Database Error: {e}")
-        # Don't crash the app, just log error so home route still works
-        pass
-    print("Startup complete.")
+        db.session.rollback()
+        org = db.session.get(Organization, org_id)
+        if org:
+            org.ingestion_status = 'failed'
+            org.ingestion_error = jobs.public_error(e)
+            db.session.commit()
+        raise
+    finally:
+        uploads.close_upload(source)
+
+def not_ready_response(org):
+    """Error response for bots whose document hasn't finished processing."""
+    if org.ingestion_status == 'failed':
+        return jsonify({
+            "error": "This bot's document could not be processed. Please recreate the bot.",
+            "code": "INGESTION_FAILED"
+        }), 409
+    return jsonify({
+        "error": "This bot is still processing its document. Please try again shortly.",
+        "code": "NOT_READY",
+        "status": org.ingestion_status
+    }), 503, {'Retry-After': '5'}
+
+def check_query_limits(org):
+    """Apply the query rate limits; returns (Rejection or None, bot owner's tier)."""
+    owner = auth_cache.get_user(org.user_id)
+    owner_tier = owner['tier'] if owner else None
+    user_id = getattr(request, 'user_id', None)
+    user = auth_cache.get_user(user_id) if user_id else None
+    rejection = rate_limiter.check(org.id, owner_tier, request.remote_addr,
+                                   user_id, user['tier'] if user else None)
+    return rejection, owner_tier
+
+def rate_limited_response(rejection):
+    """429 for a query turned away by a rate limit or the bot's concurrency cap."""
+    if rejection.scope == 'concurrency':
+        body = {"error": "This bot is answering too many questions at once. Please try again shortly.",
+                "code": "BOT_BUSY"}
+    else:
+        body = {"error": "Too many requests. Please slow down.",
+                "code": "RATE_LIMITED", "limit": rejection.scope}
+    return jsonify(body), 429, {'Retry-After': str(rejection.retry_after)}
+
+# Everything but `data` (file details or the manual profile), which only editors need
+ORG_DETAIL_FIELDS = tuple(f for f in Organization.FIELDS if f != 'data')
+
+def requested_org_fields(default):
+    """Organization fields asked for with ?fields=a,b or ?detail=1; raises ValueError on unknown names."""
+    if request.args.get('detail', '').lower() in ('1', 'true', 'yes'):
+        return Organization.FIELDS
+    if not request.args.get('fields'):
+        return default
+    fields = tuple(f.strip() for f in request.args['fields'].split(',') if f.strip())
+    unknown = [f for f in fields if f not in Organization.FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return fields or default
+
+def org_to_dict(org, fields):
+    """org.to_dict(fields), with the document text back in data['content'] when data is asked for."""
+    result = org.to_dict(fields)
+    if 'data' in fields and org.document_id:
+        result['data'] = {**(result['data'] or {}), 'content': documents.load(org.document_id)}
+    return result
+
+def encode_history_cursor(chat):
+    raw = f"{chat.timestamp.isoformat()}|{chat.id}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+def decode_history_cursor(cursor):
+    """Return the (timestamp, id) a history page continues after; raises ValueError."""
+    ts, chat_id = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').split('|', 1)
+    return datetime.fromisoformat(ts), chat_id
+
+def sse_event(data, event=None):
+    """Format a Server-Sent Event carrying a JSON payload."""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+@api.app_errorhandler(413)
+def upload_too_large(e):
+    return jsonify({
+        "error": f"File is too large. The maximum upload size is {uploads.MAX_UPLOAD_MB:g} MB.",
+        "code": "FILE_TOO_LARGE"
+    }), 413
 
-@app.route('/')
+@api.route('/')
 def home():
     return jsonify({"message": "SmartBot Builder API is running!", "status": "ok"})
 
-@app.route('/api/user/me', methods=['GET'])
+@api.route('/api/stats', methods=['GET'])
+@jwt_required
+def get_stats():
+    """Runtime counters for this worker's caches"""
+    return jsonify({
+        'answer_cache': answer_cache.stats(),
+        'semantic_cache': semantic_cache.stats(),
+        'context_cache': bot_context.stats(),
+        'documents': documents.stats(),
+        'auth_cache': auth_cache.stats(),
+        'passwords': passwords.stats(),
+        'rate_limit': rate_limiter.stats(),
+        'widget_config': widget_config.stats(),
+        'chat_log': chat_log.stats()
+    })
+
+@api.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus metrics for all workers of this instance"""
+    if not metrics.METRICS_ENABLED:
+        return jsonify({'error': 'Metrics are disabled', 'code': 'METRICS_DISABLED'}), 404
+    if not metrics.METRICS_TOKEN and not metrics.METRICS_PUBLIC:
+        return jsonify({'error': 'Set METRICS_TOKEN to enable /metrics', 'code': 'METRICS_DISABLED'}), 404
+    if not metrics.authorized(request.headers.get('Authorization')):
+        return jsonify({'error': 'Invalid metrics token', 'code': 'TOKEN_INVALID'}), 401
+    body, content_type = metrics.exposition()
+    return Response(body, content_type=content_type)
+
+@api.route('/api/user/me', methods=['GET'])
 @jwt_required
 def get_current_user():
     """Get current authenticated user"""
-    user = User.query.get(request.user_id)
+    user = auth_cache.get_user(request.user_id)
     if not user:
         return jsonify({'error': 'User not found'}), 404
-    return jsonify({'user': user.to_dict()}), 200
+    return jsonify({'user': user}), 200
 
-@app.route('/api/organizations', methods=['GET'])
+@api.route('/api/organizations', methods=['GET'])
 @jwt_required
 def get_organizations():
-    """Get all organizations for the authenticated user"""
-    orgs = Organization.query.filter_by(user_id=request.user_id, is_deleted=False).order_by(Organization.created_at.desc()).all()
-    return jsonify([org.to_dict() for org in orgs])
-
-@app.route('/api/organizations/<org_id>', methods=['GET'])
+    """Get all organizations for the authenticated user (summary fields unless ?fields= or ?detail=1)"""
+    try:
+        fields = requested_org_fields(Organization.SUMMARY_FIELDS)
+    except ValueError as e:
+        return jsonify({'error': str(e), 'code': 'INVALID_FIELDS'}), 400
+    
+    # Only the requested columns are selected (data also needs document_id for the text)
+    columns = fields + ('document_id',) if 'data' in fields else fields
+    orgs = Organization.query.options(load_only(*[getattr(Organization, f) for f in columns]))\
+        .filter_by(user_id=request.user_id, is_deleted=False).order_by(Organization.created_at.desc()).all()
+    if 'ingestion_status' in fields:
+        # The dashboard polls this while documents process; fail ones a restart abandoned
+        jobs.fail_stale([org.id for org in orgs if org.ingestion_status in ('pending', 'processing')])
+    return jsonify([org_to_dict(org, fields) for org in orgs])
+
+@api.route('/api/organizations/<org_id>', methods=['GET'])
 @jwt_required
 def get_organization(org_id):
-    """Get a single organization"""
+    """Get a single organization; its document/profile `data` only with ?detail=1 or ?fields=...,data"""
+    try:
+        fields = requested_org_fields(ORG_DETAIL_FIELDS)
+    except ValueError as e:
+        return jsonify({'error': str(e), 'code': 'INVALID_FIELDS'}), 400
+    
     org = Organization.query.filter_by(id=org_id, user_id=request.user_id).first()
     if not org:
         return jsonify({'error': 'Organization not found'}), 404
-    return jsonify(org.to_dict())
+    return jsonify(org_to_dict(org, fields))
 
-@app.route('/api/create-bot', methods=['POST'])
+@api.route('/api/create-bot', methods=['POST'])
 @jwt_required
 def create_bot():
     """Create a new chatbot"""
+    upload = None
     try:
         mode = request.form.get('mode')
         bot_name = request.form.get('botName')
@@ -145,11 +356,11 @@ def create_bot():
             return jsonify({"error": "Bot name and description are required"}), 400
 
         # Check bot limit for free tier
-        user = User.query.get(request.user_id)
+        user = auth_cache.get_user(request.user_id)
         if not user:
             return jsonify({"error": "User not found. Please login again."}), 401
             
-        if user.tier == 'free':
+        if user['tier'] == 'free':
             bot_count = Organization.query.filter_by(user_id=request.user_id, is_deleted=False).count()
             if bot_count >= 3:
                 return jsonify({"error": "Free tier limit reached (3 bots). Upgrade to Pro for unlimited bots."}), 403
@@ -168,33 +379,19 @@ def create_bot():
             filename = secure_filename(doc_file.filename)
             file_ext = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
             
-            if file_ext not in ['pdf', 'docx', 'doc']:
+            if file_ext not in SUPPORTED_EXTENSIONS:
                 return jsonify({"error": "Only PDF and DOCX files are supported"}), 400
 
-            # Create temp file with correct extension
-            suffix = f'.{file_ext}' if file_ext else '.pdf'
-            with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp_file:
-                doc_file.save(tmp_file.name)
-                tmp_path = tmp_file.name
+            # Hand the in-memory (or spooled) upload to the background extraction job
+            source = uploads.take_upload(doc_file)
+            if source is None:
+                return jsonify({"error": "The uploaded file is empty"}), 400
+            upload = (source, file_ext)
 
-            try:
-                # Extract text based on file type
-                if file_ext == 'pdf':
-                    reader = pypdf.PdfReader(tmp_path)
-                    pages = [page.extract_text() or '' for page in reader.pages]
-                    full_text = "\n\n".join(pages)
-                else:
-                    full_text = docx2txt.process(tmp_path)
-
-                org_data = {
-                    "file_name": filename,
-                    "file_type": file_ext.upper(),
-                    "content": full_text
-                }
-
-            finally:
-                if os.path.exists(tmp_path):
-                    os.unlink(tmp_path)
+            org_data = {
+                "file_name": filename,
+                "file_type": file_ext.upper()
+            }
 
         elif mode == 'manual':
             org_name = request.form.get('orgName')
@@ -251,9 +448,12 @@ Employees:
             description=bot_description,
             mode=mode,
             data=org_data,
-            location="Global"
+            location="Global",
+            ingestion_status='pending' if upload else 'ready'
         )
         db.session.add(organization)
+        db.session.flush()  # assigns the id used as the context cache key
+        context = bot_context.compile_context(organization)
         db.session.commit()
 
         # Create default widget config
@@ -261,18 +461,74 @@ Employees:
         db.session.add(widget_config)
         db.session.commit()
 
+        if upload:
+            # Extract and index the document in the background
+            job = jobs.create_job('ingest_document', organization.id)
+            db.session.commit()
+            jobs.submit(job, ingest_document, organization.id, *upload)
+            upload = None
+
+            return jsonify({
+                "message": "Chatbot created! Your document is being processed.",
+                "organization_id": organization.id,
+                "name": bot_name,
+                "job_id": job.id,
+                "status": organization.ingestion_status
+            }), 202
+
+        # Chunk and index the content now so the first query is fast
+        retrieval.index_organization(organization.id, context.text, version=context.version, offload=jobs.offload)
+
         return jsonify({
             "message": "Chatbot created successfully!",
             "organization_id": organization.id,
             "name": bot_name
         }), 201
 
+    except RequestEntityTooLarge:
+        raise
     except Exception as e:
         db.session.rollback()
+        if upload:
+            uploads.close_upload(upload[0])
         print(f"Error creating bot: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/bot/<org_id>/settings', methods=['GET'])
+@api.route('/api/bot/<org_id>/status', methods=['GET'])
+@jwt_required
+def get_bot_status(org_id):
+    """Get a bot's document processing status (polled by the dashboard)"""
+    org = Organization.query.filter_by(id=org_id, user_id=request.user_id).first()
+    if not org:
+        return jsonify({'error': 'Organization not found'}), 404
+    
+    if org.ingestion_status in ('pending', 'processing'):
+        jobs.fail_stale([org_id])
+    job = Job.query.filter_by(organization_id=org_id).order_by(Job.created_at.desc()).first()
+    return jsonify({
+        'organization_id': org_id,
+        'status': org.ingestion_status,
+        'error': org.ingestion_error,
+        'job': job.to_dict() if job else None
+    })
+
+@api.route('/api/jobs/<job_id>', methods=['GET'])
+@jwt_required
+def get_job(job_id):
+    """Get the status of a background job"""
+    job = db.session.get(Job, job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    org = Organization.query.filter_by(id=job.organization_id, user_id=request.user_id).first()
+    if not org:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    if job.status in jobs.ACTIVE:
+        jobs.fail_stale([org.id])
+    return jsonify(job.to_dict())
+
+@api.route('/api/bot/<org_id>/settings', methods=['GET'])
 @jwt_required
 def get_bot_settings(org_id):
     """Get bot widget settings"""
@@ -287,11 +543,11 @@ def get_bot_settings(org_id):
         db.session.commit()
     
     return jsonify({
-        'organization': org.to_dict(),
+        'organization': org.to_dict(ORG_DETAIL_FIELDS),
         'widget_config': config.to_dict()
     })
 
-@app.route('/api/bot/<org_id>/settings', methods=['PUT'])
+@api.route('/api/bot/<org_id>/settings', methods=['PUT'])
 @jwt_required
 def update_bot_settings(org_id):
     """Update bot widget settings"""
@@ -301,49 +557,79 @@ def update_bot_settings(org_id):
     
     data = request.get_json()
     config = WidgetConfig.query.filter_by(organization_id=org_id).first()
+    if not config:
+        config = WidgetConfig(organization_id=org_id)
+        db.session.add(config)
     
-    if config:
-        if 'theme' in data:
-            config.theme = data['theme']
-        if 'position' in data:
-            config.position = data['position']
-        if 'welcome_message' in data:
-            config.welcome_message = data['welcome_message']
-        if 'primary_color' in data:
-            config.primary_color = data['primary_color']
-        db.session.commit()
+    if 'semantic_cache_threshold' in data:
+        threshold = data['semantic_cache_threshold']
+        if threshold is not None:
+            try:
+                threshold = float(threshold)
+            except (TypeError, ValueError):
+                threshold = -1
+            if not 0 < threshold <= 1:
+                return jsonify({'error': 'semantic_cache_threshold must be between 0 and 1, or null to disable'}), 400
+        org.semantic_cache_threshold = threshold
+        semantic_cache.invalidate(org_id)
+    
+    if 'retention_days' in data:
+        days = data['retention_days']
+        if days is not None:
+            if not isinstance(days, int) or isinstance(days, bool) or not 1 <= days <= retention.MAX_RETENTION_DAYS:
+                return jsonify({'error': f'retention_days must be a whole number from 1 to {retention.MAX_RETENTION_DAYS}, or null to keep everything'}), 400
+        org.retention_days = days
+    
+    if 'theme' in data:
+        config.theme = data['theme']
+    if 'position' in data:
+        config.position = data['position']
+    if 'welcome_message' in data:
+        config.welcome_message = data['welcome_message']
+    if 'primary_color' in data:
+        config.primary_color = data['primary_color']
+    
+    db.session.commit()
+    widget_config.invalidate(org_id)
     
     return jsonify({'message': 'Settings updated', 'widget_config': config.to_dict()})
 
-@app.route('/api/bot/<org_id>/analytics', methods=['GET'])
+@api.route('/api/bot/<org_id>/analytics', methods=['GET'])
 @jwt_required
 def get_bot_analytics(org_id):
-    """Get analytics for a bot"""
+    """Get analytics for a bot.
+
+    Totals come from the chat rollups. ?range=30d / ?range=48h, or
+    ?start=&end= (ISO dates), with ?interval=day|hour select the time series.
+    """
     org = Organization.query.filter_by(id=org_id, user_id=request.user_id).first()
     if not org:
         return jsonify({'error': 'Organization not found'}), 404
     
-    total_messages = db.session.query(ChatHistory).filter_by(organization_id=org_id).count()
+    try:
+        start, end, period = analytics.parse_range(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e), 'code': 'INVALID_RANGE'}), 400
     
-    # Get messages from last 7 days
     from datetime import timedelta
-    week_ago = datetime.utcnow() - timedelta(days=7)
-    recent_messages = db.session.query(ChatHistory).filter(
-        ChatHistory.organization_id == org_id,
-        ChatHistory.timestamp >= week_ago
-    ).count()
+    totals = analytics.summary(org_id)
+    week = analytics.summary(org_id, since=datetime.utcnow() - timedelta(days=6))
     
     # Get recent chat history
     recent_chats = db.session.query(ChatHistory).filter_by(organization_id=org_id)\
         .order_by(ChatHistory.timestamp.desc()).limit(10).all()
     
     return jsonify({
-        'total_messages': total_messages,
-        'messages_this_week': recent_messages,
+        'total_messages': totals['messages'],
+        'messages_this_week': week['messages'],
+        'unique_visitors_this_week': week['unique_visitors'],
+        'avg_response_length': totals['avg_response_length'],
+        'interval': period,
+        'series': analytics.series(org_id, start, end, period),
         'recent_chats': [chat.to_dict() for chat in recent_chats]
     })
 
-@app.route('/api/bot/<org_id>/embed', methods=['GET'])
+@api.route('/api/bot/<org_id>/embed', methods=['GET'])
 @jwt_required
 def get_embed_code(org_id):
     """Get embed code for a bot"""
@@ -351,19 +637,15 @@ def get_embed_code(org_id):
     if not org:
         return jsonify({'error': 'Organization not found'}), 404
     
-    config = WidgetConfig.query.filter_by(organization_id=org_id).first()
-    
-    # Generate embed code
+    # Theme, position, colour and welcome message are fetched by the widget
+    # itself (see get_widget_config), so settings changes reach existing embeds
     base_url = request.host_url.rstrip('/')
     embed_code = f'''<!-- SmartBot Widget -->
 <script>
   (function() {{
     var script = document.createElement('script');
-    script.src = '{base_url}/widget.js';
+    script.src = '{widget_asset.url(base_url)}';
     script.setAttribute('data-bot-id', '{org_id}');
-    script.setAttribute('data-theme', '{config.theme if config else "dark"}');
-    script.setAttribute('data-position', '{config.position if config else "bottom-right"}');
-    script.setAttribute('data-color', '{config.primary_color if config else "#8B5CF6"}');
     document.body.appendChild(script);
   }})();
 </script>'''
@@ -373,7 +655,7 @@ def get_embed_code(org_id):
         'bot_id': org_id
     })
 
-@app.route('/api/query/<org_id>', methods=['POST'])
+@api.route('/api/query/<org_id>', methods=['POST'])
 @jwt_optional
 def query_organization(org_id):
     """Query a chatbot (works for both authenticated users and widget)"""
@@ -384,64 +666,192 @@ def query_organization(org_id):
         if not query:
             return jsonify({"error": "Query is required"}), 400
 
-        org = Organization.query.get(org_id)
+        # The document itself is only loaded if its rendered context isn't cached
+        with metrics.span('org_load'):
+            org = Organization.query.get(org_id)
         if not org:
             return jsonify({"error": "Organization not found"}), 404
 
-        # Get context text from stored data
-        context_text = get_context_text(org)
-        if not context_text:
+        if org.ingestion_status != 'ready':
+            return not_ready_response(org)
+
+        with metrics.span('rate_limit'):
+            rejection, owner_tier = check_query_limits(org)
+        if rejection:
+            return rate_limited_response(rejection)
+
+        # Rendered context, cached per content version
+        with metrics.span('context'):
+            context = bot_context.get_context(org)
+        if not context.text:
             return jsonify({
                 "error": "Bot data not available. Please recreate the bot.",
                 "code": "NO_DATA"
             }), 500
 
+        llm = get_client()
         if not llm:
             return jsonify({"error": "AI service not configured"}), 500
 
-        # Query Groq LLM directly with context (no local ML model needed)
-        system_prompt = f"""You are a helpful AI assistant for the organization described below. Answer questions based ONLY on the provided information. If the answer is not in the information, say you don't have that information.
-
-Organization Information:
-{context_text}"""
+        # Repeated (or, if enabled, paraphrased) questions are served from cache
+        version = context.version
+        with metrics.span('cache_lookup'):
+            response, cache_info = lookup_cached_answer(org, version, query)
+        cached = response is not None
 
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": query},
-        ]
-        llm_response = llm.chat.completions.create(
-            model="llama-3.3-70b-versatile",
-            messages=messages,
-        )
-        response = llm_response.choices[0].message.content
-
-        # Save chat history
-        chat_entry = ChatHistory(
-            organization_id=org_id,
-            user_id=request.user_id if hasattr(request, 'user_id') else None,
-            query=query,
-            response=str(response),
-            source_ip=request.remote_addr
-        )
-        db.session.add(chat_entry)
-        
-        # Update message count
-        org.message_count = (org.message_count or 0) + 1
-        db.session.commit()
+        if not cached:
+            # Fail fast if the bot already has as many LLM calls running as it may
+            slot = rate_limiter.acquire(org_id, owner_tier)
+            if isinstance(slot, rate_limit.Rejection):
+                return rate_limited_response(slot)
 
-        return jsonify({
-            "response": str(response),
-            "chat_id": chat_entry.id,
-            "timestamp": datetime.now().isoformat()
-        })
+            # Everything after acquire runs under the try so the slot can't leak
+            try:
+                # Query Groq LLM directly with context (no local ML model needed)
+                with metrics.span('retrieval'):
+                    messages = build_llm_messages(org_id, context, query)
+
+                # Give the DB connection back to the pool while we wait on the LLM
+                db.session.close()
+                with metrics.span('llm'):
+                    llm_response = llm.chat.completions.create(
+                        model=LLM_MODEL,
+                        messages=messages,
+                    )
+            finally:
+                slot.release()
+            metrics.record_llm_usage(LLM_MODEL, getattr(llm_response, 'usage', None))
+            response = str(llm_response.choices[0].message.content)
+            remember_answer(org, version, query, response)
+
+        # Queue the chat for the write-behind flusher
+        with metrics.span('db_write'):
+            chat_id = chat_log.record(org_id, query, response, getattr(request, 'user_id', None), request.remote_addr,
+                                      version=version)
+
+        result = {
+            "response": response,
+            "chat_id": chat_id,
+            "timestamp": datetime.now().isoformat(),
+            "cached": cached
+        }
+        if cache_info:
+            result.update(cache_info)
+        with metrics.span('serialize'):
+            return jsonify(result)
 
     except Exception as e:
         print(f"Error querying: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+@api.route('/api/query/<org_id>/stream', methods=['POST'])
+@jwt_optional
+def query_organization_stream(org_id):
+    """Query a chatbot and stream the answer as Server-Sent Events.
+
+    Emits `data: {"token": ...}` events as the LLM produces text, then a final
+    `event: done` with the saved chat id (or `event: error` on failure).
+    """
+    data = request.get_json(silent=True) or {}
+    query = data.get('query')
 
+    if not query:
+        return jsonify({"error": "Query is required"}), 400
 
-@app.route('/api/bot/<org_id>', methods=['DELETE'])
+    with metrics.span('org_load'):
+        org = Organization.query.get(org_id)
+    if not org:
+        return jsonify({"error": "Organization not found"}), 404
+
+    if org.ingestion_status != 'ready':
+        return not_ready_response(org)
+
+    with metrics.span('rate_limit'):
+        rejection, owner_tier = check_query_limits(org)
+    if rejection:
+        return rate_limited_response(rejection)
+
+    with metrics.span('context'):
+        context = bot_context.get_context(org)
+    if not context.text:
+        return jsonify({
+            "error": "Bot data not available. Please recreate the bot.",
+            "code": "NO_DATA"
+        }), 500
+
+    llm = get_client()
+    if not llm:
+        return jsonify({"error": "AI service not configured"}), 500
+
+    version = context.version
+    with metrics.span('cache_lookup'):
+        cached_response, cache_info = lookup_cached_answer(org, version, query)
+    with metrics.span('retrieval'):
+        messages = None if cached_response is not None else build_llm_messages(org_id, context, query)
+
+    user_id = getattr(request, 'user_id', None)
+    source_ip = request.remote_addr
+
+    # Don't hold a DB connection for the lifetime of the stream
+    db.session.close()
+
+    def generate():
+        parts = []
+        try:
+            if cached_response is not None:
+                parts.append(cached_response)
+                yield sse_event({"token": cached_response})
+            else:
+                # The span includes time spent sending tokens to the client
+                with metrics.span('llm'):
+                    stream = llm.chat.completions.create(
+                        model=LLM_MODEL,
+                        messages=messages,
+                        stream=True,
+                    )
+                    for chunk in stream:
+                        metrics.record_llm_usage(LLM_MODEL, metrics.chunk_usage(chunk))
+                        token = chunk.choices[0].delta.content if chunk.choices else None
+                        if token:
+                            parts.append(token)
+                            yield sse_event({"token": token})
+                remember_answer(org, version, query, ''.join(parts))
+
+            # Save chat history once the full answer is known
+            with metrics.span('db_write'):
+                chat_id = chat_log.record(org_id, query, ''.join(parts), user_id, source_ip, version=version)
+            done = {
+                "chat_id": chat_id,
+                "timestamp": datetime.now().isoformat(),
+                "cached": cached_response is not None
+            }
+            if cache_info:
+                done.update(cache_info)
+            yield sse_event(done, event="done")
+        except Exception as e:
+            db.session.rollback()
+            print(f"Error streaming query: {str(e)}")
+            yield sse_event({"error": str(e)}, event="error")
+
+    # The slot is held until the stream finishes (or the client goes away). It is
+    # acquired last so that nothing can fail between taking and handing it over.
+    slot = None
+    if cached_response is None:
+        slot = rate_limiter.acquire(org_id, owner_tier)
+        if isinstance(slot, rate_limit.Rejection):
+            return rate_limited_response(slot)
+    response = Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+    if slot:
+        response.call_on_close(slot.release)
+    return response
+
+
+
+@api.route('/api/bot/<org_id>', methods=['DELETE'])
 @jwt_required
 def delete_bot(org_id):
     """Delete a chatbot"""
@@ -453,6 +863,11 @@ def delete_bot(org_id):
         # Soft delete
         org.is_deleted = True
         db.session.commit()
+        retrieval.evict(org_id)
+        bot_context.evict(org_id)
+        answer_cache.invalidate(org_id)
+        semantic_cache.invalidate(org_id)
+        widget_config.invalidate(org_id)
         
         return jsonify({'message': 'Bot deleted successfully'})
     except Exception as e:
@@ -460,81 +875,41 @@ def delete_bot(org_id):
         return jsonify({'error': str(e)}), 500
 
 # Widget script endpoint
-@app.route('/widget.js')
-def widget_script():
-    """Serve the embeddable widget JavaScript"""
-    script = '''
-(function() {
-    var botId = document.currentScript.getAttribute('data-bot-id');
-    var theme = document.currentScript.getAttribute('data-theme') || 'dark';
-    var position = document.currentScript.getAttribute('data-position') || 'bottom-right';
-    var color = document.currentScript.getAttribute('data-color') || '#8B5CF6';
-    
-    var container = document.createElement('div');
-    container.id = 'smartbot-widget';
-    container.innerHTML = `
-        <style>
-            #smartbot-widget { font-family: system-ui, -apple-system, sans-serif; }
-            #smartbot-btn { position: fixed; ${position.includes('right') ? 'right: 20px' : 'left: 20px'}; bottom: 20px; width: 60px; height: 60px; border-radius: 50%; background: ${color}; border: none; cursor: pointer; box-shadow: 0 4px 20px rgba(0,0,0,0.3); z-index: 9999; display: flex; align-items: center; justify-content: center; }
-            #smartbot-btn svg { width: 28px; height: 28px; fill: white; }
-            #smartbot-chat { position: fixed; ${position.includes('right') ? 'right: 20px' : 'left: 20px'}; bottom: 90px; width: 380px; height: 500px; background: ${theme === 'dark' ? '#1a1a2e' : '#fff'}; border-radius: 16px; box-shadow: 0 10px 40px rgba(0,0,0,0.3); z-index: 9999; display: none; flex-direction: column; overflow: hidden; }
-            #smartbot-header { background: ${color}; color: white; padding: 16px; font-weight: 600; }
-            #smartbot-messages { flex: 1; overflow-y: auto; padding: 16px; }
-            #smartbot-input { display: flex; padding: 12px; border-top: 1px solid ${theme === 'dark' ? '#333' : '#eee'}; }
-            #smartbot-input input { flex: 1; padding: 10px; border: 1px solid ${theme === 'dark' ? '#444' : '#ddd'}; border-radius: 8px; background: ${theme === 'dark' ? '#2a2a3e' : '#f5f5f5'}; color: ${theme === 'dark' ? '#fff' : '#000'}; }
-            #smartbot-input button { margin-left: 8px; padding: 10px 16px; background: ${color}; color: white; border: none; border-radius: 8px; cursor: pointer; }
-            .smartbot-msg { margin-bottom: 12px; padding: 10px 14px; border-radius: 12px; max-width: 80%; }
-            .smartbot-bot { background: ${theme === 'dark' ? '#2a2a3e' : '#f0f0f0'}; color: ${theme === 'dark' ? '#fff' : '#000'}; }
-            .smartbot-user { background: ${color}; color: white; margin-left: auto; }
-        </style>
-        <button id="smartbot-btn"><svg viewBox="0 0 24 24"><path d="M12 2C6.48 2 2 6.48 2 12c0 1.54.36 2.98.97 4.29L1 23l6.71-1.97C9.02 21.64 10.46 22 12 22c5.52 0 10-4.48 10-10S17.52 2 12 2z"/></svg></button>
-        <div id="smartbot-chat">
-            <div id="smartbot-header">SmartBot Assistant</div>
-            <div id="smartbot-messages"></div>
-            <div id="smartbot-input"><input type="text" placeholder="Type a message..."><button>Send</button></div>
-        </div>
-    `;
-    document.body.appendChild(container);
-    
-    var btn = document.getElementById('smartbot-btn');
-    var chat = document.getElementById('smartbot-chat');
-    var input = chat.querySelector('input');
-    var sendBtn = chat.querySelector('button');
-    var messages = document.getElementById('smartbot-messages');
-    
-    btn.onclick = function() { chat.style.display = chat.style.display === 'none' ? 'flex' : 'none'; };
-    
-    function addMsg(text, isUser) {
-        var div = document.createElement('div');
-        div.className = 'smartbot-msg ' + (isUser ? 'smartbot-user' : 'smartbot-bot');
-        div.textContent = text;
-        messages.appendChild(div);
-        messages.scrollTop = messages.scrollHeight;
-    }
-    
-    function send() {
-        var q = input.value.trim();
-        if (!q) return;
-        addMsg(q, true);
-        input.value = '';
-        fetch(window.location.origin + '/api/query/' + botId, {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ query: q })
-        }).then(r => r.json()).then(d => addMsg(d.response || d.error, false));
-    }
-    
-    sendBtn.onclick = send;
-    input.onkeypress = function(e) { if (e.key === 'Enter') send(); };
-    
-    addMsg('Hello! How can I help you today?', false);
-})();
-'''
-    return script, 200, {'Content-Type': 'application/javascript'}
+@api.route('/widget.js')
+@api.route('/widget.<version>.js')
+def widget_script(version=None):
+    """Serve the embeddable widget JavaScript (precompressed, see widget_asset.py)"""
+    asset = widget_asset.asset
+    encoding = widget_asset.pick_encoding(request.accept_encodings)
+    response = Response(asset.bodies[encoding], mimetype='application/javascript')
+    if encoding != 'identity':
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.set_etag(f"{asset.version}-{encoding}")
+    response.cache_control.public = True
+    if version == asset.version:
+        response.cache_control.max_age = widget_asset.IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
+    else:
+        # Unversioned, or an old version from a stale embed snippet: serve the current script briefly
+        response.cache_control.max_age = widget_asset.WIDGET_MAX_AGE
+    return response.make_conditional(request)
+
+@api.route('/api/widget/<org_id>/config', methods=['GET'])
+def get_widget_config(org_id):
+    """Public bootstrap config for the embedded widget (display name and widget settings)"""
+    cached = widget_config.get(org_id)
+    if cached.body is None:
+        return jsonify({'error': 'Bot not found'}), 404
+    response = Response(cached.body, mimetype='application/json')
+    response.set_etag(cached.etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = widget_config.WIDGET_CONFIG_MAX_AGE
+    return response.make_conditional(request)
 
 # ============ EXPORT/IMPORT CHATBOT ============
 
-@app.route('/api/bot/<org_id>/export', methods=['GET'])
+@api.route('/api/bot/<org_id>/export', methods=['GET'])
 @jwt_required
 def export_bot(org_id):
     """Export a chatbot as .smartbot JSON file"""
@@ -543,6 +918,11 @@ def export_bot(org_id):
         if not org:
             return jsonify({'error': 'Bot not found'}), 404
         
+        bot_data = org.data
+        if org.document_id:
+            # Export files carry the document text inline, as they always have
+            bot_data = {**(bot_data or {}), 'content': documents.load(org.document_id)}
+        
         export_data = {
             'version': '1.0',
             'type': 'smartbot_export',
@@ -551,7 +931,7 @@ def export_bot(org_id):
                 'name': org.name,
                 'description': org.description,
                 'mode': org.mode,
-                'data': org.data,
+                'data': bot_data,
                 'location': org.location,
             }
         }
@@ -562,7 +942,7 @@ def export_bot(org_id):
         print(f"Export error: {str(e)}")
         return jsonify({'error': 'Failed to export bot'}), 500
 
-@app.route('/api/bot/import', methods=['POST'])
+@api.route('/api/bot/import', methods=['POST'])
 @jwt_required
 def import_bot():
     """Import a chatbot from .smartbot JSON file"""
@@ -578,29 +958,37 @@ def import_bot():
             return jsonify({'error': 'Bot name is required'}), 400
         
         # Check bot limit for free tier
-        user = User.query.get(request.user_id)
+        user = auth_cache.get_user(request.user_id)
         if not user:
             return jsonify({'error': 'User not found. Please login again.'}), 401
             
-        if user.tier == 'free':
+        if user['tier'] == 'free':
             bot_count = Organization.query.filter_by(user_id=request.user_id, is_deleted=False).count()
             if bot_count >= 3:
                 return jsonify({'error': 'Free tier limit reached (3 bots). Delete a bot first or upgrade to Pro.'}), 403
         
+        # Document text goes to document storage, not organizations.data
+        org_data = dict(bot_data.get('data') or {})
+        document_id = documents.store(org_data.pop('content') or '') if 'content' in org_data else None
+        
         # Create new organization from imported data
         org = Organization(
             user_id=request.user_id,
             name=bot_data.get('name'),
             description=bot_data.get('description', ''),
             mode=bot_data.get('mode', 'manual'),
-            data=bot_data.get('data', {}),
+            data=org_data,
+            document_id=document_id,
             location=bot_data.get('location', 'Imported')
         )
         
         db.session.add(org)
+        db.session.flush()
+        context = bot_context.compile_context(org)
         db.session.commit()
         
-        # Data is stored in org.data, no index rebuild needed
+        # Chunk and index the imported content for retrieval
+        retrieval.index_organization(org.id, context.text, version=context.version, offload=jobs.offload)
         
         return jsonify({
             'message': 'Bot imported successfully!',
@@ -613,59 +1001,109 @@ def import_bot():
         print(f"Import error: {str(e)}")
         return jsonify({'error': 'Failed to import bot'}), 500
 
-@app.route('/api/bot/<org_id>/chat-history', methods=['GET'])
+@api.route('/api/bot/<org_id>/chat-history', methods=['GET'])
 @jwt_required
 def get_chat_history(org_id):
-    """Get chat history for a bot (with optional format parameter)"""
+    """Get one page of chat history for a bot, newest first.
+
+    Query params: limit (default 50, max 200), cursor (next_cursor from the
+    previous page), since/until (ISO timestamps).
+    """
     try:
         org = Organization.query.filter_by(id=org_id, user_id=request.user_id).first()
         if not org:
             return jsonify({'error': 'Bot not found'}), 404
         
-        # Get all history for this bot (user owns the bot, so can see all its history)
-        history = db.session.query(ChatHistory).filter_by(organization_id=org_id).order_by(ChatHistory.timestamp.desc()).all()
+        try:
+            limit = min(max(int(request.args.get('limit', HISTORY_PAGE_SIZE)), 1), HISTORY_MAX_PAGE_SIZE)
+            since = analytics.parse_timestamp(request.args['since']) if request.args.get('since') else None
+            until = analytics.parse_timestamp(request.args['until']) if request.args.get('until') else None
+            after = decode_history_cursor(request.args['cursor']) if request.args.get('cursor') else None
+        except ValueError:
+            return jsonify({'error': 'Invalid limit, cursor or date', 'code': 'INVALID_PAGE'}), 400
+        
+        # Keyset pagination on (timestamp, id) using ix_chat_history_org_timestamp
+        q = db.session.query(ChatHistory).filter(ChatHistory.organization_id == org_id)
+        if since:
+            q = q.filter(ChatHistory.timestamp >= since)
+        if until:
+            q = q.filter(ChatHistory.timestamp < until)
+        if after:
+            q = q.filter(tuple_(ChatHistory.timestamp, ChatHistory.id) < after)
+        rows = q.order_by(ChatHistory.timestamp.desc(), ChatHistory.id.desc()).limit(limit + 1).all()
+        
+        page = rows[:limit]
+        next_cursor = encode_history_cursor(page[-1]) if len(rows) > limit else None
         
         return jsonify({
             'bot_name': org.name,
-            'total_messages': len(history),
-            'history': [h.to_dict() for h in history]
+            'total_messages': analytics.summary(org_id)['messages'],
+            'history': [h.to_dict() for h in page],
+            'next_cursor': next_cursor
         }), 200
         
     except Exception as e:
         print(f"Chat history error: {str(e)}")
         return jsonify({'error': f'Failed to get chat history: {str(e)}'}), 500
 
-@app.route('/api/bot/<org_id>/chat-history/export', methods=['GET'])
+@api.route('/api/bot/<org_id>/chat-history/export', methods=['GET'])
 @jwt_required
 def export_chat_history(org_id):
-    """Export chat history as JSON"""
+    """Stream chat history as a download.
+
+    Query params: format=json|ndjson|csv (default json), gzip=1, since/until
+    (ISO timestamps). Rows are streamed from the database, never loaded at once.
+    """
     try:
         org = Organization.query.filter_by(id=org_id, user_id=request.user_id).first()
         if not org:
             return jsonify({'error': 'Bot not found'}), 404
         
-        history = db.session.query(ChatHistory).filter_by(organization_id=org_id).order_by(ChatHistory.timestamp).all()
+        fmt = request.args.get('format', 'json')
+        if fmt not in exports.FORMATS:
+            return jsonify({'error': 'format must be json, ndjson or csv', 'code': 'INVALID_FORMAT'}), 400
+        try:
+            since = analytics.parse_timestamp(request.args['since']) if request.args.get('since') else None
+            until = analytics.parse_timestamp(request.args['until']) if request.args.get('until') else None
+        except ValueError:
+            return jsonify({'error': 'Invalid date', 'code': 'INVALID_DATE'}), 400
+        compress = request.args.get('gzip', '').lower() in ('1', 'true', 'yes')
         
-        export_data = {
-            'version': '1.0',
-            'type': 'smartbot_chat_export',
-            'exported_at': datetime.utcnow().isoformat(),
-            'bot_name': org.name,
-            'total_messages': len(history),
-            'conversations': [{
-                'query': h.query,
-                'response': h.response,
-                'timestamp': h.timestamp.isoformat() if h.timestamp else None
-            } for h in history]
+        rows = exports.iter_chats(org_id, since, until)
+        if fmt == 'ndjson':
+            pieces = exports.ndjson_lines(rows)
+        elif fmt == 'csv':
+            pieces = exports.csv_lines(rows)
+        else:
+            pieces = exports.json_document(rows, {
+                'version': '1.0',
+                'type': 'smartbot_chat_export',
+                'exported_at': datetime.utcnow().isoformat(),
+                'bot_name': org.name
+            })
+        body = exports.chunked(pieces)
+        
+        mimetype, ext = exports.FORMATS[fmt]
+        filename = f"{secure_filename(org.name) or 'bot'}_chat_history.{ext}"
+        if compress:
+            body = exports.gzipped(body)
+            mimetype, filename = 'application/gzip', filename + '.gz'
+        
+        headers = {
+            'Content-Disposition': f'attachment; filename="{filename}"',
+            'Access-Control-Expose-Headers': 'Content-Disposition, X-Total-Messages'
         }
+        if not since and not until:
+            # From the rollups, so the client can show it before the body arrives
+            headers['X-Total-Messages'] = str(analytics.summary(org_id)['messages'])
         
-        return jsonify(export_data), 200
+        return Response(stream_with_context(body), mimetype=mimetype, headers=headers)
         
     except Exception as e:
         print(f"Chat export error: {str(e)}")
         return jsonify({'error': 'Failed to export chat history'}), 500
 
-@app.route('/api/bot/<org_id>/chat-history', methods=['DELETE'])
+@api.route('/api/bot/<org_id>/chat-history', methods=['DELETE'])
 @jwt_required
 def clear_chat_history(org_id):
     """Clear all chat history for a bot"""
@@ -674,22 +1112,35 @@ def clear_chat_history(org_id):
         if not org:
             return jsonify({'error': 'Bot not found'}), 404
         
-        # Delete all history for this bot (user owns it)
-        db.session.query(ChatHistory).filter_by(organization_id=org_id).delete()
+        # Delete in batches in the background; chats sent after this request are kept.
+        # Chats from before it still queued in any worker are dropped when flushed.
+        before = datetime.utcnow()
+        org.history_cleared_at = before
+        job = jobs.create_job('clear_chat_history', org_id)
         db.session.commit()
+        jobs.submit(job, retention.clear_history, org_id, before)
         
-        return jsonify({'message': 'Chat history cleared successfully'}), 200
+        return jsonify({'message': 'Chat history is being cleared', 'job_id': job.id}), 202
         
     except Exception as e:
         db.session.rollback()
         print(f"Clear history error: {str(e)}")
         return jsonify({'error': 'Failed to clear chat history'}), 500
 
-@app.route('/api/chat-history/<message_id>', methods=['DELETE'])
+@api.route('/api/chat-history/<message_id>', methods=['DELETE'])
 @jwt_required
 def delete_chat_message(message_id):
     """Delete a single chat message"""
     try:
+        # A chat answered moments ago may still be waiting in the write-behind queue
+        queued = chat_log.pending(message_id)
+        if queued:
+            if not Organization.query.filter_by(id=queued['organization_id'], user_id=request.user_id).first():
+                return jsonify({'error': 'Not authorized'}), 403
+            if chat_log.discard(message_id):
+                return jsonify({'message': 'Message deleted successfully'}), 200
+            # Written in the meantime; delete it from the table below
+
         # Find the message and verify user owns the parent organization
         message = db.session.query(ChatHistory).get(message_id)
         if not message:
@@ -700,6 +1151,8 @@ def delete_chat_message(message_id):
         if not org:
             return jsonify({'error': 'Not authorized'}), 403
         
+        if message.timestamp:
+            analytics.forget_chat(message)
         db.session.delete(message)
         db.session.commit()
         
@@ -710,6 +1163,36 @@ def delete_chat_message(message_id):
         print(f"Delete message error: {str(e)}")
         return jsonify({'error': 'Failed to delete message'}), 500
 
+@api.cli.command('backfill-rollups')
+@click.option('--org', 'org_id', default=None, help='Only rebuild rollups for this bot id')
+def backfill_rollups(org_id):
+    """Rebuild analytics rollups from existing chat history."""
+    counted = analytics.backfill(org_id)
+    print(f"Rolled up {counted} chats")
+
+@api.cli.command('sweep-retention')
+def sweep_retention():
+    """Delete chat history older than each bot's retention period."""
+    results = retention.sweep()
+    print(f"Deleted {sum(results.values())} chats across {len(results)} bots")
+
+@api.cli.command('migrate')
+@click.option('--list', 'list_only', is_flag=True, help='Show applied and pending migrations without running any')
+def migrate_command(list_only):
+    """Apply pending database migrations (run once per deploy)."""
+    if list_only:
+        done = migrations.applied_versions()
+        for version, name, _ in migrations.MIGRATIONS:
+            print(f"{version:>4}  {'applied' if version in done else 'pending':8} {name}")
+        return
+    ran = migrations.migrate()
+    print(f"Applied {len(ran)} migrations" if ran else "Database is up to date")
+
+app = create_app()
+
 if __name__ == '__main__':
+    # Local development: bring the schema up to date, then serve
+    with app.app_context():
+        migrations.migrate()
     port = int(os.getenv("PORT", 5050))
     app.run(debug=True, host='0.0.0.0', port=port)
@@ -1,12 +1,20 @@
 from flask import Blueprint, request, jsonify
-import bcrypt
 from datetime import datetime
 
 from models import db, User, OTPCode
 from middleware import generate_token
+import auth_cache
+import passwords
 
 auth_bp = Blueprint('auth', __name__, url_prefix='/api/auth')
 
+@auth_bp.errorhandler(passwords.HasherBusy)
+def hasher_busy(e):
+    return jsonify({
+        'error': 'Too many sign-in requests right now. Please try again in a moment.',
+        'code': 'AUTH_BUSY'
+    }), 503, {'Retry-After': str(passwords.RETRY_AFTER)}
+
 @auth_bp.route('/register', methods=['POST'])
 def register():
     """Register a new user"""
@@ -27,7 +35,7 @@ def register():
             return jsonify({'error': 'Email already registered'}), 409
         
         # Hash password
-        password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        password_hash = passwords.hash_password(password)
         
         # Create user (OTP will be sent via frontend EmailJS)
         user = User(email=email, password_hash=password_hash, is_verified=False)
@@ -40,6 +48,8 @@ def register():
             'email': email
         }), 201
         
+    except passwords.HasherBusy:
+        raise
     except Exception as e:
         db.session.rollback()
         print(f"Registration error: {str(e)}")
@@ -62,6 +72,7 @@ def verify_otp():
         # Mark user as verified (OTP verification done on frontend)
         user.is_verified = True
         db.session.commit()
+        auth_cache.invalidate_user(user.id)
         
         # Generate token
         token = generate_token(user.id, user.email)
@@ -93,12 +104,21 @@ def login():
             return jsonify({'error': 'Invalid email or password'}), 401
         
         # Check password
-        if not bcrypt.checkpw(password.encode('utf-8'), user.password_hash.encode('utf-8')):
+        if not passwords.check_password(password, user.password_hash):
             return jsonify({'error': 'Invalid email or password'}), 401
         
         if not user.is_verified:
             return jsonify({'error': 'Please verify your email first', 'needs_verification': True}), 403
         
+        # Upgrade hashes made with a different work factor while we have the password
+        if passwords.needs_rehash(user.password_hash):
+            try:
+                user.password_hash = passwords.hash_password(password)
+                db.session.commit()
+                passwords.note_rehash()
+            except passwords.HasherBusy:
+                pass  # the login still succeeds; it is retried next time
+        
         # Generate token
         token = generate_token(user.id, user.email)
         
@@ -108,7 +128,10 @@ def login():
             'user': user.to_dict()
         }), 200
         
+    except passwords.HasherBusy:
+        raise
     except Exception as e:
+        db.session.rollback()
         print(f"Login error: {str(e)}")
         return jsonify({'error': 'Login failed. Please try again.'}), 500
 
@@ -141,11 +164,14 @@ def reset_password():
             return jsonify({'error': 'User not found'}), 404
         
         # Update password (OTP verification done on frontend)
-        user.password_hash = bcrypt.hashpw(new_password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        user.password_hash = passwords.hash_password(new_password)
         db.session.commit()
+        auth_cache.invalidate_user(user.id)
         
         return jsonify({'message': 'Password reset successful! You can now login.'}), 200
         
+    except passwords.HasherBusy:
+        raise
     except Exception as e:
         db.session.rollback()
         print(f"Reset password error: {str(e)}")
@@ -178,15 +204,18 @@ def change_password():
             return jsonify({'error': 'User not found'}), 404
             
         # Verify current password
-        if not bcrypt.checkpw(current_password.encode('utf-8'), user.password_hash.encode('utf-8')):
+        if not passwords.check_password(current_password, user.password_hash):
             return jsonify({'error': 'Incorrect current password'}), 401
             
         # Update to new password
-        user.password_hash = bcrypt.hashpw(new_password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        user.password_hash = passwords.hash_password(new_password)
         db.session.commit()
+        auth_cache.invalidate_user(user.id)
         
         return jsonify({'message': 'Password changed successfully'}), 200
         
+    except passwords.HasherBusy:
+        raise
     except Exception as e:
         db.session.rollback()
         print(f"Change password error: {str(e)}")
@@ -199,9 +228,9 @@ def get_current_user():
     
     @jwt_required
     def inner():
-        user = User.query.get(request.user_id)
+        user = auth_cache.get_user(request.user_id)
         if not user:
             return jsonify({'error': 'User not found'}), 404
-        return jsonify({'user': user.to_dict()}), 200
+        return jsonify({'user': user}), 200
     
     return inner()
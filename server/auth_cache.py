@@ -0,0 +1,111 @@
+"""Per-worker caches for the authenticated request path.
+
+Verified JWT claims are kept for up to TOKEN_CACHE_TTL seconds (never past
+the token's own `exp`), so repeat requests skip the HMAC check. User
+records (email, tier, verification state) are kept for USER_CACHE_TTL
+seconds, so handlers that only need the tier skip a users query.
+
+Call invalidate_user() after changing a user's password, tier or
+verification state. It clears that user's entries in this worker, and the
+short USER_CACHE_TTL bounds how long other workers can serve the old record.
+"""
+from collections import OrderedDict
+import os
+import threading
+import time
+
+from models import User
+
+TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', 4096))
+TOKEN_CACHE_TTL = float(os.getenv('TOKEN_CACHE_TTL', 300))
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', 2048))
+USER_CACHE_TTL = float(os.getenv('USER_CACHE_TTL', 30))
+
+
+class TTLCache:
+    """Thread-safe LRU whose entries expire at a per-entry time."""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry and entry[0] > time.time():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry:
+                del self._data[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, value, expires_at):
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete_where(self, predicate):
+        with self._lock:
+            for key in [k for k, (_, value) in self._data.items() if predicate(k, value)]:
+                del self._data[key]
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total, 4) if total else 0.0,
+            'entries': len(self._data),
+        }
+
+
+_tokens = TTLCache(TOKEN_CACHE_SIZE)  # raw token -> verified claims
+_users = TTLCache(USER_CACHE_SIZE)    # user id -> User.to_dict()
+
+
+def get_claims(token):
+    """Verified claims for a token seen recently, or None."""
+    if TOKEN_CACHE_TTL <= 0:
+        return None
+    return _tokens.get(token)
+
+
+def put_claims(token, payload):
+    if TOKEN_CACHE_TTL <= 0:
+        return
+    expires_at = time.time() + TOKEN_CACHE_TTL
+    if payload.get('exp'):
+        expires_at = min(expires_at, payload['exp'])
+    _tokens.set(token, payload, expires_at)
+
+
+def get_user(user_id):
+    """User.to_dict() for a user id (cached briefly), or None if there is no such user."""
+    if not user_id:
+        return None
+    user = _users.get(user_id) if USER_CACHE_TTL > 0 else None
+    if user is None:
+        record = User.query.get(user_id)
+        if not record:
+            return None
+        user = record.to_dict()
+        if USER_CACHE_TTL > 0:
+            _users.set(user_id, user, time.time() + USER_CACHE_TTL)
+    return user
+
+
+def invalidate_user(user_id):
+    """Forget a user's cached record and verified tokens in this worker."""
+    _users.delete_where(lambda key, _: key == user_id)
+    _tokens.delete_where(lambda _, claims: claims.get('user_id') == user_id)
+
+
+def stats():
+    return {'tokens': _tokens.stats(), 'users': _users.stats()}
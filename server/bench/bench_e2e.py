@@ -0,0 +1,469 @@
+"""End-to-end load test: realistic widget and dashboard traffic against a local stack.
+
+Boots the app under gunicorn against a local database (a throwaway SQLite
+file, or --database-url for a local Postgres you can wipe) and the fake
+Groq server in its own process. It seeds a pro user with a few bots and
+some chat history. Then it drives a weighted mix of requests from
+--concurrency client threads for --duration seconds and reports, per
+endpoint, throughput and p50/p95/p99 latency. Streamed queries also
+report time to first byte. The report also includes the gunicorn worker
+RSS at the start, at the peak and at the end of the run.
+
+    cd server && python bench/bench_e2e.py --mix widget --duration 30 --output widget.json
+    python bench/bench_e2e.py --mix widget --duration 30 --baseline widget.json
+
+--isolate runs each endpoint of the mix on its own, one after another on
+the same server, so worker memory growth can be attributed per endpoint.
+--rate-limit keeps the query rate limits on and spreads the simulated
+visitors over --clients addresses (sent as X-Forwarded-For, trusted as one
+proxy hop like on Render). Rejected requests are counted as rate_limited
+rather than errors.
+
+Results are JSON. --baseline compares against an earlier run and exits 1
+when an endpoint's p95 or throughput regressed by more than --threshold
+percent. `--compare old.json new.json` compares two saved runs without
+running anything.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+
+from load_query import free_port, wait_until_up, percentile  # noqa: E402
+
+JWT_SECRET = 'bench-secret'
+
+# Endpoint weights per traffic mix. A page view with the widget fetches its
+# config and (rarely, thanks to browser caching) the script; a fraction of
+# visitors ask questions. Dashboard users mostly read.
+MIXES = {
+    'widget': {
+        'widget_config': 45, 'widget_js': 5, 'query': 35, 'query_stream': 15,
+    },
+    'dashboard': {
+        'list_bots': 25, 'get_settings': 15, 'chat_history': 25, 'analytics': 20,
+        'update_settings': 5, 'user_me': 5, 'create_bot': 5,
+    },
+}
+# The default: embedded widgets outnumber dashboard users roughly 4:1
+MIXES['mixed'] = dict(
+    {name: weight * 0.8 for name, weight in MIXES['widget'].items()},
+    **{name: weight * 0.2 for name, weight in MIXES['dashboard'].items()},
+)
+
+SEED_SCRIPT = """
+import json, random, sys
+from datetime import datetime, timedelta
+from sqlalchemy import insert
+from app import app
+from models import db, User, Organization, ChatHistory
+from middleware import generate_token
+import analytics, bot_context, migrations
+
+bots, history = int(sys.argv[1]), int(sys.argv[2])
+with app.app_context():
+    migrations.migrate()
+    user = User(email='bench@example.com', password_hash='x', is_verified=True, tier='pro')
+    db.session.add(user); db.session.commit()
+    content = ' '.join(
+        f"Section {i}. We are open 9am to 5pm on weekdays. Delivery takes {i % 5 + 1} days. "
+        f"Returns are accepted within {i % 3 + 14} days with a receipt." for i in range(200))
+    org_ids = []
+    for b in range(bots):
+        org = Organization(user_id=user.id, name=f'Bench {b}', description='Load test bot',
+                           mode='automatic', data={'content': content})
+        db.session.add(org); db.session.flush()
+        bot_context.compile_context(org)
+        org_ids.append(org.id)
+    db.session.commit()
+    now = datetime.utcnow()
+    rows = [{
+        'organization_id': random.choice(org_ids), 'query': f'Seeded question {i}?',
+        'response': 'Seeded answer. ' * 20, 'source_ip': f'10.0.{i % 250}.{i % 7}',
+        'timestamp': now - timedelta(minutes=random.randint(0, 60 * 24 * 30)),
+    } for i in range(history)]
+    for start in range(0, len(rows), 1000):
+        db.session.execute(insert(ChatHistory), rows[start:start + 1000])
+    db.session.commit()
+    analytics.backfill()
+    print(json.dumps({'token': generate_token(user.id, user.email), 'org_ids': org_ids}))
+"""
+
+
+def seed(env, bots, history):
+    out = subprocess.run([sys.executable, '-c', SEED_SCRIPT, str(bots), str(history)],
+                         cwd=SERVER_DIR, env=env, capture_output=True, text=True)
+    if out.returncode != 0:
+        raise RuntimeError(f"seeding failed:\n{out.stderr}")
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def rss_kb(pid):
+    """Resident set size of a process in KiB (Linux /proc; None elsewhere)."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+def worker_pids(master_pid):
+    try:
+        with open(f"/proc/{master_pid}/task/{master_pid}/children") as f:
+            return [int(pid) for pid in f.read().split()]
+    except OSError:
+        return []
+
+
+def workers_rss_mb(master_pid):
+    sizes = [rss_kb(pid) for pid in worker_pids(master_pid)]
+    sizes = [size for size in sizes if size is not None]
+    return round(sum(sizes) / 1024, 1) if sizes else None
+
+
+class MemorySampler:
+    """Samples total worker RSS in the background while a phase runs."""
+
+    def __init__(self, master_pid, interval=0.25):
+        self.master_pid = master_pid
+        self.interval = interval
+        self.start_mb = self.peak_mb = workers_rss_mb(master_pid)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            current = workers_rss_mb(self.master_pid)
+            if current is not None and (self.peak_mb is None or current > self.peak_mb):
+                self.peak_mb = current
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def report(self):
+        end_mb = workers_rss_mb(self.master_pid)
+        return {
+            'workers_rss_start_mb': self.start_mb,
+            'workers_rss_peak_mb': self.peak_mb,
+            'workers_rss_end_mb': end_mb,
+            'workers_rss_growth_mb': round(end_mb - self.start_mb, 1)
+            if end_mb is not None and self.start_mb is not None else None,
+        }
+
+
+class Traffic:
+    """Builds and sends one request of each endpoint kind."""
+
+    def __init__(self, base_url, token, org_ids, questions, clients=0):
+        self.base_url = base_url
+        self.token = token
+        self.org_ids = org_ids
+        self.questions = [f"Question {i}: when do you deliver and what are your hours?"
+                          for i in range(questions)]
+        # Visitor addresses for X-Forwarded-For (none: every request comes from 127.0.0.1)
+        self.client_ips = [f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}" for i in range(clients)]
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _request(self, method, path, body=None, form=None, auth=False, first_line=False):
+        headers = {'Accept-Encoding': 'gzip'}
+        data = None
+        if body is not None:
+            data = json.dumps(body).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        elif form is not None:
+            data = urllib.parse.urlencode(form).encode('utf-8')
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        if auth:
+            headers['Authorization'] = f"Bearer {self.token}"
+        if self.client_ips:
+            headers['X-Forwarded-For'] = random.choice(self.client_ips)
+        req = urllib.request.Request(self.base_url + path, data=data, headers=headers, method=method)
+        start = time.perf_counter()
+        ttfb = None
+        try:
+            with urllib.request.urlopen(req, timeout=300) as resp:
+                if first_line:
+                    resp.readline()
+                    ttfb = time.perf_counter() - start
+                resp.read()
+                status = resp.status
+        except urllib.error.HTTPError as e:
+            status = e.code
+        except OSError:
+            status = 0
+        return status, time.perf_counter() - start, ttfb
+
+    def send(self, kind):
+        org_id = random.choice(self.org_ids)
+        if kind == 'widget_config':
+            return self._request('GET', f"/api/widget/{org_id}/config")
+        if kind == 'widget_js':
+            return self._request('GET', '/widget.js')
+        if kind == 'query':
+            return self._request('POST', f"/api/query/{org_id}", body={'query': random.choice(self.questions)})
+        if kind == 'query_stream':
+            return self._request('POST', f"/api/query/{org_id}/stream",
+                                 body={'query': random.choice(self.questions)}, first_line=True)
+        if kind == 'list_bots':
+            return self._request('GET', '/api/organizations', auth=True)
+        if kind == 'get_settings':
+            return self._request('GET', f"/api/bot/{org_id}/settings", auth=True)
+        if kind == 'update_settings':
+            return self._request('PUT', f"/api/bot/{org_id}/settings", auth=True,
+                                 body={'theme': random.choice(['light', 'dark'])})
+        if kind == 'chat_history':
+            return self._request('GET', f"/api/bot/{org_id}/chat-history?limit=50", auth=True)
+        if kind == 'analytics':
+            return self._request('GET', f"/api/bot/{org_id}/analytics?range=30d", auth=True)
+        if kind == 'user_me':
+            return self._request('GET', '/api/user/me', auth=True)
+        if kind == 'create_bot':
+            with self._lock:
+                self._created += 1
+                n = self._created
+            return self._request('POST', '/api/create-bot', auth=True, form={
+                'mode': 'manual', 'botName': f'Created {n}', 'botDescription': 'Benchmark bot',
+                'orgName': 'Bench Co', 'orgAbout': 'We sell benchmarks.',
+                'products': json.dumps([{'name': 'Widget', 'details': 'A small widget'}]),
+            })
+        raise ValueError(f"Unknown endpoint {kind!r}")
+
+
+def summarize(samples, seconds):
+    """Per-endpoint statistics from (status, latency, ttfb) samples."""
+    latencies = [lat for status, lat, _ in samples if 200 <= status < 300]
+    rate_limited = sum(1 for status, _, _ in samples if status == 429)
+    stats = {
+        'requests': len(samples),
+        'errors': len(samples) - len(latencies) - rate_limited,
+        'rate_limited': rate_limited,
+        'rps': round(len(latencies) / seconds, 2) if seconds else 0.0,
+    }
+    for pct in (50, 95, 99):
+        stats[f'p{pct}_ms'] = round(percentile(latencies, pct) * 1000, 1)
+    stats['max_ms'] = round(max(latencies) * 1000, 1) if latencies else 0.0
+    ttfbs = [ttfb for status, _, ttfb in samples if 200 <= status < 300 and ttfb is not None]
+    if ttfbs:
+        stats['ttfb_p50_ms'] = round(percentile(ttfbs, 50) * 1000, 1)
+        stats['ttfb_p95_ms'] = round(percentile(ttfbs, 95) * 1000, 1)
+    return stats
+
+
+def run_phase(traffic, weights, duration, concurrency, warmup):
+    """Closed-loop load: each client thread sends requests back to back until time is up."""
+    kinds = list(weights)
+    cum_weights = []
+    total = 0
+    for kind in kinds:
+        total += weights[kind]
+        cum_weights.append(total)
+
+    samples = {kind: [] for kind in kinds}
+    measure_from = time.perf_counter() + warmup
+    stop_at = measure_from + duration
+
+    def client(_):
+        while True:
+            kind = random.choices(kinds, cum_weights=cum_weights)[0]
+            sent_at = time.perf_counter()
+            if sent_at >= stop_at:
+                return
+            result = traffic.send(kind)
+            if sent_at >= measure_from:
+                samples[kind].append(result)  # list.append is atomic
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(client, range(concurrency)))
+
+    endpoints = {kind: summarize(samples[kind], duration) for kind in kinds if samples[kind]}
+    everything = [sample for kind in kinds for sample in samples[kind]]
+    return {'total': summarize(everything, duration), 'endpoints': endpoints}
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=SERVER_DIR,
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(baseline, current, threshold):
+    """Print per-endpoint changes; returns the list of regressions beyond threshold percent."""
+    regressions = []
+
+    def change(old, new):
+        return (new - old) / old * 100 if old else 0.0
+
+    for phase, result in current['results'].items():
+        old_phase = baseline['results'].get(phase)
+        if not old_phase:
+            continue
+        print(f"\n{phase}")
+        print(f"  {'endpoint':<16}{'p95 ms':>22}{'rps':>22}")
+        rows = dict(result['endpoints'], total=result['total'])
+        old_rows = dict(old_phase['endpoints'], total=old_phase['total'])
+        for name, stats in rows.items():
+            old = old_rows.get(name)
+            if not old:
+                continue
+            p95 = change(old['p95_ms'], stats['p95_ms'])
+            rps = change(old['rps'], stats['rps'])
+            print(f"  {name:<16}{old['p95_ms']:>9} -> {stats['p95_ms']:<7}{p95:+5.0f}%"
+                  f"{old['rps']:>9} -> {stats['rps']:<7}{rps:+5.0f}%")
+            if p95 > threshold:
+                regressions.append(f"{phase}/{name}: p95 {p95:+.0f}%")
+            if rps < -threshold:
+                regressions.append(f"{phase}/{name}: rps {rps:+.0f}%")
+    if regressions:
+        print("\nRegressions beyond {:.0f}%:\n  ".format(threshold) + "\n  ".join(regressions))
+    return regressions
+
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--mix', choices=sorted(MIXES), default='mixed')
+    parser.add_argument('--isolate', action='store_true', help='run each endpoint of the mix on its own')
+    parser.add_argument('--duration', type=float, default=20, help='measured seconds per phase')
+    parser.add_argument('--warmup', type=float, default=3, help='unmeasured seconds before each phase')
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--latency', default='lognormal:500,0.5', help='fake LLM latency (see fake_groq_server.py)')
+    parser.add_argument('--token-ms', type=float, default=10, help='fake LLM delay between streamed tokens')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--worker-class', default='gevent')
+    parser.add_argument('--database-url', help='local database to use instead of a temporary SQLite file; '
+                                               'it is migrated and seeded, so use a scratch database')
+    parser.add_argument('--bots', type=int, default=5)
+    parser.add_argument('--history', type=int, default=20000, help='chat history rows to seed')
+    parser.add_argument('--questions', type=int, default=200,
+                        help='distinct widget questions; fewer means more answer cache hits')
+    parser.add_argument('--rate-limit', action='store_true',
+                        help='keep rate limits on, with visitors spread over --clients addresses')
+    parser.add_argument('--clients', type=int, default=1000, help='visitor addresses with --rate-limit')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='write the JSON results here')
+    parser.add_argument('--baseline', help='compare with an earlier --output file')
+    parser.add_argument('--threshold', type=float, default=10, help='regression threshold, percent')
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'),
+                        help='compare two result files and exit')
+    args = parser.parse_args()
+
+    if args.compare:
+        regressions = compare(load_results(args.compare[0]), load_results(args.compare[1]), args.threshold)
+        sys.exit(1 if regressions else 0)
+
+    random.seed(args.seed)
+    fake_port = free_port()
+    fake = subprocess.Popen(
+        [sys.executable, os.path.join(BENCH_DIR, 'fake_groq_server.py'), '--port', str(fake_port),
+         '--latency', args.latency, '--token-ms', str(args.token_ms)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    tmpdir = tempfile.mkdtemp(prefix='smartbot-bench-', dir='/dev/shm' if os.path.isdir('/dev/shm') else None)
+    server = None
+    try:
+        wait_until_up(f"http://127.0.0.1:{fake_port}/")
+        env = dict(os.environ)
+        env.update({
+            'DATABASE_URL': args.database_url or f"sqlite:///{os.path.join(tmpdir, 'bench.db')}",
+            'JWT_SECRET': JWT_SECRET,
+            'GROQ_API_KEY': 'fake',
+            'GROQ_BASE_URL': f"http://127.0.0.1:{fake_port}",
+            'LLM_BACKEND': 'groq',
+            # Without --rate-limit every visitor is 127.0.0.1, which per-IP limits would mostly reject
+            'RATE_LIMIT_ENABLED': 'true' if args.rate_limit else 'false',
+            'TRUSTED_PROXY_HOPS': '1',
+            'WEB_CONCURRENCY': str(args.workers),
+            'GUNICORN_WORKER_CLASS': args.worker_class,
+        })
+        seeded = seed(env, args.bots, args.history)
+
+        port = free_port()
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', 'app:app', '-c', 'gunicorn.conf.py', '--bind', f'127.0.0.1:{port}'],
+            cwd=SERVER_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        base_url = f"http://127.0.0.1:{port}"
+        wait_until_up(base_url + '/')
+        traffic = Traffic(base_url, seeded['token'], seeded['org_ids'], args.questions,
+                          clients=args.clients if args.rate_limit else 0)
+
+        weights = MIXES[args.mix]
+        phases = [(kind, {kind: 1}) for kind in weights] if args.isolate else [(args.mix, weights)]
+        results = {}
+        for name, phase_weights in phases:
+            with MemorySampler(server.pid) as memory:
+                result = run_phase(traffic, phase_weights, args.duration, args.concurrency, args.warmup)
+            result['memory'] = memory.report()
+            results[name] = result
+            total = result['total']
+            print(f"{name:>16}: {total['rps']:>8} rps  p50 {total['p50_ms']} ms  p95 {total['p95_ms']} ms  "
+                  f"p99 {total['p99_ms']} ms  errors {total['errors']}  429s {total['rate_limited']}  "
+                  f"rss {result['memory']['workers_rss_peak_mb']} MB")
+            if not args.isolate:
+                for kind, stats in result['endpoints'].items():
+                    print(f"{kind:>16}: {json.dumps(stats)}")
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+        fake.terminate()
+        fake.wait(timeout=10)
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+    config = {key: value for key, value in vars(args).items() if key not in ('output', 'baseline', 'compare')}
+    if args.database_url:
+        config['database_url'] = args.database_url.split('@')[-1]  # drop credentials
+    report = {
+        'meta': {
+            'revision': git_revision(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+        },
+        'config': config,
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+    else:
+        print(json.dumps(report))
+
+    if args.baseline and compare(load_results(args.baseline), report, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""Benchmark serial vs parallel PDF text extraction.
+
+Generates a text-heavy PDF with the requested number of pages and times
+extraction.extract_pdf_text with different worker counts.
+
+    cd server && python bench/bench_pdf_extract.py --pages 500 --workers 1,2,4,8
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+
+import extraction  # noqa: E402
+
+WORDS = ("support warranty battery charger pricing install device screen manual "
+         "safety return policy shipping account billing update firmware").split()
+
+
+def make_pdf(page_count, lines_per_page=60, seed=0):
+    """Build a simple multi-page PDF (Helvetica text lines) as bytes."""
+    rng = random.Random(seed)
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # page tree, filled in below
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    kids = []
+    for _ in range(page_count):
+        lines = [' '.join(rng.choice(WORDS) for _ in range(12)) for _ in range(lines_per_page)]
+        content = ("BT /F1 9 Tf 40 800 Td 12 TL "
+                   + ' '.join(f"({line}) '" for line in lines) + " ET").encode('latin-1')
+        page_num = len(objects) + 1
+        kids.append(f"{page_num} 0 R")
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {page_num + 1} 0 R >>".encode('latin-1')
+        )
+        objects.append(b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {page_count} >>".encode('latin-1')
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for num, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{num} 0 obj\n".encode('latin-1') + body + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode('latin-1')
+    for offset in offsets:
+        out += f"{offset:010d} 00000 n \n".encode('latin-1')
+    out += (f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\n"
+            f"startxref\n{xref}\n%%EOF\n").encode('latin-1')
+    return bytes(out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pages', type=int, default=500)
+    parser.add_argument('--workers', default='1,2,4')
+    parser.add_argument('--shard-pages', type=int, default=extraction.PDF_SHARD_PAGES)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as tmp:
+        tmp.write(make_pdf(args.pages))
+        path = tmp.name
+
+    results = {}
+    try:
+        baseline_text = None
+        for workers in [int(w) for w in args.workers.split(',')]:
+            extraction._reset_pool()
+            if workers > 1:
+                # Warm the pool so process start-up isn't counted
+                extraction.extract_pdf_text(path, workers=workers, shard_pages=args.shard_pages)
+            timings = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                text = extraction.extract_pdf_text(path, workers=workers, shard_pages=args.shard_pages)
+                timings.append(time.perf_counter() - start)
+            baseline_text = baseline_text or text
+            assert text == baseline_text, "parallel output differs from serial output"
+            results[workers] = round(min(timings), 3)
+            speedup = results[min(results)] / results[workers]
+            print(f"workers={workers:>2}  best={results[workers]:.3f}s  speedup={speedup:.2f}x")
+    finally:
+        extraction._reset_pool()
+        os.unlink(path)
+
+    print(json.dumps({'pages': args.pages, 'cpus': os.cpu_count(), 'seconds_by_workers': results}))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""Measure worker boot time: importing the app and serving the first requests.
+
+Each run starts a fresh interpreter against a migrated throwaway SQLite
+database and the fake Groq server. It times `import app`, then the first
+GET / and the first /api/query through the test client. Those two carry
+the DB connect and the lazy LLM client and extraction imports. With
+--gunicorn it also times a real gunicorn master from spawn until it
+answers its first request.
+
+    cd server && python bench/bench_startup.py --runs 5 --gunicorn
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fake_groq_server  # noqa: E402
+from load_query import free_port, seed_database, wait_until_up  # noqa: E402
+
+# Runs in the child interpreter; prints one JSON line of timings in ms
+PROBE = """
+import json, sys, time
+t0 = time.perf_counter()
+import app
+t1 = time.perf_counter()
+client = app.app.test_client()
+assert client.get('/').status_code == 200
+t2 = time.perf_counter()
+r = client.post('/api/query/' + sys.argv[1], json={'query': 'When are you open?'})
+assert r.status_code == 200, r.get_data(as_text=True)
+t3 = time.perf_counter()
+print(json.dumps({
+    'import_ms': (t1 - t0) * 1000,
+    'first_request_ms': (t2 - t1) * 1000,
+    'first_query_ms': (t3 - t2) * 1000,
+    'modules': len(sys.modules),
+}))
+"""
+
+
+def probe(env, org_id):
+    start = time.perf_counter()
+    out = subprocess.run([sys.executable, '-c', PROBE, org_id], cwd=SERVER_DIR, env=env,
+                         capture_output=True, text=True, check=True)
+    timings = json.loads(out.stdout.strip().splitlines()[-1])
+    timings['process_ms'] = (time.perf_counter() - start) * 1000
+    return timings
+
+
+def gunicorn_boot(env):
+    """Milliseconds from spawning gunicorn to its first 200 on /."""
+    port = free_port()
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', 'app:app', '-c', 'gunicorn.conf.py', '--bind', f'127.0.0.1:{port}'],
+        cwd=SERVER_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_until_up(f"http://127.0.0.1:{port}/")
+        return (time.perf_counter() - start) * 1000
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+
+
+def summarize(values):
+    return {
+        'median': round(statistics.median(values), 1),
+        'min': round(min(values), 1),
+        'max': round(max(values), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--gunicorn', action='store_true', help='also time a real gunicorn boot')
+    args = parser.parse_args()
+
+    fake = fake_groq_server.start_in_thread(latency_ms=0)
+    tmpdir = tempfile.mkdtemp(prefix='smartbot-bench-', dir='/dev/shm' if os.path.isdir('/dev/shm') else None)
+    env = dict(os.environ)
+    env.update({
+        'DATABASE_URL': f"sqlite:///{os.path.join(tmpdir, 'bench.db')}",
+        'GROQ_API_KEY': 'fake',
+        'GROQ_BASE_URL': f"http://127.0.0.1:{fake.server_address[1]}",
+        'LLM_BACKEND': 'groq',
+        'ANSWER_CACHE_ENABLED': 'false',
+        'WEB_CONCURRENCY': '1',
+    })
+    org_id = seed_database(env)
+
+    runs = [probe(env, org_id) for _ in range(args.runs)]
+    report = {key: summarize([run[key] for run in runs])
+              for key in ('import_ms', 'first_request_ms', 'first_query_ms', 'process_ms')}
+    report['modules'] = runs[-1]['modules']
+    if args.gunicorn:
+        report['gunicorn_first_response_ms'] = summarize([gunicorn_boot(env) for _ in range(args.runs)])
+
+    for key, value in report.items():
+        print(f"{key:>28}: {json.dumps(value)}")
+
+    fake.shutdown()
+    shutil.rmtree(tmpdir, ignore_errors=True)
+    print(json.dumps({'config': vars(args), 'results': report}))
+
+
+if __name__ == '__main__':
+    main()
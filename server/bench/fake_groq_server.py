@@ -0,0 +1,186 @@
+"""Minimal OpenAI/Groq-compatible chat completions server for load testing.
+
+Point the app at it with GROQ_API_KEY=fake GROQ_BASE_URL=http://127.0.0.1:<port>.
+It answers POST /openai/v1/chat/completions after a configurable delay and
+supports both plain JSON and stream=True (SSE) responses. The delay (time
+to first token) is drawn per request from a distribution:
+
+    500                 fixed 500 ms
+    uniform:200,800     uniform between 200 and 800 ms
+    normal:500,100      mean 500 ms, standard deviation 100 ms
+    lognormal:500,0.6   median 500 ms with a long tail (sigma 0.6), closest to real LLM APIs
+
+    python bench/fake_groq_server.py --port 8099 --latency lognormal:800,0.5 --token-ms 15
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import json
+import math
+import random
+import threading
+import time
+import uuid
+
+
+def parse_latency(spec):
+    """Turn a latency spec (see module docstring) into a function returning milliseconds."""
+    spec = str(spec).strip()
+    kind, _, params = spec.partition(':') if ':' in spec else ('fixed', '', spec)
+    try:
+        args = [float(p) for p in params.split(',')]
+    except ValueError:
+        raise ValueError(f"Invalid latency {spec!r}")
+    if kind == 'fixed' and len(args) == 1:
+        return lambda: args[0]
+    if kind == 'uniform' and len(args) == 2:
+        return lambda: random.uniform(args[0], args[1])
+    if kind == 'normal' and len(args) == 2:
+        return lambda: max(0.0, random.gauss(args[0], args[1]))
+    if kind == 'lognormal' and len(args) == 2:
+        return lambda: random.lognormvariate(math.log(max(args[0], 0.001)), args[1])
+    raise ValueError(f"Invalid latency {spec!r}; expected e.g. 500, uniform:200,800, "
+                     "normal:500,100 or lognormal:500,0.6")
+
+
+class FakeGroqHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    # Set by make_server(); latency() returns the delay for one request in ms
+    latency = staticmethod(lambda: 0.0)
+    token_ms = 0.0
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        # Health check, so harnesses can wait for the server to come up
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'ok')
+
+    def _answer(self, body):
+        messages = body.get('messages') or []
+        question = next((m.get('content', '') for m in reversed(messages) if m.get('role') == 'user'), '')
+        return f"This is a test answer about: {question}"
+
+    def _usage(self, body, answer):
+        prompt_tokens = sum(len(m.get('content', '')) for m in body.get('messages') or []) // 4
+        completion_tokens = len(answer) // 4
+        return {
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'total_tokens': prompt_tokens + completion_tokens,
+        }
+
+    def do_POST(self):
+        if not self.path.endswith('/chat/completions'):
+            self.send_error(404)
+            return
+
+        length = int(self.headers.get('Content-Length', 0))
+        body = json.loads(self.rfile.read(length) or b'{}')
+        answer = self._answer(body)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+
+        time.sleep(self.latency() / 1000)
+
+        if body.get('stream'):
+            self._stream(body, answer, completion_id)
+        else:
+            payload = json.dumps({
+                'id': completion_id,
+                'object': 'chat.completion',
+                'created': int(time.time()),
+                'model': body.get('model', 'fake'),
+                'choices': [{
+                    'index': 0,
+                    'message': {'role': 'assistant', 'content': answer},
+                    'finish_reason': 'stop',
+                    'logprobs': None,
+                }],
+                'usage': self._usage(body, answer),
+            }).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+    def _write_chunk(self, data):
+        self.wfile.write(f"{len(data):X}\r\n".encode('ascii') + data + b"\r\n")
+        self.wfile.flush()
+
+    def _stream(self, body, answer, completion_id):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        words = answer.split(' ')
+        for i, word in enumerate(words):
+            if self.token_ms:
+                time.sleep(self.token_ms / 1000)
+            chunk = {
+                'id': completion_id,
+                'object': 'chat.completion.chunk',
+                'created': int(time.time()),
+                'model': body.get('model', 'fake'),
+                'choices': [{
+                    'index': 0,
+                    'delta': {'content': word if i == 0 else ' ' + word},
+                    'finish_reason': None,
+                }],
+            }
+            self._write_chunk(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+
+        # Like Groq, a final chunk carries the token usage
+        final = {
+            'id': completion_id,
+            'object': 'chat.completion.chunk',
+            'created': int(time.time()),
+            'model': body.get('model', 'fake'),
+            'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}],
+            'x_groq': {'id': completion_id, 'usage': self._usage(body, answer)},
+        }
+        self._write_chunk(f"data: {json.dumps(final)}\n\n".encode('utf-8'))
+        self._write_chunk(b"data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+
+def make_server(host='127.0.0.1', port=0, latency_ms=0.0, token_ms=0.0, latency=None):
+    """Create (but don't start) a fake server; port=0 picks a free port.
+
+    latency is a spec string (see parse_latency) and overrides latency_ms.
+    """
+    handler = type('ConfiguredFakeGroqHandler', (FakeGroqHandler,), {
+        'latency': staticmethod(parse_latency(latency if latency is not None else latency_ms)),
+        'token_ms': token_ms,
+    })
+    ThreadingHTTPServer.request_queue_size = 1024
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def start_in_thread(**kwargs):
+    """Start a fake server on a background thread and return it."""
+    server = make_server(**kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--latency-ms', type=float, default=800)
+    parser.add_argument('--latency', help='latency distribution, e.g. lognormal:800,0.5 (overrides --latency-ms)')
+    parser.add_argument('--token-ms', type=float, default=0, help='delay between streamed tokens')
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, args.latency_ms, args.token_ms, latency=args.latency)
+    print(f"Fake Groq server on http://{args.host}:{server.server_address[1]}")
+    server.serve_forever()
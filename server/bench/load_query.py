@@ -0,0 +1,153 @@
+"""Compare /api/query throughput for sync vs gevent gunicorn workers.
+
+Boots the app under gunicorn against a throwaway SQLite database and the
+fake Groq server, fires concurrent widget queries, and reports throughput
+and latency for each worker class.
+
+    cd server && python bench/load_query.py --requests 200 --concurrency 100 --latency-ms 500
+"""
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fake_groq_server  # noqa: E402
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def seed_database(env):
+    """Create the schema and one bot in a fresh database; returns the org id."""
+    script = (
+        "from app import app\n"
+        "from models import db, User, Organization\n"
+        "import migrations\n"
+        "with app.app_context():\n"
+        "    migrations.migrate()\n"
+        "    user = User(email='bench@example.com', password_hash='x', is_verified=True)\n"
+        "    db.session.add(user); db.session.commit()\n"
+        "    org = Organization(user_id=user.id, name='Bench', description='Load test bot',\n"
+        "                       mode='automatic', data={'content': 'We are open 9am to 5pm.'})\n"
+        "    db.session.add(org); db.session.commit()\n"
+        "    print(org.id)\n"
+    )
+    out = subprocess.run([sys.executable, '-c', script], cwd=SERVER_DIR, env=env,
+                         capture_output=True, text=True, check=True)
+    return out.stdout.strip().splitlines()[-1]
+
+
+def wait_until_up(url, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(url, timeout=1).read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"server at {url} did not start")
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    idx = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+def run_load(base_url, org_id, total, concurrency):
+    def one(i):
+        body = json.dumps({'query': f'question number {i}'}).encode('utf-8')
+        req = urllib.request.Request(f"{base_url}/api/query/{org_id}", data=body,
+                                     headers={'Content-Type': 'application/json'})
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(req, timeout=300) as resp:
+                resp.read()
+                ok = resp.status == 200
+        except OSError:
+            ok = False
+        return ok, time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(total)))
+    elapsed = time.perf_counter() - start
+
+    latencies = [lat for ok, lat in results if ok]
+    return {
+        'requests': total,
+        'errors': sum(1 for ok, _ in results if not ok),
+        'seconds': round(elapsed, 2),
+        'rps': round(len(latencies) / elapsed, 2),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--latency-ms', type=float, default=500)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--worker-classes', default='sync,gevent')
+    args = parser.parse_args()
+
+    fake = fake_groq_server.start_in_thread(latency_ms=args.latency_ms)
+    # SQLite fsyncs on every commit; keep the database on tmpfs where available so
+    # the comparison measures the worker model rather than the disk
+    tmpdir = tempfile.mkdtemp(prefix='smartbot-bench-', dir='/dev/shm' if os.path.isdir('/dev/shm') else None)
+
+    env = dict(os.environ)
+    env.update({
+        'DATABASE_URL': f"sqlite:///{os.path.join(tmpdir, 'bench.db')}",
+        'GROQ_API_KEY': 'fake',
+        'GROQ_BASE_URL': f"http://127.0.0.1:{fake.server_address[1]}",
+        'LLM_BACKEND': 'groq',
+        'ANSWER_CACHE_ENABLED': 'false',
+        'RATE_LIMIT_ENABLED': 'false',
+        'WEB_CONCURRENCY': str(args.workers),
+    })
+    org_id = seed_database(env)
+
+    report = {}
+    for worker_class in args.worker_classes.split(','):
+        port = free_port()
+        proc = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', 'app:app', '-c', 'gunicorn.conf.py',
+             '--bind', f'127.0.0.1:{port}'],
+            cwd=SERVER_DIR, env=dict(env, GUNICORN_WORKER_CLASS=worker_class),
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            base_url = f"http://127.0.0.1:{port}"
+            wait_until_up(base_url + '/')
+            report[worker_class] = run_load(base_url, org_id, args.requests, args.concurrency)
+        finally:
+            proc.terminate()
+            proc.wait(timeout=30)
+        print(f"{worker_class:>8}: {json.dumps(report[worker_class])}")
+
+    fake.shutdown()
+    shutil.rmtree(tmpdir, ignore_errors=True)
+    print(json.dumps({'config': vars(args), 'results': report}))
+
+
+if __name__ == '__main__':
+    main()
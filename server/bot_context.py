@@ -0,0 +1,111 @@
+"""Rendered, versioned bot context.
+
+A bot's context text (the uploaded document, or the manual profile laid
+out as text) is rendered once whenever its data changes. Its hash is
+stored as Organization.context_version. Queries then find the text, and
+the full system prompt for small bots, with one dictionary lookup keyed
+by (org_id, version). The version also keys the retrieval indexes and
+the answer caches.
+"""
+from collections import OrderedDict, namedtuple
+import os
+import threading
+
+import documents
+import retrieval
+
+CONTEXT_CACHE_SIZE = int(os.getenv('CONTEXT_CACHE_SIZE', 256))
+
+SYSTEM_PROMPT = """You are a helpful AI assistant for the organization described below. Answer questions based ONLY on the provided information. If the answer is not in the information, say you don't have that information.
+
+Organization Information:
+{context}"""
+
+# system_prompt is only set when the whole context fits the retrieval budget;
+# larger bots get a prompt built from the chunks selected per query
+CompiledContext = namedtuple('CompiledContext', 'version text system_prompt')
+
+_cache = OrderedDict()  # (org_id, version) -> CompiledContext
+_lock = threading.Lock()
+_hits = 0
+_misses = 0
+
+
+def render_context(org):
+    """Lay out an organization's data as the plain text the LLM answers from."""
+    if org.mode == 'automatic':
+        if org.document_id:
+            return documents.load(org.document_id) or ''
+        # Bots not yet moved to document storage
+        return (org.data or {}).get('content') or ''
+    d = org.data or {}
+    if org.mode != 'manual' or not d:
+        return ''
+
+    lines = [
+        f"Organization Name: {d.get('name', '')}",
+        f"Website: {d.get('website', '')}",
+        f"Industry: {d.get('industry', '')}",
+        f"About: {d.get('about', '')}",
+        "",
+        "Employees:",
+    ]
+    lines += [f"- {emp.get('name', '')}: {emp.get('role', '')}" for emp in d.get('employees', [])]
+    lines += ["", "Products:"]
+    lines += [f"- {prod.get('name', '')}: {prod.get('details', '')}" for prod in d.get('products', [])]
+    lines += ["", "Services:"]
+    lines += [f"- {serv.get('name', '')}: {serv.get('details', '')}" for serv in d.get('services', [])]
+    return "\n".join(lines) + "\n"
+
+
+def _store(org_id, text):
+    version = retrieval.content_version(text)
+    fits = retrieval.estimate_tokens(text) <= retrieval.TOKEN_BUDGET
+    compiled = CompiledContext(version, text, SYSTEM_PROMPT.format(context=text) if fits else None)
+    with _lock:
+        _cache[(org_id, version)] = compiled
+        _cache.move_to_end((org_id, version))
+        while len(_cache) > CONTEXT_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return compiled
+
+
+def compile_context(org):
+    """Render an organization's context and record its version on the row.
+
+    Call whenever org.data or org.document_id changes; the caller commits.
+    """
+    compiled = _store(org.id, render_context(org))
+    org.context_version = compiled.version
+    return compiled
+
+
+def get_context(org):
+    """Return the CompiledContext for an organization, rendering it on a cache miss."""
+    global _hits, _misses
+    if org.context_version:
+        with _lock:
+            compiled = _cache.get((org.id, org.context_version))
+            if compiled:
+                _cache.move_to_end((org.id, org.context_version))
+                _hits += 1
+                return compiled
+    _misses += 1
+    # Rows from before context_version existed get a version computed here
+    return _store(org.id, render_context(org))
+
+
+def evict(org_id):
+    with _lock:
+        for key in [key for key in _cache if key[0] == org_id]:
+            del _cache[key]
+
+
+def stats():
+    total = _hits + _misses
+    return {
+        'hits': _hits,
+        'misses': _misses,
+        'hit_rate': round(_hits / total, 4) if total else 0.0,
+        'entries': len(_cache),
+    }
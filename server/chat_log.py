@@ -0,0 +1,490 @@
+"""Write-behind buffer for chat history.
+
+Answered questions are queued in memory and written by a background
+flusher. Each flush does one multi-row INSERT into chat_history and one
+aggregated message_count increment per bot, instead of an insert, a
+row-locking UPDATE and a commit inside every request. Queued records
+are flushed every CHAT_FLUSH_INTERVAL seconds, as soon as
+CHAT_FLUSH_BATCH are waiting, and when the worker exits.
+
+With CHAT_WAL_DIR set, every record is also appended to a per-process
+log file before the request returns. Files left behind by a crashed
+worker are replayed by the next worker to start (from its flusher
+thread, on its first request). CHAT_WRITE_BEHIND=false writes
+synchronously, as before.
+
+If a batch fails to insert, its rows are retried one at a time, so one
+bad row can't hold up the rest. Rows that fail on their own are
+dead-lettered: appended to CHAT_WAL_DIR/dead-letter.jsonl when a WAL
+directory is set, and logged otherwise. When nothing can be written
+(the database is down, or every row fails) the rows stay queued and
+flushes back off, doubling the wait up to CHAT_FLUSH_MAX_BACKOFF
+seconds. Connectivity errors are retried for as long as they last;
+other errors give up after CHAT_RETRY_TIMEOUT seconds. While backing
+off, a full queue (CHAT_MAX_QUEUE) sheds new chats, counted in
+'shed_records' and logged, instead of flushing in every request.
+
+Before writing, a flush drops queued chats older than their bot's cutoff
+(a history clear, or its retention period, see retention.cutoff), so a
+clear that ran in another worker isn't undone.
+
+Chats deleted while still queued are dropped from the queue, and the WAL
+is rewritten without them so a crash can't bring them back.
+"""
+from collections import Counter
+from datetime import datetime
+import atexit
+import glob
+import json
+import os
+import threading
+import time
+import uuid
+
+from sqlalchemy import bindparam, func, insert, select, update
+from sqlalchemy.exc import InterfaceError, OperationalError
+
+from models import db, ChatHistory, Organization
+import analytics
+
+WRITE_BEHIND = os.getenv('CHAT_WRITE_BEHIND', 'true').lower() in ('1', 'true', 'yes')
+FLUSH_INTERVAL = float(os.getenv('CHAT_FLUSH_INTERVAL', 1.0))
+FLUSH_BATCH = int(os.getenv('CHAT_FLUSH_BATCH', 200))
+MAX_QUEUE = int(os.getenv('CHAT_MAX_QUEUE', 10000))
+MAX_BACKOFF = float(os.getenv('CHAT_FLUSH_MAX_BACKOFF', 60))
+RETRY_TIMEOUT = float(os.getenv('CHAT_RETRY_TIMEOUT', 600))
+WAL_DIR = os.getenv('CHAT_WAL_DIR')
+
+_app = None
+_queue = []
+_lock = threading.Lock()        # guards _queue and the WAL file
+_flush_lock = threading.Lock()  # one flush at a time
+_wake = threading.Event()
+_failing_since = {}  # chat id -> monotonic time of its first failed flush
+_backoff = 0.0
+_backoff_until = 0.0
+_shed_logged = False
+_flusher = None
+_stopped = False
+
+_wal = None
+_wal_token = uuid.uuid4().hex[:8]
+_wal_seq = 0
+_wal_segments = []  # closed WAL files whose records haven't been committed yet
+
+_metrics = {
+    'flushes': 0,
+    'flushed_records': 0,
+    'flush_errors': 0,
+    'last_flush_ms': 0.0,
+    'max_flush_ms': 0.0,
+    'total_flush_ms': 0.0,
+    'replayed_records': 0,
+    'dead_lettered': 0,
+    'shed_records': 0,
+    'expired_records': 0,
+}
+
+
+def init_app(app):
+    global _app
+    _app = app
+    atexit.register(shutdown)
+    if WAL_DIR:
+        # Start the flusher (which replays leftover WAL files) in the worker, not at import
+        app.before_request(_ensure_flusher)
+
+
+def _row(org_id, user_id, query, response, source_ip, version=None):
+    return {
+        'id': str(uuid.uuid4()),
+        'organization_id': org_id,
+        'user_id': user_id,
+        # Postgres text can't hold NUL characters
+        'query': str(query).replace('\x00', ''),
+        'response': str(response).replace('\x00', ''),
+        'source_ip': source_ip,
+        'context_version': version,
+        'timestamp': datetime.utcnow(),
+    }
+
+
+def _write_rows(rows):
+    """Insert chat rows, bump message counts and rollups in the current session; the caller commits."""
+    for start in range(0, len(rows), FLUSH_BATCH):
+        db.session.execute(insert(ChatHistory), rows[start:start + FLUSH_BATCH])
+
+    counts = Counter(row['organization_id'] for row in rows)
+    # Core executemany: one increment per bot, however many chats it had
+    db.session.execute(
+        update(Organization.__table__)
+        .where(Organization.__table__.c.id == bindparam('org_id'))
+        .values(message_count=func.coalesce(Organization.__table__.c.message_count, 0) + bindparam('delta')),
+        [{'org_id': org_id, 'delta': delta} for org_id, delta in counts.items()]
+    )
+    analytics.record_chats(rows)
+
+
+def _drop_expired(rows):
+    """Leave out rows older than their bot's history clear or retention cutoff."""
+    import retention  # imports this module
+    bots = db.session.execute(
+        select(Organization.id, Organization.history_cleared_at, Organization.retention_days)
+        .where(Organization.id.in_({row['organization_id'] for row in rows}))
+    ).all()
+    cutoffs = {org_id: retention.cutoff(cleared_at, days) for org_id, cleared_at, days in bots}
+    kept = []
+    for row in rows:
+        cutoff = cutoffs.get(row['organization_id'])
+        if cutoff is None or row['timestamp'] >= cutoff:
+            kept.append(row)
+        else:
+            _metrics['expired_records'] += 1
+            _failing_since.pop(row['id'], None)
+    return kept
+
+
+def _unreachable(error):
+    """Whether a write failed because of the database rather than the row."""
+    return isinstance(error, (OperationalError, InterfaceError))
+
+
+def _write_batch(rows):
+    """Commit rows in the current app context, falling back to one row at a time.
+
+    Returns (written, failed) where failed is a list of (row, error). If the
+    database is unreachable the fallback is skipped and every row fails.
+    """
+    try:
+        _write_rows(rows)
+        db.session.commit()
+        return rows, []
+    except Exception as e:
+        db.session.rollback()
+        if len(rows) == 1 or _unreachable(e):
+            return [], [(row, e) for row in rows]
+
+    written, failed = [], []
+    for row in rows:
+        try:
+            _write_rows([row])
+            db.session.commit()
+            written.append(row)
+        except Exception as e:
+            db.session.rollback()
+            failed.append((row, e))
+    return written, failed
+
+
+def _dead_letter(failed):
+    """Give up on rows that can't be written."""
+    _metrics['dead_lettered'] += len(failed)
+    for row, error in failed:
+        _failing_since.pop(row['id'], None)
+        print(f"Dropping chat record {row['id']} for bot {row['organization_id']}: {str(error)}")
+    if not WAL_DIR:
+        return
+    try:
+        os.makedirs(WAL_DIR, exist_ok=True)
+        with open(os.path.join(WAL_DIR, 'dead-letter.jsonl'), 'a', encoding='utf-8') as f:
+            for row, error in failed:
+                f.write(json.dumps({**row, 'timestamp': row['timestamp'].isoformat(), 'error': str(error)}, default=str) + "\n")
+    except OSError as e:
+        print(f"Could not write chat dead letters: {str(e)}")
+
+
+def record(org_id, query, response, user_id=None, source_ip=None, version=None):
+    """Queue a chat exchange for writing; returns the new chat id, or None if it was shed."""
+    global _shed_logged
+    row = _row(org_id, user_id, query, response, source_ip, version)
+
+    if not WRITE_BEHIND or _stopped:
+        _write_rows([row])
+        db.session.commit()
+        return row['id']
+
+    with _lock:
+        if len(_queue) >= MAX_QUEUE and _backing_off():
+            # Flushing in the request would only fail again; drop the newest chats instead
+            _metrics['shed_records'] += 1
+            if not _shed_logged:
+                _shed_logged = True
+                print(f"Chat history queue is full ({len(_queue)}) while writes are failing; dropping new chats until they recover")
+            return None
+        if WAL_DIR:
+            _append_wal(row)
+        _queue.append(row)
+        depth = len(_queue)
+
+    _ensure_flusher()
+    if depth >= MAX_QUEUE:
+        # Flushes are falling behind (or failing); push back on the request
+        flush()
+    elif depth >= FLUSH_BATCH:
+        _wake.set()
+    return row['id']
+
+
+def pending(chat_id):
+    """The queued row for a chat that hasn't been written yet, or None."""
+    with _lock:
+        return next((row for row in _queue if row['id'] == chat_id), None)
+
+
+def discard(chat_id):
+    """Drop a queued chat before it is written. Returns False if it isn't queued (any more)."""
+    global _queue
+    with _flush_lock:  # a flush in progress may be writing it
+        with _lock:
+            remaining = [row for row in _queue if row['id'] != chat_id]
+            if len(remaining) == len(_queue):
+                return False
+            _queue = remaining
+            _failing_since.pop(chat_id, None)
+            if WAL_DIR:
+                _rewrite_wal()
+    return True
+
+
+def _backing_off():
+    return time.monotonic() < _backoff_until
+
+
+def flush(force=False):
+    """Write everything queued so far, unless backing off after a failure. Safe to call from any thread."""
+    global _queue, _wal_segments, _backoff, _backoff_until, _shed_logged
+    if _backing_off() and not force:
+        return 0
+    with _flush_lock:
+        with _lock:
+            batch, _queue = _queue, []
+            segments = _wal_segments + ([_rotate_wal()] if _wal else [])
+            _wal_segments = []
+        if not batch:
+            _remove_files(segments)
+            return 0
+
+        start = time.perf_counter()
+        try:
+            with _app.app_context():
+                try:
+                    kept = _drop_expired(batch)
+                    written, failed = _write_batch(kept) if kept else ([], [])
+                finally:
+                    db.session.remove()
+        except Exception as e:
+            written, failed = [], [(row, e) for row in batch]
+
+        retry = []
+        if failed:
+            _metrics['flush_errors'] += 1
+            now = time.monotonic()
+            give_up = []
+            for row, error in failed:
+                since = _failing_since.setdefault(row['id'], now)
+                if _unreachable(error):
+                    retry.append(row)
+                elif written or now - since >= RETRY_TIMEOUT:
+                    # Other rows went in, so this one is the problem (or it has failed for too long)
+                    give_up.append((row, error))
+                else:
+                    retry.append(row)
+            _dead_letter(give_up)
+            if retry:
+                _backoff = min(max(_backoff * 2, FLUSH_INTERVAL), MAX_BACKOFF)
+                _backoff_until = now + _backoff
+                print(f"Chat history flush failed ({len(retry)} records queued, retrying in {_backoff:g}s): {str(failed[0][1])}")
+                with _lock:
+                    _queue = retry + _queue
+                    # Keep the WAL until the retried rows are in (replay skips rows already written)
+                    _wal_segments = segments + _wal_segments
+                segments = []
+        if not retry:
+            _backoff = 0.0
+            if _shed_logged:
+                _shed_logged = False
+                print(f"Chat history writes recovered ({_metrics['shed_records']} chats shed so far)")
+        if not written:
+            _remove_files(segments)
+            return 0
+        if _failing_since:
+            for row in written:
+                _failing_since.pop(row['id'], None)
+
+        batch = written
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        _metrics['flushes'] += 1
+        _metrics['flushed_records'] += len(batch)
+        _metrics['last_flush_ms'] = round(elapsed_ms, 2)
+        _metrics['max_flush_ms'] = round(max(_metrics['max_flush_ms'], elapsed_ms), 2)
+        _metrics['total_flush_ms'] += elapsed_ms
+        _remove_files(segments)
+        return len(batch)
+
+
+def _replay_wal():
+    try:
+        with _app.app_context():
+            replayed = recover()
+            db.session.remove()
+        if replayed:
+            print(f"Replayed {replayed} chat records from the write-behind log")
+    except Exception as e:
+        print(f"Chat log recovery error: {str(e)}")
+
+
+def _flush_loop():
+    if WAL_DIR:
+        _replay_wal()
+    while not _stopped:
+        _wake.wait(FLUSH_INTERVAL)
+        _wake.clear()
+        try:
+            flush()
+        except Exception as e:
+            print(f"Chat history flusher error: {str(e)}")
+
+
+def _ensure_flusher():
+    global _flusher
+    # Started lazily so it only runs in the process that serves requests (after gunicorn forks)
+    if _flusher is None or not _flusher.is_alive():
+        with _lock:
+            if _flusher is None or not _flusher.is_alive():
+                _flusher = threading.Thread(target=_flush_loop, name='chat-log-flusher', daemon=True)
+                _flusher.start()
+
+
+def shutdown():
+    """Stop the flusher and write out anything still queued."""
+    global _stopped
+    if _stopped or _app is None:
+        return
+    _stopped = True
+    _wake.set()
+    flush(force=True)
+
+
+# --- Local write-ahead log -------------------------------------------------
+
+def _wal_path(seq):
+    return os.path.join(WAL_DIR, f"chat-{os.getpid()}-{_wal_token}-{seq}.wal")
+
+
+def _append_wal(row):
+    global _wal
+    if _wal is None:
+        os.makedirs(WAL_DIR, exist_ok=True)
+        _wal = open(_wal_path(_wal_seq), 'a', encoding='utf-8')
+    _wal.write(json.dumps({**row, 'timestamp': row['timestamp'].isoformat()}) + "\n")
+    _wal.flush()
+
+
+def _rotate_wal():
+    """Close the active WAL file and return its path; the next record opens a new one."""
+    global _wal, _wal_seq
+    path = _wal.name
+    _wal.close()
+    _wal = None
+    _wal_seq += 1
+    return path
+
+
+def _rewrite_wal():
+    """Replace the WAL files with one holding just the queued rows (call with both locks held)."""
+    global _wal_segments
+    old = _wal_segments + ([_rotate_wal()] if _wal else [])
+    _wal_segments = []
+    for row in _queue:
+        _append_wal(row)
+    _remove_files(old)
+
+
+def _remove_files(paths):
+    for path in paths:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def recover():
+    """Replay WAL files left by workers that exited without flushing."""
+    if not WAL_DIR or not os.path.isdir(WAL_DIR):
+        return 0
+
+    replayed = 0
+    for path in sorted(glob.glob(os.path.join(WAL_DIR, 'chat-*.wal*'))):
+        # chat-<pid>-<token>-<seq>.wal, or .wal.replay-<pid> once claimed for replay
+        if '.replay-' in path:
+            pid = int(path.rsplit('-', 1)[1])
+        else:
+            pid = int(os.path.basename(path).split('-')[1])
+        if pid == os.getpid() or _pid_alive(pid):
+            continue
+        claimed = f"{path.split('.replay-')[0]}.replay-{os.getpid()}"
+        try:
+            os.rename(path, claimed)  # another worker may be replaying the same file
+        except FileNotFoundError:
+            continue
+
+        with open(claimed, encoding='utf-8') as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+        for row in rows:
+            row['timestamp'] = datetime.fromisoformat(row['timestamp'])
+            row.setdefault('context_version', None)  # written before versions were logged
+
+        # Skip rows that were committed before the worker died
+        existing = set()
+        ids = [row['id'] for row in rows]
+        for start in range(0, len(ids), 500):
+            existing.update(db.session.scalars(
+                select(ChatHistory.id).where(ChatHistory.id.in_(ids[start:start + 500]))
+            ))
+        rows = [row for row in rows if row['id'] not in existing]
+        if rows:
+            rows = _drop_expired(rows)
+        if rows:
+            written, failed = _write_batch(rows)
+            errors = [error for _, error in failed if _unreachable(error)]
+            if errors:
+                # Database unavailable; leave the file for the next worker to try
+                os.rename(claimed, path.split('.replay-')[0])
+                raise errors[0]
+            _dead_letter(failed)
+            rows = written
+        os.unlink(claimed)
+        replayed += len(rows)
+
+    _metrics['replayed_records'] += replayed
+    return replayed
+
+
+def stats():
+    flushes = _metrics['flushes']
+    return {
+        'write_behind': WRITE_BEHIND,
+        'wal': bool(WAL_DIR),
+        'queue_depth': len(_queue),
+        'flushes': flushes,
+        'flushed_records': _metrics['flushed_records'],
+        'flush_errors': _metrics['flush_errors'],
+        'last_flush_ms': _metrics['last_flush_ms'],
+        'avg_flush_ms': round(_metrics['total_flush_ms'] / flushes, 2) if flushes else 0.0,
+        'max_flush_ms': _metrics['max_flush_ms'],
+        'replayed_records': _metrics['replayed_records'],
+        'dead_lettered': _metrics['dead_lettered'],
+        'shed_records': _metrics['shed_records'],
+        'expired_records': _metrics['expired_records'],
+        'backoff_s': round(max(_backoff_until - time.monotonic(), 0.0), 1),
+    }
@@ -0,0 +1,149 @@
+"""Compressed, content-addressed document storage.
+
+Extracted text from uploaded documents lives in the documents table,
+compressed and keyed by the SHA-256 of the text. Organizations reference a
+document by id, so the organizations row stays small and identical
+uploads (re-imports, copies of the same PDF) are stored once. Documents
+are immutable, so decompressed text can sit in a small LRU without ever
+going stale.
+
+Compression is zlib by default. DOCUMENT_COMPRESSION=zstd uses the
+optional `zstandard` package when it is installed. Rows record their own
+codec, so the setting can change at any time.
+"""
+from collections import OrderedDict
+import hashlib
+import os
+import threading
+import zlib
+
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import undefer
+
+from models import db, Document, Organization
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+DOCUMENT_COMPRESSION = os.getenv('DOCUMENT_COMPRESSION', 'zlib').lower()
+DOCUMENT_CACHE_MB = float(os.getenv('DOCUMENT_CACHE_MB', 32))
+
+if DOCUMENT_COMPRESSION == 'zstd' and zstandard is None:
+    print("DOCUMENT_COMPRESSION=zstd but zstandard is not installed; using zlib")
+    DOCUMENT_COMPRESSION = 'zlib'
+elif DOCUMENT_COMPRESSION not in ('zlib', 'zstd'):
+    print(f"Unknown DOCUMENT_COMPRESSION={DOCUMENT_COMPRESSION!r}; using zlib")
+    DOCUMENT_COMPRESSION = 'zlib'
+
+_cache = OrderedDict()  # document id -> text
+_cache_bytes = 0
+_lock = threading.Lock()
+_hits = 0
+_misses = 0
+
+
+def _compress(raw):
+    if DOCUMENT_COMPRESSION == 'zstd':
+        return zstandard.ZstdCompressor(level=10).compress(raw)
+    return zlib.compress(raw, 6)
+
+
+def _decompress(codec, blob):
+    if codec == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("Document is zstd-compressed but zstandard is not installed")
+        return zstandard.ZstdDecompressor().decompress(blob)
+    return zlib.decompress(blob)
+
+
+def _remember(doc_id, text):
+    global _cache_bytes
+    limit = DOCUMENT_CACHE_MB * 1024 * 1024
+    size = len(text)
+    if size > limit:
+        return
+    with _lock:
+        if doc_id in _cache:
+            _cache.move_to_end(doc_id)
+            return
+        _cache[doc_id] = text
+        _cache_bytes += size
+        while _cache_bytes > limit:
+            _, evicted = _cache.popitem(last=False)
+            _cache_bytes -= len(evicted)
+
+
+def store(text):
+    """Save a document's text (once per distinct content) and return its id; the caller commits."""
+    raw = text.encode('utf-8')
+    doc_id = hashlib.sha256(raw).hexdigest()
+    if db.session.get(Document, doc_id) is None:
+        blob = _compress(raw)
+        dialect = postgresql if db.engine.dialect.name == 'postgresql' else sqlite
+        # Another worker may store the same content at the same moment
+        db.session.execute(
+            dialect.insert(Document).on_conflict_do_nothing(),
+            {'id': doc_id, 'compression': DOCUMENT_COMPRESSION, 'size': len(raw),
+             'compressed_size': len(blob), 'content': blob}
+        )
+    _remember(doc_id, text)
+    return doc_id
+
+
+def load(doc_id):
+    """Return a document's text, or None if there is no such document."""
+    global _hits, _misses
+    with _lock:
+        text = _cache.get(doc_id)
+        if text is not None:
+            _cache.move_to_end(doc_id)
+            _hits += 1
+            return text
+    _misses += 1
+
+    row = db.session.query(Document.compression, Document.content).filter_by(id=doc_id).first()
+    if row is None:
+        return None
+    text = _decompress(row.compression, row.content).decode('utf-8')
+    _remember(doc_id, text)
+    return text
+
+
+def migrate_inline_content(batch_size=100):
+    """Move document text stored in Organization.data['content'] into documents.
+
+    Returns the number of bots migrated. Safe to run repeatedly and from
+    several workers at once.
+    """
+    migrated = 0
+    last_id = ''
+    while True:
+        orgs = Organization.query.options(undefer(Organization.data))\
+            .filter(Organization.mode == 'automatic', Organization.document_id.is_(None),
+                    Organization.id > last_id)\
+            .order_by(Organization.id).limit(batch_size).all()
+        if not orgs:
+            return migrated
+        last_id = orgs[-1].id
+        for org in orgs:
+            data = dict(org.data or {})
+            if 'content' not in data:
+                continue  # still being ingested, or ingestion failed
+            org.document_id = store(data.pop('content') or '')
+            org.data = data
+            migrated += 1
+        db.session.commit()
+
+
+def stats():
+    total = _hits + _misses
+    return {
+        'compression': DOCUMENT_COMPRESSION,
+        'hits': _hits,
+        'misses': _misses,
+        'hit_rate': round(_hits / total, 4) if total else 0.0,
+        'entries': len(_cache),
+        'cached_mb': round(_cache_bytes / (1024 * 1024), 2),
+    }
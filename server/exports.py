@@ -0,0 +1,95 @@
+"""Streaming chat history export.
+
+Rows are read with yield_per (a server-side cursor on PostgreSQL) and
+serialized as they arrive. Output is gathered into ~64KB chunks and
+optionally gzipped on the fly, so memory stays flat however many
+messages a bot has.
+"""
+import csv
+import io
+import json
+import zlib
+
+from sqlalchemy import select
+
+from models import db, ChatHistory
+
+BATCH_ROWS = 1000
+CHUNK_BYTES = 64 * 1024
+
+FORMATS = {
+    'json': ('application/json', 'json'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'csv': ('text/csv', 'csv'),
+}
+
+
+def iter_chats(org_id, since=None, until=None):
+    """Yield (query, response, timestamp) for a bot, oldest first."""
+    stmt = select(ChatHistory.query, ChatHistory.response, ChatHistory.timestamp)\
+        .where(ChatHistory.organization_id == org_id)\
+        .order_by(ChatHistory.timestamp, ChatHistory.id)\
+        .execution_options(yield_per=BATCH_ROWS)
+    if since:
+        stmt = stmt.where(ChatHistory.timestamp >= since)
+    if until:
+        stmt = stmt.where(ChatHistory.timestamp < until)
+    yield from db.session.execute(stmt)
+
+
+def _record(query, response, timestamp):
+    return {
+        'query': query,
+        'response': response,
+        'timestamp': timestamp.isoformat() if timestamp else None
+    }
+
+
+def ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(_record(*row)) + "\n"
+
+
+def csv_lines(rows):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(['timestamp', 'query', 'response'])
+    for query, response, timestamp in rows:
+        writer.writerow([timestamp.isoformat() if timestamp else '', query, response])
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+    yield buf.getvalue()
+
+
+def json_document(rows, header):
+    """The original export document, streamed; total_messages is written last."""
+    head = json.dumps(header)
+    yield head[:-1] + ', "conversations": ['
+    count = 0
+    for row in rows:
+        yield ("," if count else "") + json.dumps(_record(*row))
+        count += 1
+    yield f'], "total_messages": {count}}}'
+
+
+def chunked(pieces, size=CHUNK_BYTES):
+    """Join small text pieces into UTF-8 chunks of roughly `size` bytes."""
+    parts, length = [], 0
+    for piece in pieces:
+        parts.append(piece)
+        length += len(piece)
+        if length >= size:
+            yield "".join(parts).encode('utf-8')
+            parts, length = [], 0
+    if parts:
+        yield "".join(parts).encode('utf-8')
+
+
+def gzipped(chunks, level=6):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits 31 = gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
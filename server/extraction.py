@@ -0,0 +1,160 @@
+"""Text extraction for uploaded bot documents.
+
+Large PDFs are split into page-range shards that are extracted in
+parallel on a process pool and merged back in page order. A per-page
+timeout keeps one pathological page from stalling the whole document.
+The timeout uses SIGALRM, which only works on a process's main thread.
+Jobs run on other threads, so whenever the timeout is on, even small PDFs
+and single-worker setups are extracted in a pool process. Waiting on the
+pool has a deadline too, in case a page is stuck where the alarm can't
+interrupt it. In that case the pool is killed and extraction fails.
+"""
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+import math
+import io
+import multiprocessing
+import os
+import signal
+import threading
+import time
+
+SUPPORTED_EXTENSIONS = ('pdf', 'docx', 'doc')
+
+PDF_WORKERS = int(os.getenv('PDF_WORKERS', os.cpu_count() or 1))
+PDF_PARALLEL_MIN_PAGES = int(os.getenv('PDF_PARALLEL_MIN_PAGES', 64))
+PDF_SHARD_PAGES = int(os.getenv('PDF_SHARD_PAGES', 32))
+PDF_PAGE_TIMEOUT = float(os.getenv('PDF_PAGE_TIMEOUT', 10))
+# Allowance on top of the page timeouts for starting a pool process and opening the PDF
+POOL_STARTUP_SLACK = 30
+
+_pool = None
+_pool_lock = threading.Lock()
+_timer_armed = False
+
+
+class PageTimeout(Exception):
+    pass
+
+
+class ExtractionTimeout(Exception):
+    pass
+
+
+def _on_timeout(signum, frame):
+    # Ignore alarms that land after the page already finished
+    if _timer_armed:
+        raise PageTimeout()
+
+
+def _as_file(source):
+    # source is a file path, the raw bytes of the document, or an open binary file
+    if isinstance(source, bytes):
+        return io.BytesIO(source)
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    return source
+
+
+def _open_pdf(source):
+    import pypdf  # imported on first use to keep worker boot fast
+    return pypdf.PdfReader(_as_file(source))
+
+
+def _extract_page(page, timeout):
+    """Extract one page, giving up after `timeout` seconds when signals are usable."""
+    if not timeout or threading.current_thread() is not threading.main_thread():
+        return page.extract_text() or ''
+
+    global _timer_armed
+    previous = signal.signal(signal.SIGALRM, _on_timeout)
+    try:
+        _timer_armed = True
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+        return page.extract_text() or ''
+    except PageTimeout:
+        print(f"PDF page extraction timed out after {timeout}s, skipping page")
+        return ''
+    finally:
+        _timer_armed = False
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def _extract_range(source, start, end, timeout):
+    """Extract pages [start, end) of a PDF; runs inside a pool process."""
+    reader = _open_pdf(source)
+    return [_extract_page(reader.pages[i], timeout) for i in range(start, end)]
+
+
+def _get_pool(workers):
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn gives clean workers that don't inherit gevent/DB state from the web worker
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+
+def _reset_pool(kill=False):
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            if kill:
+                # shutdown() can't stop a process stuck in a page, so end them first
+                for process in list((_pool._processes or {}).values()):
+                    process.terminate()
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def extract_pdf_text(source, workers=None, shard_pages=None, page_timeout=None):
+    """Extract text from a PDF path, bytes or file, in parallel for large documents."""
+    workers = workers or PDF_WORKERS
+    shard_pages = shard_pages or PDF_SHARD_PAGES
+    page_timeout = PDF_PAGE_TIMEOUT if page_timeout is None else page_timeout
+
+    page_count = len(_open_pdf(source).pages)
+    serial = workers <= 1 or page_count < PDF_PARALLEL_MIN_PAGES
+    timeout_usable = not page_timeout or threading.current_thread() is threading.main_thread()
+    if serial and timeout_usable:
+        return "\n\n".join(_extract_range(source, 0, page_count, page_timeout))
+
+    if serial:
+        # One shard, but in a pool process so the page timeout applies
+        shards = [(0, page_count)]
+    else:
+        shards = [(start, min(start + shard_pages, page_count))
+                  for start in range(0, page_count, shard_pages)]
+    if hasattr(source, 'read'):
+        # Pool workers need something picklable; the upload is already size-capped
+        source = _as_file(source).read()
+    deadline = None
+    if page_timeout:
+        # Every process works through its share of the shards one page at a time
+        pages_per_process = math.ceil(len(shards) / max(workers, 1)) * max(end - start for start, end in shards)
+        deadline = time.monotonic() + POOL_STARTUP_SLACK + page_timeout * pages_per_process
+    pool = _get_pool(max(workers, 1))
+    try:
+        futures = [pool.submit(_extract_range, source, start, end, page_timeout)
+                   for start, end in shards]
+        pages = []
+        for future in futures:
+            remaining = None if deadline is None else max(0, deadline - time.monotonic())
+            pages.extend(future.result(timeout=remaining))
+    except FutureTimeout:
+        _reset_pool(kill=True)
+        raise ExtractionTimeout(f"PDF extraction did not finish within {page_timeout}s per page")
+    except BrokenProcessPool:
+        # A worker died (e.g. out of memory); start fresh next time
+        _reset_pool()
+        raise
+    return "\n\n".join(pages)
+
+
+def extract_text(source, file_ext):
+    """Extract plain text from a PDF or Word document (path, bytes or file)."""
+    if file_ext == 'pdf':
+        return extract_pdf_text(source)
+    import docx2txt
+    return docx2txt.process(_as_file(source))
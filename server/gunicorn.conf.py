@@ -0,0 +1,58 @@
+"""Gunicorn settings.
+
+Queries spend almost all their time waiting on the LLM, so the default
+worker class is gevent: each worker process multiplexes hundreds of
+in-flight requests on greenlets instead of one request per sync worker.
+Set GUNICORN_WORKER_CLASS=sync to get the old behaviour back.
+
+Workers write their Prometheus metrics to PROMETHEUS_MULTIPROC_DIR (a
+fresh temporary directory unless set), so /metrics on any worker reports
+the whole instance.
+"""
+import glob
+import os
+import shutil
+import tempfile
+
+# Must be set before any worker imports prometheus_client
+METRICS_DIR_PREFIX = 'smartbot-metrics-'
+if not os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+    os.environ['PROMETHEUS_MULTIPROC_DIR'] = tempfile.mkdtemp(prefix=METRICS_DIR_PREFIX)
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5050')}"
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gevent')
+workers = int(os.getenv('WEB_CONCURRENCY', 2))
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', 500))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 120))
+keepalive = 5
+
+
+def on_starting(server):
+    # Metrics from a previous run of the server would otherwise be summed in
+    for path in glob.glob(os.path.join(os.environ['PROMETHEUS_MULTIPROC_DIR'], '*.db')):
+        os.remove(path)
+
+
+def post_fork(server, worker):
+    if worker_class == 'gevent':
+        # Make psycopg2 yield to other greenlets while waiting on Postgres
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
+
+
+def worker_exit(server, worker):
+    # Write out chat history still queued in this worker's write-behind buffer
+    import chat_log
+    chat_log.shutdown()
+
+
+def child_exit(server, worker):
+    import metrics
+    metrics.mark_process_dead(worker.pid)
+
+
+def on_exit(server):
+    # Remove the directory only if we created it above
+    metrics_dir = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    if os.path.basename(metrics_dir).startswith(METRICS_DIR_PREFIX):
+        shutil.rmtree(metrics_dir, ignore_errors=True)
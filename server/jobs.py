@@ -0,0 +1,148 @@
+"""In-process background job runner.
+
+Slow work (document extraction and indexing) runs on a small worker pool
+instead of inside the HTTP request. Each job has a row in the `jobs`
+table so any gunicorn worker can report its status. Jobs run inside an
+application context with their own database session.
+
+Jobs and their uploads live only in the worker's memory, so a deploy or
+crash mid-job leaves the row pending/running for good. The status
+endpoints call fail_stale(), which fails jobs older than JOB_STALE_AFTER
+seconds and marks their bots failed so the owner can upload again.
+
+Job and ingestion errors are shown to bot owners, so only JobError
+messages are stored; anything else is logged and stored as FAILED_ERROR.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import os
+import threading
+import traceback
+
+from models import db, Job, Organization
+
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', 2))
+JOB_STALE_AFTER = int(os.getenv('JOB_STALE_AFTER', 900))  # seconds
+
+ACTIVE = ('pending', 'running')
+STALE_ERROR = "Processing was interrupted by a server restart. Please upload the document again."
+FAILED_ERROR = "Processing failed. Please try again, or upload a different document."
+
+_app = None
+
+
+class JobError(Exception):
+    """A job failure whose message is written for the bot's owner."""
+
+
+def public_error(e):
+    """The message clients may see for a job that raised e."""
+    return str(e)[:1000] if isinstance(e, JobError) else FAILED_ERROR
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def init_app(app):
+    global _app
+    _app = app
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix='job')
+        return _executor
+
+
+def gevent_patched():
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched('threading')
+
+
+def offload(fn, *args):
+    """Run CPU-bound work without stalling other requests.
+
+    Under gevent workers a long computation would block every greenlet in
+    the process, so it is handed to gevent's native thread pool. Only pure
+    computations (no DB access) should be passed here.
+    """
+    if gevent_patched():
+        import gevent
+        return gevent.get_hub().threadpool.apply(fn, args)
+    return fn(*args)
+
+
+def create_job(kind, organization_id=None):
+    """Add a pending job row to the session; the caller commits."""
+    job = Job(kind=kind, organization_id=organization_id)
+    db.session.add(job)
+    return job
+
+
+def _run(job_id, fn, args):
+    with _app.app_context():
+        job = db.session.get(Job, job_id)
+        job.status = 'running'
+        job.started_at = datetime.utcnow()
+        db.session.commit()
+
+        try:
+            fn(*args)
+            job = db.session.get(Job, job_id)
+            job.status = 'succeeded'
+        except Exception as e:
+            db.session.rollback()
+            print(f"Job {job_id} ({job.kind}) failed: {str(e)}\n{traceback.format_exc()}")
+            job = db.session.get(Job, job_id)
+            job.status = 'failed'
+            job.error = public_error(e)
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+        db.session.remove()
+
+
+def submit(job, fn, *args):
+    """Queue fn(*args) to run in the background for a committed job."""
+    _get_executor().submit(_run, job.id, fn, args)
+
+
+def fail_stale(organization_ids):
+    """Fail abandoned ingestion for these bots; returns how many bots were failed. Commits.
+
+    A job is abandoned once it has been pending or running for longer than
+    JOB_STALE_AFTER. A bot still processing with no live job left (and older
+    than that) is failed too.
+    """
+    if not organization_ids:
+        return 0
+    cutoff = datetime.utcnow() - timedelta(seconds=JOB_STALE_AFTER)
+    stale = Job.query.filter(
+        Job.organization_id.in_(organization_ids),
+        Job.status.in_(ACTIVE),
+        db.func.coalesce(Job.started_at, Job.created_at) < cutoff,
+    ).all()
+    for job in stale:
+        job.status = 'failed'
+        job.error = STALE_ERROR
+        job.finished_at = datetime.utcnow()
+    db.session.flush()
+
+    live = db.session.query(Job.organization_id).filter(
+        Job.organization_id.in_(organization_ids), Job.status.in_(ACTIVE))
+    stuck = Organization.query.filter(
+        Organization.id.in_(organization_ids),
+        Organization.ingestion_status.in_(('pending', 'processing')),
+        Organization.created_at < cutoff,
+        Organization.id.notin_(live),
+    ).all()
+    for org in stuck:
+        org.ingestion_status = 'failed'
+        org.ingestion_error = STALE_ERROR
+    if stale or stuck:
+        db.session.commit()
+        print(f"Failed {len(stale)} abandoned jobs ({len(stuck)} bots)")
+    return len(stuck)
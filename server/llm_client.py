@@ -0,0 +1,94 @@
+"""LLM client setup.
+
+By default this returns a Groq client. Setting LLM_BACKEND=fake swaps in
+FakeLLM, an in-process stand-in with the same chat.completions.create()
+interface (including stream=True), for tests and local benchmarking
+without network access or an API key.
+"""
+from types import SimpleNamespace
+import os
+import threading
+import time
+
+LLM_MODEL = os.getenv('LLM_MODEL', 'llama-3.3-70b-versatile')
+
+
+def create_client():
+    """Return the configured LLM client, or None if none is configured."""
+    backend = os.getenv('LLM_BACKEND', 'groq')
+    if backend == 'fake':
+        return FakeLLM()
+
+    api_key = os.getenv('GROQ_API_KEY')
+    if not api_key:
+        return None
+
+    from groq import Groq
+    return Groq(api_key=api_key)
+
+
+_client = None
+_client_created = False
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """The process-wide LLM client, created on first use (importing the Groq SDK is slow)."""
+    global _client, _client_created
+    if not _client_created:
+        with _client_lock:
+            if not _client_created:
+                _client = create_client()
+                _client_created = True
+    return _client
+
+
+class FakeLLM:
+    """Deterministic stand-in for the Groq client.
+
+    Replies with a short answer derived from the user's message. FAKE_LLM_LATENCY_MS
+    delays the first token and FAKE_LLM_TOKEN_MS delays each streamed token.
+    """
+
+    def __init__(self, latency_ms=None, token_ms=None):
+        self.latency = float(latency_ms if latency_ms is not None else os.getenv('FAKE_LLM_LATENCY_MS', 0)) / 1000
+        self.token_delay = float(token_ms if token_ms is not None else os.getenv('FAKE_LLM_TOKEN_MS', 0)) / 1000
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def _answer(self, messages):
+        question = next((m['content'] for m in reversed(messages) if m['role'] == 'user'), '')
+        return f"This is a test answer about: {question}"
+
+    def _usage(self, messages, answer):
+        prompt_tokens = sum(len(m['content']) for m in messages) // 4
+        completion_tokens = len(answer) // 4
+        return SimpleNamespace(
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            total_tokens=prompt_tokens + completion_tokens,
+        )
+
+    def create(self, model=None, messages=None, stream=False, **kwargs):
+        answer = self._answer(messages or [])
+        if stream:
+            return self._stream(answer, self._usage(messages or [], answer))
+
+        if self.latency:
+            time.sleep(self.latency)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=answer), finish_reason='stop')],
+            usage=self._usage(messages or [], answer),
+        )
+
+    def _stream(self, answer, usage):
+        if self.latency:
+            time.sleep(self.latency)
+        words = answer.split(' ')
+        for i, word in enumerate(words):
+            if self.token_delay:
+                time.sleep(self.token_delay)
+            token = word if i == 0 else ' ' + word
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=token), finish_reason=None)])
+        # Like Groq, the last chunk carries the token usage
+        yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=None), finish_reason='stop')],
+                              x_groq=SimpleNamespace(usage=usage))
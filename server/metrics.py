@@ -0,0 +1,206 @@
+"""Request timing and Prometheus metrics.
+
+Every request gets a timer. Code wraps its expensive steps in
+`with metrics.span('llm'):`, and SQLAlchemy events count the queries the
+request runs and their total time. When the response is closed (after
+the last byte of a stream), the request's latency, phase times and query
+count and time are recorded in Prometheus histograms labelled by Flask
+endpoint. Connection pool gauges and LLM token counters are kept as well.
+
+GET /metrics serves them in the Prometheus text format to scrapers that
+send METRICS_TOKEN (labels and counts reveal bots and their traffic, so
+without a token it is off unless METRICS_PUBLIC=true). Under gunicorn
+the workers share PROMETHEUS_MULTIPROC_DIR (gunicorn.conf.py sets it up),
+so any worker's scrape covers the whole instance. SERVER_TIMING=true
+also adds a Server-Timing header with the phases, for browser devtools.
+For streamed answers it only covers the work done before streaming
+starts. Metrics need the prometheus_client package; spans and
+Server-Timing work without it.
+"""
+from contextlib import contextmanager
+import hmac
+import os
+import time
+
+from flask import g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import Pool
+
+try:
+    import prometheus_client
+    from prometheus_client import multiprocess, CollectorRegistry, Counter, Gauge, Histogram
+except ImportError:
+    prometheus_client = None
+
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true' and prometheus_client is not None
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')  # /metrics requires "Authorization: Bearer <token>"
+METRICS_PUBLIC = os.getenv('METRICS_PUBLIC', 'false').lower() == 'true'  # serve /metrics without a token
+SERVER_TIMING = os.getenv('SERVER_TIMING', 'false').lower() == 'true'
+
+# LLM calls take seconds; everything else should take milliseconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+
+if prometheus_client is not None:
+    REQUEST_LATENCY = Histogram(
+        'http_request_duration_seconds', 'Request latency, until the response is fully sent',
+        ['method', 'endpoint', 'status'], buckets=LATENCY_BUCKETS)
+    PHASE_LATENCY = Histogram(
+        'request_phase_duration_seconds', 'Time spent in named phases of a request',
+        ['endpoint', 'phase'], buckets=LATENCY_BUCKETS)
+    DB_QUERIES = Histogram(
+        'db_queries_per_request', 'SQL statements executed per request',
+        ['endpoint'], buckets=QUERY_COUNT_BUCKETS)
+    DB_TIME = Histogram(
+        'db_time_per_request_seconds', 'Time spent executing SQL per request',
+        ['endpoint'], buckets=LATENCY_BUCKETS)
+    # livesum: the instance-wide value is the sum over live workers
+    POOL_CAPACITY = Gauge(
+        'db_pool_capacity', 'Connections the pools may open (pool size + overflow)',
+        multiprocess_mode='livesum')
+    POOL_OPEN = Gauge(
+        'db_pool_connections_open', 'Database connections currently open',
+        multiprocess_mode='livesum')
+    POOL_IN_USE = Gauge(
+        'db_pool_connections_in_use', 'Database connections currently checked out',
+        multiprocess_mode='livesum')
+    LLM_TOKENS = Counter(
+        'llm_tokens_total', 'LLM tokens used', ['model', 'type'])
+
+
+class RequestTimer:
+    """Timings collected for one request."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.spans = {}  # phase -> seconds, in the order phases first ran
+        self.db_queries = 0
+        self.db_seconds = 0.0
+
+
+def _current():
+    return g.get('_request_timer') if has_app_context() else None
+
+
+@contextmanager
+def span(phase):
+    """Time a phase of the current request (a no-op outside requests)."""
+    timer = _current()
+    if timer is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timer.spans[phase] = timer.spans.get(phase, 0.0) + time.perf_counter() - start
+
+
+def record_llm_usage(model, usage):
+    """Count the tokens reported in an LLM response's `usage`."""
+    if not METRICS_ENABLED or usage is None:
+        return
+    LLM_TOKENS.labels(model, 'prompt').inc(getattr(usage, 'prompt_tokens', 0) or 0)
+    LLM_TOKENS.labels(model, 'completion').inc(getattr(usage, 'completion_tokens', 0) or 0)
+
+
+def chunk_usage(chunk):
+    """Token usage carried by a streamed chunk (Groq sends it on the last one), or None."""
+    x_groq = getattr(chunk, 'x_groq', None)
+    return getattr(x_groq, 'usage', None) or getattr(chunk, 'usage', None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current() is not None:
+        conn.info.setdefault('_query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    timer = _current()
+    starts = conn.info.get('_query_start')
+    if timer is None or not starts:
+        return
+    timer.db_queries += 1
+    timer.db_seconds += time.perf_counter() - starts.pop()
+
+
+def _handle_error(context):
+    # A failed statement never reaches after_cursor_execute; drop its start time
+    if context.connection is None or context.execution_context is None or _current() is None:
+        return  # failed before the statement was sent
+    starts = context.connection.info.get('_query_start')
+    if starts:
+        starts.pop()
+
+
+def _before_request():
+    g._request_timer = RequestTimer()
+
+
+def _after_request(response):
+    timer = _current()
+    if timer is None:
+        return response
+    if SERVER_TIMING:
+        response.headers['Server-Timing'] = server_timing(timer)
+    if METRICS_ENABLED:
+        labels = (request.method, request.endpoint or 'unmatched', str(response.status_code))
+        response.call_on_close(lambda: _observe(timer, *labels))
+    return response
+
+
+def server_timing(timer):
+    parts = [f"{phase};dur={seconds * 1000:.1f}" for phase, seconds in timer.spans.items()]
+    parts.append(f'db;dur={timer.db_seconds * 1000:.1f};desc="{timer.db_queries} queries"')
+    parts.append(f"total;dur={(time.perf_counter() - timer.start) * 1000:.1f}")
+    return ', '.join(parts)
+
+
+def _observe(timer, method, endpoint, status):
+    REQUEST_LATENCY.labels(method, endpoint, status).observe(time.perf_counter() - timer.start)
+    for phase, seconds in timer.spans.items():
+        PHASE_LATENCY.labels(endpoint, phase).observe(seconds)
+    DB_QUERIES.labels(endpoint).observe(timer.db_queries)
+    DB_TIME.labels(endpoint).observe(timer.db_seconds)
+
+
+def init_app(app):
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    # Class-level listeners cover every engine and pool, including ones created later
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(Engine, 'handle_error', _handle_error)
+        if METRICS_ENABLED:
+            event.listen(Pool, 'connect', lambda *args: POOL_OPEN.inc())
+            event.listen(Pool, 'close', lambda *args: POOL_OPEN.dec())
+            event.listen(Pool, 'checkout', lambda *args: POOL_IN_USE.inc())
+            event.listen(Pool, 'checkin', lambda *args: POOL_IN_USE.dec())
+    if METRICS_ENABLED:
+        options = app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {})
+        POOL_CAPACITY.set(options.get('pool_size', 5) + options.get('max_overflow', 10))
+
+
+def authorized(header):
+    """Whether an Authorization header may read /metrics."""
+    if not METRICS_TOKEN:
+        return METRICS_PUBLIC
+    return hmac.compare_digest(header or '', f"Bearer {METRICS_TOKEN}")
+
+
+def exposition():
+    """(body, content type) of the /metrics response, across all workers when multiprocess."""
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = prometheus_client.REGISTRY
+    return prometheus_client.generate_latest(registry), prometheus_client.CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid):
+    """Drop a dead gunicorn worker's live gauges (called from gunicorn's child_exit hook)."""
+    if prometheus_client is not None and os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        multiprocess.mark_process_dead(pid)
@@ -4,6 +4,8 @@ import jwt
 import os
 import datetime
 
+import auth_cache
+
 # Use a consistent JWT secret - hardcoded fallback for development
 JWT_SECRET = os.getenv('JWT_SECRET', 'smartbot-secret-key-2024')
 
@@ -15,9 +17,13 @@ def get_token_from_header():
     return None
 
 def decode_token(token):
-    """Decode and validate JWT token"""
+    """Decode and validate JWT token (recently verified tokens come from cache)"""
+    payload = auth_cache.get_claims(token)
+    if payload:
+        return payload
     try:
         payload = jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
+        auth_cache.put_claims(token, payload)
         return payload
     except jwt.ExpiredSignatureError:
         print("JWT Error: Token has expired")
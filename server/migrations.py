@@ -0,0 +1,136 @@
+"""Versioned schema migrations.
+
+Run once per deploy, before new workers start taking traffic:
+
+    flask --app app migrate            # apply pending migrations
+    flask --app app migrate --list     # show what has and hasn't run
+
+Workers never touch the schema when they boot. Each migration runs once and
+is recorded in schema_migrations. Migration 1 creates any missing tables
+straight from the current models. Later migrations must therefore cope
+with their change already being there (use _add_column, CREATE INDEX IF
+NOT EXISTS, ...). Migrations 1-5 repeat what app startup used to do at
+import time, so they are safe on databases that already have those changes.
+
+To add a migration, write a function and append it to MIGRATIONS with the
+next version number. Never renumber or remove one that has shipped.
+"""
+from sqlalchemy import inspect, text
+from sqlalchemy.orm import undefer
+
+from models import db, Organization, SchemaMigration
+import analytics
+import bot_context
+import documents
+
+# Arbitrary key for the Postgres advisory lock that serializes concurrent `migrate` runs
+LOCK_KEY = 720451
+
+
+def _add_column(table, name, ddl):
+    """ALTER TABLE ... ADD COLUMN unless the column exists (works on SQLite too)."""
+    if name in {col['name'] for col in inspect(db.engine).get_columns(table)}:
+        return
+    db.session.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}"))
+
+
+def create_tables():
+    db.create_all()
+
+
+def organization_columns():
+    for name, ddl in (
+        ('is_deleted', "BOOLEAN DEFAULT FALSE"),
+        ('semantic_cache_threshold', "FLOAT"),
+        ('ingestion_status', "VARCHAR(20) NOT NULL DEFAULT 'ready'"),
+        ('ingestion_error', "TEXT"),
+        ('context_version', "VARCHAR(16)"),
+        ('retention_days', "INTEGER"),
+        ('document_id', "VARCHAR(64) REFERENCES documents(id)"),
+    ):
+        _add_column('organizations', name, ddl)
+
+
+def chat_history_timestamp_index():
+    db.session.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_chat_history_org_timestamp ON chat_history (organization_id, timestamp)"
+    ))
+
+
+def document_storage():
+    # Move document text out of organizations.data into the documents table
+    moved = documents.migrate_inline_content()
+    print(f"  moved {moved} bot documents into document storage")
+
+
+def context_versions():
+    # Render context for bots created before context versions were stored
+    stale = Organization.query.options(undefer(Organization.data))\
+        .filter(Organization.context_version.is_(None)).all()
+    for org in stale:
+        bot_context.compile_context(org)
+    print(f"  compiled context for {len(stale)} bots")
+
+
+def chat_rollups():
+    # Build analytics rollups for chat history written before they existed
+    counted = analytics.backfill()
+    print(f"  counted {counted} chats into rollups")
+
+
+def chat_history_context_version():
+    # Lets the semantic cache warm up only from answers to the current content
+    _add_column('chat_history', 'context_version', "VARCHAR(16)")
+
+
+def history_cleared_at():
+    # Lets every worker's chat flusher drop queued chats from before a clear
+    _add_column('organizations', 'history_cleared_at', "TIMESTAMP")
+
+
+MIGRATIONS = [
+    (1, 'create_tables', create_tables),
+    (2, 'organization_columns', organization_columns),
+    (3, 'chat_history_timestamp_index', chat_history_timestamp_index),
+    (4, 'document_storage', document_storage),
+    (5, 'context_versions', context_versions),
+    (6, 'chat_rollups', chat_rollups),
+    (7, 'chat_history_context_version', chat_history_context_version),
+    (8, 'history_cleared_at', history_cleared_at),
+]
+
+
+def applied_versions():
+    SchemaMigration.__table__.create(db.engine, checkfirst=True)
+    return set(db.session.scalars(db.select(SchemaMigration.version)))
+
+
+def pending():
+    done = applied_versions()
+    return [(version, name, fn) for version, name, fn in MIGRATIONS if version not in done]
+
+
+def migrate():
+    """Apply pending migrations in order; returns the versions applied."""
+    lock = None
+    if db.engine.dialect.name == 'postgresql':
+        # Two deploys racing shouldn't both run a migration
+        lock = db.engine.connect()
+        lock.execute(text("SELECT pg_advisory_lock(:key)"), {'key': LOCK_KEY})
+    try:
+        ran = []
+        for version, name, fn in pending():
+            print(f"Applying migration {version}: {name}")
+            try:
+                fn()
+                db.session.add(SchemaMigration(version=version, name=name))
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+            ran.append(version)
+        return ran
+    finally:
+        if lock is not None:
+            lock.execute(text("SELECT pg_advisory_unlock(:key)"), {'key': LOCK_KEY})
+            lock.close()
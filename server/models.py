@@ -48,31 +48,56 @@ class Organization(db.Model):
     name = db.Column(db.String(255), nullable=False)
     description = db.Column(db.Text)
     mode = db.Column(db.String(20), nullable=False)  # automatic, manual
-    data = db.Column(db.JSON)  # Stores PDF name or manual org data
+    # Stores PDF name or manual org data, only loaded when accessed. The
+    # extracted text of automatic bots lives in documents (see documents.py).
+    data = db.deferred(db.Column(db.JSON))
+    document_id = db.Column(db.String(64), db.ForeignKey('documents.id'), nullable=True)
     message_count = db.Column(db.Integer, default=0)
     location = db.Column(db.String(100), default='Global')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     is_deleted = db.Column(db.Boolean, default=False, nullable=False)
+    semantic_cache_threshold = db.Column(db.Float, nullable=True)  # None = semantic cache off
+    ingestion_status = db.Column(db.String(20), default='ready', nullable=False)  # pending, processing, ready, failed
+    ingestion_error = db.Column(db.Text)
+    context_version = db.Column(db.String(16))  # hash of the rendered context, see bot_context.py
+    retention_days = db.Column(db.Integer, nullable=True)  # None = keep chat history forever
+    history_cleared_at = db.Column(db.DateTime, nullable=True)  # chats before this were cleared
     
     # Relationships
     chat_history = db.relationship('ChatHistory', backref='organization', lazy=True, cascade='all, delete-orphan')
     widget_config = db.relationship('WidgetConfig', backref='organization', uselist=False, cascade='all, delete-orphan')
     
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'user_id': self.user_id,
-            'name': self.name,
-            'description': self.description,
-            'mode': self.mode,
-            'data': self.data,
-            'message_count': self.message_count,
-            'location': self.location,
-            'created_at': self.created_at.isoformat()
-        }
+    FIELDS = ('id', 'user_id', 'name', 'description', 'mode', 'data', 'message_count', 'location',
+              'semantic_cache_threshold', 'ingestion_status', 'ingestion_error', 'context_version',
+              'retention_days', 'document_id', 'created_at')
+    # What the dashboard list shows
+    SUMMARY_FIELDS = ('id', 'name', 'description', 'mode', 'message_count', 'location',
+                      'ingestion_status', 'created_at')
+    
+    def to_dict(self, fields=FIELDS):
+        result = {}
+        for field in fields:
+            value = getattr(self, field)
+            result[field] = value.isoformat() if field == 'created_at' and value else value
+        return result
+
+class Document(db.Model):
+    """Compressed extracted text, addressed by the SHA-256 of its content."""
+    __tablename__ = 'documents'
+    
+    id = db.Column(db.String(64), primary_key=True)  # sha256 hex of the UTF-8 text
+    compression = db.Column(db.String(10), nullable=False)  # zlib, zstd
+    size = db.Column(db.Integer, nullable=False)  # uncompressed bytes
+    compressed_size = db.Column(db.Integer, nullable=False)
+    content = db.deferred(db.Column(db.LargeBinary, nullable=False))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 class ChatHistory(db.Model):
     __tablename__ = 'chat_history'
+    __table_args__ = (
+        # Serves per-bot history pages in timestamp order (keyset pagination)
+        db.Index('ix_chat_history_org_timestamp', 'organization_id', 'timestamp'),
+    )
     
     id = db.Column(db.String(36), primary_key=True, default=generate_uuid)
     organization_id = db.Column(db.String(36), db.ForeignKey('organizations.id'), nullable=False, index=True)
@@ -81,6 +106,7 @@ class ChatHistory(db.Model):
     response = db.Column(db.Text, nullable=False)
     source_ip = db.Column(db.String(45))  # For widget tracking
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    context_version = db.Column(db.String(16))  # bot content the answer was given from
     
     def to_dict(self):
         return {
@@ -110,3 +136,54 @@ class WidgetConfig(db.Model):
             'welcome_message': self.welcome_message,
             'primary_color': self.primary_color
         }
+
+class Job(db.Model):
+    __tablename__ = 'jobs'
+    
+    id = db.Column(db.String(36), primary_key=True, default=generate_uuid)
+    kind = db.Column(db.String(50), nullable=False)  # ingest_document, ...
+    organization_id = db.Column(db.String(36), db.ForeignKey('organizations.id'), nullable=True, index=True)
+    status = db.Column(db.String(20), default='pending', nullable=False)  # pending, running, succeeded, failed
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'organization_id': self.organization_id,
+            'status': self.status,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+class ChatRollup(db.Model):
+    """Chat counts per bot per hour and per day, kept up to date as chats are written."""
+    __tablename__ = 'chat_rollups'
+    
+    organization_id = db.Column(db.String(36), db.ForeignKey('organizations.id'), primary_key=True)
+    period = db.Column(db.String(4), primary_key=True)  # hour, day
+    bucket = db.Column(db.DateTime, primary_key=True)  # UTC start of the hour/day
+    messages = db.Column(db.Integer, default=0, nullable=False)
+    response_chars = db.Column(db.BigInteger, default=0, nullable=False)  # for average response length
+
+class ChatRollupVisitor(db.Model):
+    """Distinct source IPs seen per bot per rollup bucket."""
+    __tablename__ = 'chat_rollup_visitors'
+    
+    organization_id = db.Column(db.String(36), db.ForeignKey('organizations.id'), primary_key=True)
+    period = db.Column(db.String(4), primary_key=True)
+    bucket = db.Column(db.DateTime, primary_key=True)
+    source_ip = db.Column(db.String(45), primary_key=True)
+
+class SchemaMigration(db.Model):
+    """Migrations applied by `flask --app app migrate` (see migrations.py)."""
+    __tablename__ = 'schema_migrations'
+    
+    version = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow)
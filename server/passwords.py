@@ -0,0 +1,142 @@
+"""Password hashing on a small dedicated pool.
+
+A bcrypt hash takes a few hundred milliseconds of CPU. Done on the request
+worker it stalls everything else that worker is serving, including widget
+queries. Hashes and checks run on PASSWORD_HASH_WORKERS threads instead.
+bcrypt releases the GIL, so they run in parallel with request handling.
+Under gevent, a native thread pool is used so the hub keeps running.
+
+At most PASSWORD_HASH_QUEUE calls may wait for a free thread. Beyond that,
+HasherBusy is raised and the auth routes answer 503 with Retry-After,
+rather than letting a login burst pile up. BCRYPT_ROUNDS sets the work
+factor for new hashes. Stored hashes with a different cost are re-hashed
+the next time their user logs in.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import os
+import threading
+import time
+
+import bcrypt
+
+import jobs
+
+BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', 12))
+HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', 2))
+HASH_QUEUE = int(os.getenv('PASSWORD_HASH_QUEUE', 16))
+RETRY_AFTER = 1  # seconds suggested to rejected clients
+
+
+class HasherBusy(Exception):
+    """Raised when the hashing pool and its queue are full."""
+
+
+_pool = None
+_pool_lock = threading.Lock()
+_state_lock = threading.Lock()
+_pending = 0  # running + waiting
+_metrics = {
+    'hashes': 0,
+    'checks': 0,
+    'rejected': 0,
+    'rehashed': 0,
+    'max_pending': 0,
+    'total_ms': 0.0,
+    'max_ms': 0.0,
+    'total_wait_ms': 0.0,
+}
+
+
+def _run(fn, *args):
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            if jobs.gevent_patched():
+                # Real OS threads; gevent-patched threading would just make greenlets
+                from gevent.threadpool import ThreadPool
+                _pool = ThreadPool(HASH_WORKERS)
+            else:
+                _pool = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix='bcrypt')
+    if isinstance(_pool, ThreadPoolExecutor):
+        return _pool.submit(fn, *args).result()
+    return _pool.apply(fn, args)
+
+
+def _admit():
+    global _pending
+    with _state_lock:
+        if _pending >= HASH_WORKERS + HASH_QUEUE:
+            _metrics['rejected'] += 1
+            raise HasherBusy()
+        _pending += 1
+        _metrics['max_pending'] = max(_metrics['max_pending'], _pending)
+
+
+def _release():
+    global _pending
+    with _state_lock:
+        _pending -= 1
+
+
+def _timed(kind, fn, *args):
+    _admit()
+    queued = time.perf_counter()
+    started = []
+
+    def work():
+        started.append(time.perf_counter())
+        return fn(*args)
+
+    try:
+        result = _run(work)
+    finally:
+        _release()
+    done = time.perf_counter()
+    if started:
+        elapsed_ms = (done - started[0]) * 1000
+        with _state_lock:
+            _metrics[kind] += 1
+            _metrics['total_ms'] += elapsed_ms
+            _metrics['max_ms'] = round(max(_metrics['max_ms'], elapsed_ms), 2)
+            _metrics['total_wait_ms'] += (started[0] - queued) * 1000
+    return result
+
+
+def hash_password(password):
+    salt = bcrypt.gensalt(BCRYPT_ROUNDS)
+    return _timed('hashes', bcrypt.hashpw, password.encode('utf-8'), salt).decode('utf-8')
+
+
+def check_password(password, password_hash):
+    return _timed('checks', bcrypt.checkpw, password.encode('utf-8'), password_hash.encode('utf-8'))
+
+
+def needs_rehash(password_hash):
+    """True if a stored hash ($2b$<cost>$...) wasn't made with BCRYPT_ROUNDS."""
+    try:
+        return int(password_hash.split('$')[2]) != BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return True
+
+
+def note_rehash():
+    with _state_lock:
+        _metrics['rehashed'] += 1
+
+
+def stats():
+    calls = _metrics['hashes'] + _metrics['checks']
+    return {
+        'rounds': BCRYPT_ROUNDS,
+        'workers': HASH_WORKERS,
+        'queue_limit': HASH_QUEUE,
+        'pending': _pending,
+        'max_pending': _metrics['max_pending'],
+        'hashes': _metrics['hashes'],
+        'checks': _metrics['checks'],
+        'rejected': _metrics['rejected'],
+        'rehashed': _metrics['rehashed'],
+        'avg_ms': round(_metrics['total_ms'] / calls, 2) if calls else 0.0,
+        'max_ms': _metrics['max_ms'],
+        'avg_wait_ms': round(_metrics['total_wait_ms'] / calls, 2) if calls else 0.0,
+    }
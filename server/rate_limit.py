@@ -0,0 +1,279 @@
+"""Rate limits and per-bot concurrency caps for the public query endpoints.
+
+Every query takes a token from up to three buckets: the client IP, the
+signed-in user (if any) and the bot. Tokens are taken from all of them
+or none, so a request that finds any bucket empty gets a 429 with
+Retry-After without using up the others. Queries that miss the answer caches also
+need one of the bot's in-flight slots while the LLM works. When a bot
+already has as many LLM calls running as its cap allows, the request is
+turned away at once rather than queued.
+
+Bot and user limits depend on the owner's / user's tier. Each limit is
+written "<count>/<second|minute|hour>", e.g. BOT_RATE_LIMIT_PRO=600/minute.
+State lives in each worker by default. RATE_LIMIT_URL=redis://... shares
+it between workers and instances. If Redis is unreachable, requests are
+allowed (fail open).
+"""
+from collections import namedtuple
+import math
+import os
+import threading
+import time
+
+RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+RATE_LIMIT_URL = os.getenv('RATE_LIMIT_URL')
+MAX_BUCKETS = int(os.getenv('RATE_LIMIT_MAX_BUCKETS', 100000))
+
+_PERIODS = {'second': 1, 'minute': 60, 'hour': 3600}
+
+# A token bucket: `capacity` requests at once, refilled at `rate` per second
+Limit = namedtuple('Limit', 'capacity rate')
+# Why a request was turned away: scope is ip, user, bot or concurrency
+Rejection = namedtuple('Rejection', 'scope retry_after')
+
+
+def parse_limit(spec):
+    """'60/minute' -> Limit(60, 1.0); '0' or '' disables the limit."""
+    if not spec or spec.strip() == '0':
+        return None
+    count, _, period = spec.partition('/')
+    seconds = _PERIODS.get(period.strip().rstrip('s') or 'minute')
+    if seconds is None or not count.strip().isdigit():
+        raise ValueError(f"Invalid rate limit {spec!r}; expected e.g. '60/minute'")
+    return Limit(int(count), int(count) / seconds)
+
+
+IP_LIMIT = parse_limit(os.getenv('IP_RATE_LIMIT', '20/minute'))
+TIER_LIMITS = {
+    'free': {
+        'bot': parse_limit(os.getenv('BOT_RATE_LIMIT_FREE', '60/minute')),
+        'user': parse_limit(os.getenv('USER_RATE_LIMIT_FREE', '30/minute')),
+        'concurrency': int(os.getenv('BOT_CONCURRENCY_FREE', 4)),
+    },
+    'pro': {
+        'bot': parse_limit(os.getenv('BOT_RATE_LIMIT_PRO', '600/minute')),
+        'user': parse_limit(os.getenv('USER_RATE_LIMIT_PRO', '120/minute')),
+        'concurrency': int(os.getenv('BOT_CONCURRENCY_PRO', 32)),
+    },
+}
+
+
+def limits_for(tier):
+    return TIER_LIMITS.get(tier or 'free', TIER_LIMITS['free'])
+
+
+class MemoryBackend:
+    """Token buckets and in-flight counters for this process."""
+
+    def __init__(self, max_buckets=MAX_BUCKETS):
+        self.max_buckets = max_buckets
+        self._buckets = {}   # key -> [tokens, updated_at]
+        self._in_flight = {}  # key -> count
+        self._lock = threading.Lock()
+
+    def take(self, buckets):
+        """Take a token from every (key, limit) bucket, or from none if one is empty.
+
+        Returns None on success, or (index of the first empty bucket, seconds
+        until it has a token).
+        """
+        now = time.monotonic()
+        with self._lock:
+            states = []
+            for key, limit in buckets:
+                bucket = self._buckets.get(key)
+                if bucket is None:
+                    if len(self._buckets) >= self.max_buckets:
+                        self._prune(now)
+                    bucket = self._buckets[key] = [limit.capacity, now]
+                bucket[0] = min(limit.capacity, bucket[0] + (now - bucket[1]) * limit.rate)
+                bucket[1] = now
+                states.append(bucket)
+            for i, (bucket, (_, limit)) in enumerate(zip(states, buckets)):
+                if bucket[0] < 1:
+                    return i, (1 - bucket[0]) / limit.rate
+            for bucket in states:
+                bucket[0] -= 1
+            return None
+
+    def _prune(self, now):
+        # Drop buckets idle long enough to have refilled; they'd start full anyway.
+        # 3600s is the slowest refill allowed by parse_limit
+        for key in [k for k, (_, updated) in self._buckets.items() if now - updated > 3600]:
+            del self._buckets[key]
+        if len(self._buckets) >= self.max_buckets:
+            self._buckets.clear()
+
+    def acquire(self, key, cap):
+        with self._lock:
+            count = self._in_flight.get(key, 0)
+            if count >= cap:
+                return False
+            self._in_flight[key] = count + 1
+            return True
+
+    def release(self, key):
+        with self._lock:
+            count = self._in_flight.get(key, 0) - 1
+            if count > 0:
+                self._in_flight[key] = count
+            else:
+                self._in_flight.pop(key, None)
+
+    def in_flight(self):
+        return sum(self._in_flight.values())
+
+
+class RedisBackend:
+    """Buckets and counters shared through Redis (requires the redis package)."""
+
+    # Refill every bucket and take a token from all of them, or none if one is empty.
+    # ARGV is now, then capacity and rate per key. Returns {index of the empty bucket
+    # (0 if tokens were taken), seconds to wait}.
+    TAKE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local tokens = {}
+local empty, wait = 0, 0
+for i, key in ipairs(KEYS) do
+  local capacity, rate = tonumber(ARGV[2 * i]), tonumber(ARGV[2 * i + 1])
+  local bucket = redis.call('HMGET', key, 'tokens', 'ts')
+  local ts = tonumber(bucket[2]) or now
+  tokens[i] = math.min(capacity, (tonumber(bucket[1]) or capacity) + math.max(0, now - ts) * rate)
+  if empty == 0 and tokens[i] < 1 then
+    empty, wait = i, (1 - tokens[i]) / rate
+  end
+end
+for i, key in ipairs(KEYS) do
+  local capacity, rate = tonumber(ARGV[2 * i]), tonumber(ARGV[2 * i + 1])
+  if empty == 0 then tokens[i] = tokens[i] - 1 end
+  redis.call('HSET', key, 'tokens', tostring(tokens[i]), 'ts', tostring(now))
+  redis.call('EXPIRE', key, math.ceil(capacity / rate) + 1)
+end
+return {empty, tostring(wait)}
+"""
+    # Slots of a worker that dies mid-request are reclaimed after this long
+    SLOT_TTL = 300
+
+    def __init__(self, url):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self._take = self.client.register_script(self.TAKE_SCRIPT)
+
+    def take(self, buckets):
+        args = [time.time()]
+        for _, limit in buckets:
+            args += [limit.capacity, limit.rate]
+        empty, wait = self._take(keys=[f"ratelimit:{key}" for key, _ in buckets], args=args)
+        return (int(empty) - 1, float(wait)) if int(empty) else None
+
+    def acquire(self, key, cap):
+        key = f"inflight:{key}"
+        pipe = self.client.pipeline()
+        pipe.incr(key)
+        pipe.expire(key, self.SLOT_TTL)
+        count = pipe.execute()[0]
+        if count > cap:
+            self.client.decr(key)
+            return False
+        return True
+
+    def release(self, key):
+        self.client.decr(f"inflight:{key}")
+
+    def in_flight(self):
+        return None
+
+
+class Slot:
+    """An acquired in-flight slot; release() is safe to call more than once."""
+
+    def __init__(self, limiter, key):
+        self._limiter = limiter
+        self._key = key
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._limiter._release(self._key)
+
+
+class RateLimiter:
+    """Applies the configured limits and keeps counts of what was rejected."""
+
+    def __init__(self, backend, enabled=True):
+        self.backend = backend
+        self.enabled = enabled
+        self.allowed = 0
+        self.rejected = {'ip': 0, 'user': 0, 'bot': 0, 'concurrency': 0}
+        self._lock = threading.Lock()
+
+    def _reject(self, scope, retry_after):
+        with self._lock:
+            self.rejected[scope] += 1
+        return Rejection(scope, max(1, math.ceil(retry_after)))
+
+    def check(self, org_id, owner_tier, source_ip, user_id=None, user_tier=None):
+        """Take a token from each applicable bucket (all or none); returns a Rejection or None."""
+        if not self.enabled:
+            return None
+        buckets = [
+            (scope, f"{scope}:{ident}", limit) for scope, ident, limit in (
+                ('ip', source_ip, IP_LIMIT),
+                ('user', user_id, limits_for(user_tier)['user']),
+                ('bot', org_id, limits_for(owner_tier)['bot']),
+            ) if ident and limit
+        ]
+        if buckets:
+            try:
+                empty = self.backend.take([(key, limit) for _, key, limit in buckets])
+            except Exception as e:
+                print(f"Rate limit error: {str(e)}")
+                empty = None
+            if empty is not None:
+                index, wait = empty
+                return self._reject(buckets[index][0], wait)
+        with self._lock:
+            self.allowed += 1
+        return None
+
+    def acquire(self, org_id, owner_tier):
+        """Claim one of the bot's in-flight slots; returns a Slot, or a Rejection when full."""
+        cap = limits_for(owner_tier)['concurrency']
+        if not self.enabled or cap <= 0:
+            return Slot(self, None)
+        try:
+            if not self.backend.acquire(f"bot:{org_id}", cap):
+                return self._reject('concurrency', 1)
+        except Exception as e:
+            print(f"Concurrency cap error: {str(e)}")
+            return Slot(self, None)
+        return Slot(self, f"bot:{org_id}")
+
+    def _release(self, key):
+        if key is None:
+            return
+        try:
+            self.backend.release(key)
+        except Exception as e:
+            print(f"Concurrency cap release error: {str(e)}")
+
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'backend': type(self.backend).__name__,
+            'allowed': self.allowed,
+            'rejected': dict(self.rejected),
+            'in_flight': self.backend.in_flight(),
+        }
+
+
+def create_limiter():
+    """Build the limiter from environment settings (Redis if RATE_LIMIT_URL is set)."""
+    backend = None
+    if RATE_LIMIT_URL:
+        try:
+            backend = RedisBackend(RATE_LIMIT_URL)
+        except Exception as e:
+            print(f"Warning: shared rate limiter unavailable ({str(e)}), using in-process limits")
+    return RateLimiter(backend or MemoryBackend(), enabled=RATE_LIMIT_ENABLED)
@@ -0,0 +1,137 @@
+"""Chat history deletion in bounded batches, and retention sweeps.
+
+Clearing a bot's history, or expiring old chats, deletes at most
+CHAT_DELETE_BATCH rows per transaction. Locks stay short and other
+writers get in between batches. Bots with retention_days set (or
+everything, with CHAT_RETENTION_DAYS) are swept every
+RETENTION_SWEEP_INTERVAL seconds by a background thread in each worker.
+The sweep can also run from cron with `flask --app app sweep-retention`.
+Each batch takes its chats out of the rollups and the bot's
+message_count in the same transaction, so counts shown in the dashboard
+match the history that is left.
+
+Chats still in a worker's write-behind queue can be older than a clear
+or a retention cutoff. Clearing records Organization.history_cleared_at,
+and every worker's chat_log flush drops queued chats older than it or
+than the bot's retention period, so they don't reappear.
+"""
+from datetime import datetime, timedelta
+import os
+import random
+import threading
+import time
+
+from sqlalchemy import delete, func, select, update
+
+from models import db, ChatHistory, Organization
+import analytics
+import chat_log
+
+DELETE_BATCH = int(os.getenv('CHAT_DELETE_BATCH', 1000))
+DELETE_PAUSE = float(os.getenv('CHAT_DELETE_PAUSE', 0.05))  # seconds between batches
+DEFAULT_RETENTION_DAYS = int(os.getenv('CHAT_RETENTION_DAYS', 0)) or None
+SWEEP_INTERVAL = float(os.getenv('RETENTION_SWEEP_INTERVAL', 3600))  # 0 disables the sweeper
+MAX_RETENTION_DAYS = 3650
+
+_app = None
+_sweeper = None
+_sweeper_lock = threading.Lock()
+
+
+def init_app(app):
+    global _app
+    _app = app
+    if SWEEP_INTERVAL > 0:
+        # Started on the first request so it runs in the worker, not a preloading master
+        app.before_request(_ensure_sweeper)
+
+
+def purge_chats(org_id, before=None):
+    """Delete a bot's chats older than `before` (all of them if None); returns rows deleted."""
+    deleted = 0
+    while True:
+        batch = select(ChatHistory.id).where(ChatHistory.organization_id == org_id)
+        if before is not None:
+            batch = batch.where(ChatHistory.timestamp < before)
+        # RETURNING gives exactly the rows this call deleted, even if another worker is purging too
+        removed = db.session.execute(
+            delete(ChatHistory)
+            .where(ChatHistory.id.in_(batch.limit(DELETE_BATCH)))
+            .returning(ChatHistory.timestamp, ChatHistory.source_ip, func.length(ChatHistory.response))
+            .execution_options(synchronize_session=False)
+        ).all()
+        if removed:
+            analytics.forget_chats((org_id, ts, ip, chars) for ts, ip, chars in removed)
+            db.session.execute(
+                update(Organization)
+                .where(Organization.id == org_id)
+                .values(message_count=func.coalesce(Organization.message_count, 0) - len(removed))
+                .execution_options(synchronize_session=False)
+            )
+        done = len(removed) < DELETE_BATCH
+        if done and (deleted or removed):
+            # Drop the rollup rows (and visitor rows) of buckets that are now empty
+            analytics.clear(org_id, before or datetime.utcnow())
+        db.session.commit()
+        deleted += len(removed)
+        if done:
+            return deleted
+        time.sleep(DELETE_PAUSE)
+
+
+def cutoff(cleared_at, retention_days, now=None):
+    """Oldest chat timestamp a bot keeps, or None if it keeps everything."""
+    days = retention_days or DEFAULT_RETENTION_DAYS
+    expired = (now or datetime.utcnow()) - timedelta(days=days) if days else None
+    return max(filter(None, (cleared_at, expired)), default=None)
+
+
+def clear_history(org_id, before):
+    """Background job: delete a bot's chat history up to `before`."""
+    # Write this worker's queue now; other workers drop pre-clear chats when they flush
+    chat_log.flush()
+    deleted = purge_chats(org_id, before)
+    print(f"Cleared {deleted} chats for bot {org_id}")
+
+
+def sweep(now=None):
+    """Expire chats past each bot's retention period; returns {org_id: rows deleted}."""
+    now = now or datetime.utcnow()
+    query = db.session.query(Organization.id, Organization.retention_days)
+    if DEFAULT_RETENTION_DAYS is None:
+        query = query.filter(Organization.retention_days.isnot(None))
+    bots = query.all()
+    db.session.commit()  # don't hold the read transaction open during the deletes
+
+    results = {}
+    for org_id, days in bots:
+        days = days or DEFAULT_RETENTION_DAYS
+        deleted = purge_chats(org_id, now - timedelta(days=days))
+        if deleted:
+            results[org_id] = deleted
+    return results
+
+
+def _sweep_loop():
+    # Spread workers out so they don't all sweep at the same moment
+    time.sleep(random.uniform(0, min(SWEEP_INTERVAL, 300)))
+    while True:
+        try:
+            with _app.app_context():
+                results = sweep()
+                if results:
+                    print(f"Retention sweep deleted {sum(results.values())} chats across {len(results)} bots")
+                db.session.remove()
+        except Exception as e:
+            print(f"Retention sweep failed: {str(e)}")
+        time.sleep(SWEEP_INTERVAL)
+
+
+def _ensure_sweeper():
+    global _sweeper
+    if _sweeper is not None:
+        return
+    with _sweeper_lock:
+        if _sweeper is None:
+            _sweeper = threading.Thread(target=_sweep_loop, name='retention-sweeper', daemon=True)
+            _sweeper.start()
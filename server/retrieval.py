@@ -0,0 +1,255 @@
+"""Retrieval over organization content.
+
+Bot documents are split into overlapping chunks and indexed with BM25 so a
+query only sends the most relevant passages to the LLM instead of the whole
+document. RETRIEVAL_MODE can switch ranking to dense vectors (see
+vector_index.py) or a hybrid of both. Everything runs in-process; no
+external services are needed.
+"""
+from collections import Counter, OrderedDict
+import hashlib
+import heapq
+import math
+import os
+import re
+import threading
+
+# Retrieval configuration (token counts are estimates, ~4 characters per token)
+CHUNK_TOKENS = int(os.getenv('RETRIEVAL_CHUNK_TOKENS', 250))
+CHUNK_OVERLAP_TOKENS = int(os.getenv('RETRIEVAL_CHUNK_OVERLAP', 40))
+TOP_K = int(os.getenv('RETRIEVAL_TOP_K', 8))
+TOKEN_BUDGET = int(os.getenv('RETRIEVAL_TOKEN_BUDGET', 3000))
+INDEX_CACHE_SIZE = int(os.getenv('RETRIEVAL_INDEX_CACHE_SIZE', 64))
+RETRIEVAL_MODE = os.getenv('RETRIEVAL_MODE', 'bm25')  # bm25, dense, hybrid
+
+CHUNK_SEPARATOR = "\n\n---\n\n"
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+STOPWORDS = frozenset("""
+a about an and are as at be but by can do does for from has have how i if in
+is it its me my of on or our so that the their them there these they this to
+was we what when where which who why will with you your
+""".split())
+
+
+def estimate_tokens(text):
+    """Cheap token estimate used for chunking and prompt budgeting."""
+    return (len(text) + 3) // 4
+
+
+def tokenize(text):
+    """Lowercase word tokens with stopwords removed."""
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+def content_version(text):
+    """Stable hash of the context text, used to detect content changes."""
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:16]
+
+
+def _split_units(text, max_tokens):
+    """Split text into paragraph/sentence units no larger than max_tokens."""
+    units = []
+    for para in re.split(r"\n\s*\n", text):
+        para = para.strip()
+        if not para:
+            continue
+        if estimate_tokens(para) <= max_tokens:
+            units.append(para)
+            continue
+        # Long paragraph: fall back to sentences, then to word windows
+        for sentence in _SENTENCE_RE.split(para):
+            if estimate_tokens(sentence) <= max_tokens:
+                units.append(sentence)
+                continue
+            words = sentence.split()
+            step = max(1, max_tokens * 2 // 3)  # ~4 chars/token, ~6 chars/word
+            for i in range(0, len(words), step):
+                units.append(' '.join(words[i:i + step]))
+    return units
+
+
+def chunk_text(text, max_tokens=CHUNK_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS):
+    """Pack text into chunks of roughly max_tokens with a small overlap."""
+    chunks = []
+    current, current_tokens = [], 0
+    for unit in _split_units(text, max_tokens):
+        unit_tokens = estimate_tokens(unit)
+        if current and current_tokens + unit_tokens > max_tokens:
+            chunks.append('\n\n'.join(current))
+            # Carry trailing units over so context isn't cut mid-thought
+            carried, carried_tokens = [], 0
+            for prev in reversed(current):
+                prev_tokens = estimate_tokens(prev)
+                if carried_tokens + prev_tokens > overlap_tokens:
+                    break
+                carried.insert(0, prev)
+                carried_tokens += prev_tokens
+            current, current_tokens = carried, carried_tokens
+        current.append(unit)
+        current_tokens += unit_tokens
+    if current:
+        chunks.append('\n\n'.join(current))
+    return chunks
+
+
+class BM25Index:
+    """Inverted index over chunks scored with Okapi BM25."""
+
+    def __init__(self, chunks, k1=1.5, b=0.75):
+        self.chunks = chunks
+        self.k1 = k1
+        self.b = b
+        self.postings = {}  # term -> [(chunk_idx, term_freq)]
+        self.doc_len = []
+
+        for idx, chunk in enumerate(chunks):
+            counts = Counter(tokenize(chunk))
+            self.doc_len.append(sum(counts.values()))
+            for term, tf in counts.items():
+                self.postings.setdefault(term, []).append((idx, tf))
+
+        n = len(chunks)
+        self.avgdl = (sum(self.doc_len) / n) if n else 0.0
+        self.idf = {
+            term: math.log(1 + (n - len(plist) + 0.5) / (len(plist) + 0.5))
+            for term, plist in self.postings.items()
+        }
+
+    def search(self, query, k=TOP_K):
+        """Return up to k (chunk_idx, score) pairs, best first."""
+        scores = {}
+        avgdl = self.avgdl or 1.0
+        for term in set(tokenize(query)):
+            plist = self.postings.get(term)
+            if not plist:
+                continue
+            idf = self.idf[term]
+            for idx, tf in plist:
+                norm = self.k1 * (1 - self.b + self.b * self.doc_len[idx] / avgdl)
+                scores[idx] = scores.get(idx, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+
+# Per-organization index cache: org_id -> (content_version, BM25Index)
+_index_cache = OrderedDict()
+_index_lock = threading.Lock()
+
+
+def _get_entry(org_id, context_text, version=None):
+    """Return (content_version, BM25Index), rebuilding the index if content changed.
+
+    Pass the precomputed version (see bot_context) to skip hashing the text.
+    """
+    version = version or content_version(context_text)
+    with _index_lock:
+        entry = _index_cache.get(org_id)
+        if entry and entry[0] == version:
+            _index_cache.move_to_end(org_id)
+            return entry
+
+    return _cache_entry(org_id, (version, _build_index(context_text)))
+
+
+def _build_index(context_text):
+    return BM25Index(chunk_text(context_text))
+
+
+def _cache_entry(org_id, entry):
+    with _index_lock:
+        _index_cache[org_id] = entry
+        _index_cache.move_to_end(org_id)
+        while len(_index_cache) > INDEX_CACHE_SIZE:
+            _index_cache.popitem(last=False)
+    return entry
+
+
+def _call(fn, *args):
+    return fn(*args)
+
+
+def get_index(org_id, context_text, version=None):
+    """Return the BM25 index for an organization."""
+    return _get_entry(org_id, context_text, version)[1]
+
+
+def index_organization(org_id, context_text, mode=None, version=None, offload=None):
+    """Build indexes at ingestion time so the first query doesn't pay for them.
+
+    offload(fn, *args) runs the chunking and embedding (pass jobs.offload to
+    keep them off the gevent hub); the caches are updated in the calling thread.
+    """
+    mode = mode or RETRIEVAL_MODE
+    run = offload or _call
+    if not context_text or estimate_tokens(context_text) <= TOKEN_BUDGET:
+        return
+    version = version or content_version(context_text)
+    version, index = _cache_entry(org_id, (version, run(_build_index, context_text)))
+    if mode in ('dense', 'hybrid'):
+        import vector_index  # numpy is only needed for the dense modes
+        vector_index.build(org_id, version, index.chunks, offload=run)
+
+
+def evict(org_id):
+    """Drop cached indexes (e.g. when a bot is deleted)."""
+    with _index_lock:
+        _index_cache.pop(org_id, None)
+    if RETRIEVAL_MODE in ('dense', 'hybrid'):
+        import vector_index
+        vector_index.evict(org_id)
+
+
+def pack_chunks(chunks, ranked, token_budget=TOKEN_BUDGET):
+    """Fit ranked chunk indexes into the budget, returned in document order."""
+    selected, used = [], 0
+    for idx in ranked:
+        cost = estimate_tokens(chunks[idx])
+        if used + cost > token_budget:
+            continue
+        selected.append(idx)
+        used += cost
+    return CHUNK_SEPARATOR.join(chunks[idx] for idx in sorted(selected))
+
+
+def _fuse(*rankings, k=60):
+    """Reciprocal rank fusion of several ranked lists of chunk indexes."""
+    scores = {}
+    for ranking in rankings:
+        for rank, idx in enumerate(ranking):
+            scores[idx] = scores.get(idx, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+def rank_chunks(org_id, context_text, query, top_k=TOP_K, mode=None, version=None):
+    """Return (chunks, ranked chunk indexes) for a query using the given mode."""
+    mode = mode or RETRIEVAL_MODE
+    version, index = _get_entry(org_id, context_text, version)
+
+    lexical = dense = []
+    if mode in ('bm25', 'hybrid'):
+        lexical = [idx for idx, _ in index.search(query, top_k)]
+    if mode in ('dense', 'hybrid'):
+        import vector_index
+        dense = [idx for idx, _ in vector_index.search(org_id, version, index.chunks, query, top_k)]
+
+    if mode == 'hybrid':
+        return index.chunks, _fuse(lexical, dense)[:top_k]
+    return index.chunks, (dense if mode == 'dense' else lexical)
+
+
+def select_context(org_id, context_text, query, top_k=TOP_K, token_budget=TOKEN_BUDGET, mode=None,
+                   version=None):
+    """Pick the parts of an organization's context that are relevant to a query.
+
+    Small contexts that already fit in the token budget are returned as-is.
+    """
+    if not context_text or estimate_tokens(context_text) <= token_budget:
+        return context_text
+
+    chunks, ranked = rank_chunks(org_id, context_text, query, top_k, mode, version)
+    if not ranked:
+        # Nothing matched lexically; the start of a document is usually the overview
+        ranked = list(range(min(top_k, len(chunks))))
+    return pack_chunks(chunks, ranked, token_budget)
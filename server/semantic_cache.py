@@ -0,0 +1,132 @@
+"""Semantic near-duplicate answer cache.
+
+Catches rephrasings of questions a bot has already answered ("pricing?" vs
+"what is the price"). Each query is embedded on the CPU with hashed word and
+character-trigram features. Previous questions for the same bot are kept in
+a normalized matrix, so a lookup is one matrix-vector product. It is opt-in
+per bot through Organization.semantic_cache_threshold.
+"""
+from collections import OrderedDict
+from functools import lru_cache
+import os
+import re
+import threading
+import zlib
+
+import numpy as np
+
+DIM = int(os.getenv('SEMANTIC_CACHE_DIM', 512))
+MAX_ENTRIES = int(os.getenv('SEMANTIC_CACHE_MAX_ENTRIES', 1000))  # per bot
+MAX_BOTS = int(os.getenv('SEMANTIC_CACHE_MAX_BOTS', 256))
+SEED_LIMIT = int(os.getenv('SEMANTIC_CACHE_SEED_LIMIT', 500))
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+@lru_cache(maxsize=100000)
+def _bucket(feature):
+    h = zlib.crc32(feature.encode('utf-8'))
+    return h % DIM, (1.0 if (h >> 31) & 1 else -1.0)
+
+
+def embed_query(text):
+    """Embed a short query as a unit-length vector of hashed features."""
+    vec = np.zeros(DIM, dtype=np.float32)
+    for word in _WORD_RE.findall(text.lower()):
+        bucket, sign = _bucket(word)
+        vec[bucket] += sign * 2.0
+        padded = f"#{word}#"
+        for i in range(len(padded) - 2):
+            bucket, sign = _bucket(padded[i:i + 3])
+            vec[bucket] += sign
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm else vec
+
+
+class _BotEntries:
+    """Previously answered questions for one bot content version.
+
+    `data` is a (matrix, responses) pair that is replaced, never modified, so
+    a lookup that reads it once always sees rows and answers that match.
+    """
+
+    def __init__(self, version):
+        self.version = version
+        self.data = (np.zeros((0, DIM), dtype=np.float32), [])
+
+    def add(self, vectors, responses):
+        matrix, old = self.data
+        self.data = (np.vstack([matrix, vectors])[-MAX_ENTRIES:], (old + responses)[-MAX_ENTRIES:])
+
+
+class SemanticCache:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._bots = OrderedDict()  # org_id -> _BotEntries
+        self._lock = threading.Lock()
+
+    def _entries(self, org_id, version, seed):
+        with self._lock:
+            entries = self._bots.get(org_id)
+            if entries and entries.version == version:
+                self._bots.move_to_end(org_id)
+                return entries
+
+        fresh = _BotEntries(version)
+        if seed:
+            # Warm up from stored answers given from this same content version
+            pairs = [(q, r) for q, r in seed() if q and r]
+            if pairs:
+                fresh.add(np.vstack([embed_query(q) for q, _ in pairs]), [r for _, r in pairs])
+
+        with self._lock:
+            self._bots[org_id] = fresh
+            self._bots.move_to_end(org_id)
+            while len(self._bots) > MAX_BOTS:
+                self._bots.popitem(last=False)
+        return fresh
+
+    def lookup(self, org_id, version, query, threshold, seed=None):
+        """Return (response, similarity) for the closest past question, or (None, score)."""
+        matrix, responses = self._entries(org_id, version, seed).data
+        if not responses:
+            self._count(hit=False)
+            return None, 0.0
+
+        scores = matrix @ embed_query(query)
+        best = int(np.argmax(scores))
+        similarity = float(scores[best])
+        if similarity >= threshold:
+            self._count(hit=True)
+            return responses[best], similarity
+        self._count(hit=False)
+        return None, similarity
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def add(self, org_id, version, query, response, seed=None):
+        if not response:
+            return
+        entries = self._entries(org_id, version, seed)
+        vector = embed_query(query)[None, :]
+        with self._lock:
+            entries.add(vector, [response])
+
+    def invalidate(self, org_id):
+        with self._lock:
+            self._bots.pop(org_id, None)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total, 4) if total else 0.0,
+            'bots': len(self._bots),
+        }
@@ -0,0 +1,57 @@
+"""Bounded-memory handling of uploaded documents.
+
+Flask's max content length rejects oversized bodies, either up front from
+Content-Length or while a chunked body is being read. Uploads accepted
+within that limit are kept in memory up to UPLOAD_SPOOL_MB and spill to
+an anonymous temporary file beyond it. Nothing is written under a
+filename, and extraction reads straight from the upload stream.
+"""
+import io
+import os
+import tempfile
+
+from flask import Request
+
+MAX_UPLOAD_MB = float(os.getenv('MAX_UPLOAD_MB', 20))
+UPLOAD_SPOOL_MB = float(os.getenv('UPLOAD_SPOOL_MB', 4))
+
+MAX_UPLOAD_BYTES = int(MAX_UPLOAD_MB * 1024 * 1024)
+UPLOAD_SPOOL_BYTES = int(UPLOAD_SPOOL_MB * 1024 * 1024)
+
+
+class UploadRequest(Request):
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        # Werkzeug's default spills to disk past 500KB; keep typical documents in memory
+        return tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_BYTES, mode='rb+')
+
+
+def init_app(app):
+    app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_BYTES
+    app.request_class = UploadRequest
+
+
+def take_upload(file_storage):
+    """Detach an uploaded file from the request so a background job can read it.
+
+    Returns the bytes for small uploads, or the spooled file object for
+    large ones (the caller must close it). Returns None for an empty file.
+    """
+    stream = file_storage.stream
+    # Flask closes request files at teardown; hand it an empty stand-in instead
+    file_storage.stream = io.BytesIO()
+
+    size = stream.seek(0, os.SEEK_END)
+    stream.seek(0)
+    if size == 0:
+        stream.close()
+        return None
+    if size <= UPLOAD_SPOOL_BYTES:
+        data = stream.read()
+        stream.close()
+        return data
+    return stream
+
+
+def close_upload(source):
+    if hasattr(source, 'close'):
+        source.close()
@@ -0,0 +1,171 @@
+"""Dense chunk retrieval with a local, CPU-only embedding.
+
+Chunks are embedded with a signed feature-hashing vectorizer (the same
+tokens BM25 uses, sublinear TF, IDF weighting) into a fixed-size float32
+matrix.
+Each organization's matrix is saved as a .npy file and opened with
+mmap_mode='r', so every gunicorn worker on the host shares the same pages
+through the OS page cache instead of holding its own copy.
+"""
+from collections import OrderedDict
+from functools import lru_cache
+import glob
+import os
+import tempfile
+import threading
+import zlib
+
+import numpy as np
+
+from retrieval import tokenize
+
+DIM = int(os.getenv('VECTOR_DIM', 1024))
+INDEX_DIR = os.getenv(
+    'VECTOR_INDEX_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'vectors')
+)
+LOADED_CACHE_SIZE = int(os.getenv('VECTOR_CACHE_SIZE', 64))
+
+@lru_cache(maxsize=200000)
+def _feature(term):
+    """Map a term to a (bucket, sign) pair with a process-independent hash."""
+    h = zlib.crc32(term.encode('utf-8'))
+    return h % DIM, (1.0 if (h >> 31) & 1 else -1.0)
+
+
+def embed(texts):
+    """Hash texts into an (n, DIM) float32 matrix of sublinear term frequencies."""
+    rows, cols, vals = [], [], []
+    for row, text in enumerate(texts):
+        counts = {}
+        for term in tokenize(text):
+            counts[term] = counts.get(term, 0) + 1
+        for term, tf in counts.items():
+            bucket, sign = _feature(term)
+            rows.append(row)
+            cols.append(bucket)
+            vals.append(sign * (1.0 + np.log(tf)))
+
+    matrix = np.zeros((len(texts), DIM), dtype=np.float32)
+    if rows:
+        np.add.at(matrix, (np.asarray(rows), np.asarray(cols)), np.asarray(vals, dtype=np.float32))
+    return matrix
+
+
+def _normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _paths(org_id, version):
+    base = os.path.join(INDEX_DIR, f"{org_id}-{version}")
+    return base + '.npy', base + '.idf.npy'
+
+
+def _atomic_save(path, array):
+    # Write to a temp file and rename so other workers never see a partial file
+    fd, tmp_path = tempfile.mkstemp(dir=INDEX_DIR, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as fh:
+            np.save(fh, array)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+
+def build(org_id, version, chunks, offload=None):
+    """Embed chunks and persist the matrix and IDF weights for an organization.
+
+    offload(fn, *args), if given, runs the embedding and file writes.
+    """
+    if offload is None:
+        matrix, idf = _write(org_id, version, chunks)
+    else:
+        matrix, idf = offload(_write, org_id, version, chunks)
+    _remember(org_id, version, matrix, idf)
+    return matrix, idf
+
+
+def _write(org_id, version, chunks):
+    os.makedirs(INDEX_DIR, exist_ok=True)
+    raw = embed(chunks)
+
+    # Bucket-level IDF computed from the chunk matrix itself
+    df = np.count_nonzero(raw, axis=0).astype(np.float32)
+    idf = np.log((1.0 + len(chunks)) / (1.0 + df)).astype(np.float32) + 1.0
+    matrix = _normalize(raw * idf).astype(np.float32)
+
+    matrix_path, idf_path = _paths(org_id, version)
+    _atomic_save(idf_path, idf)
+    _atomic_save(matrix_path, matrix)
+
+    # Remove matrices for older content versions of this organization
+    for stale in glob.glob(os.path.join(INDEX_DIR, f"{org_id}-*.npy")):
+        if stale not in (matrix_path, idf_path):
+            try:
+                os.unlink(stale)
+            except OSError:
+                pass
+    return matrix, idf
+
+
+# Per-worker handles to the memory-mapped matrices: org_id -> (version, matrix, idf)
+_loaded = OrderedDict()
+_loaded_lock = threading.Lock()
+
+
+def _remember(org_id, version, matrix, idf):
+    with _loaded_lock:
+        _loaded[org_id] = (version, matrix, idf)
+        _loaded.move_to_end(org_id)
+        while len(_loaded) > LOADED_CACHE_SIZE:
+            _loaded.popitem(last=False)
+
+
+def load(org_id, version, chunks):
+    """Return (matrix, idf) for an organization, loading or building as needed."""
+    with _loaded_lock:
+        entry = _loaded.get(org_id)
+        if entry and entry[0] == version:
+            _loaded.move_to_end(org_id)
+            return entry[1], entry[2]
+
+    matrix_path, idf_path = _paths(org_id, version)
+    try:
+        matrix = np.load(matrix_path, mmap_mode='r')
+        idf = np.load(idf_path)
+        if matrix.shape == (len(chunks), DIM):
+            _remember(org_id, version, matrix, idf)
+            return matrix, idf
+    except (OSError, ValueError):
+        pass
+
+    # Missing, stale or built with different settings (e.g. fresh container)
+    return build(org_id, version, chunks)
+
+
+def search(org_id, version, chunks, query, k):
+    """Return up to k (chunk_idx, cosine_score) pairs, best first."""
+    if not chunks:
+        return []
+    matrix, idf = load(org_id, version, chunks)
+    q = _normalize(embed([query])[0] * idf)
+    scores = matrix @ q
+
+    k = min(k, len(scores))
+    top = np.argpartition(-scores, k - 1)[:k]
+    top = top[np.argsort(-scores[top])]
+    return [(int(idx), float(scores[idx])) for idx in top if scores[idx] > 0]
+
+
+def evict(org_id):
+    """Forget and delete an organization's vectors."""
+    with _loaded_lock:
+        _loaded.pop(org_id, None)
+    for path in glob.glob(os.path.join(INDEX_DIR, f"{org_id}-*.npy")):
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
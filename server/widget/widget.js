@@ -0,0 +1,119 @@
+(function() {
+    var script = document.currentScript;
+    var botId = script.getAttribute('data-bot-id');
+    var apiBase = new URL(script.src).origin;
+    // Fallbacks if the bot's config can't be fetched. The data-* attributes
+    // come from embed snippets made before the config endpoint existed
+    var defaults = {
+        name: 'SmartBot Assistant',
+        theme: script.getAttribute('data-theme') || 'dark',
+        position: script.getAttribute('data-position') || 'bottom-right',
+        primary_color: script.getAttribute('data-color') || '#8B5CF6',
+        welcome_message: 'Hello! How can I help you today?'
+    };
+    
+    function mount(cfg) {
+        var theme = cfg.theme || defaults.theme;
+        var position = cfg.position || defaults.position;
+        var color = cfg.primary_color || defaults.primary_color;
+    
+        var container = document.createElement('div');
+        container.id = 'smartbot-widget';
+        container.innerHTML = `
+            <style>
+                #smartbot-widget { font-family: system-ui, -apple-system, sans-serif; }
+                #smartbot-btn { position: fixed; ${position.includes('right') ? 'right: 20px' : 'left: 20px'}; bottom: 20px; width: 60px; height: 60px; border-radius: 50%; background: ${color}; border: none; cursor: pointer; box-shadow: 0 4px 20px rgba(0,0,0,0.3); z-index: 9999; display: flex; align-items: center; justify-content: center; }
+                #smartbot-btn svg { width: 28px; height: 28px; fill: white; }
+                #smartbot-chat { position: fixed; ${position.includes('right') ? 'right: 20px' : 'left: 20px'}; bottom: 90px; width: 380px; height: 500px; background: ${theme === 'dark' ? '#1a1a2e' : '#fff'}; border-radius: 16px; box-shadow: 0 10px 40px rgba(0,0,0,0.3); z-index: 9999; display: none; flex-direction: column; overflow: hidden; }
+                #smartbot-header { background: ${color}; color: white; padding: 16px; font-weight: 600; }
+                #smartbot-messages { flex: 1; overflow-y: auto; padding: 16px; }
+                #smartbot-input { display: flex; padding: 12px; border-top: 1px solid ${theme === 'dark' ? '#333' : '#eee'}; }
+                #smartbot-input input { flex: 1; padding: 10px; border: 1px solid ${theme === 'dark' ? '#444' : '#ddd'}; border-radius: 8px; background: ${theme === 'dark' ? '#2a2a3e' : '#f5f5f5'}; color: ${theme === 'dark' ? '#fff' : '#000'}; }
+                #smartbot-input button { margin-left: 8px; padding: 10px 16px; background: ${color}; color: white; border: none; border-radius: 8px; cursor: pointer; }
+                .smartbot-msg { margin-bottom: 12px; padding: 10px 14px; border-radius: 12px; max-width: 80%; }
+                .smartbot-bot { background: ${theme === 'dark' ? '#2a2a3e' : '#f0f0f0'}; color: ${theme === 'dark' ? '#fff' : '#000'}; }
+                .smartbot-user { background: ${color}; color: white; margin-left: auto; }
+            </style>
+            <button id="smartbot-btn"><svg viewBox="0 0 24 24"><path d="M12 2C6.48 2 2 6.48 2 12c0 1.54.36 2.98.97 4.29L1 23l6.71-1.97C9.02 21.64 10.46 22 12 22c5.52 0 10-4.48 10-10S17.52 2 12 2z"/></svg></button>
+            <div id="smartbot-chat">
+                <div id="smartbot-header"></div>
+                <div id="smartbot-messages"></div>
+                <div id="smartbot-input"><input type="text" placeholder="Type a message..."><button>Send</button></div>
+            </div>
+        `;
+        document.body.appendChild(container);
+    
+        var btn = document.getElementById('smartbot-btn');
+        var chat = document.getElementById('smartbot-chat');
+        var input = chat.querySelector('input');
+        var sendBtn = chat.querySelector('button');
+        var messages = document.getElementById('smartbot-messages');
+    
+        btn.onclick = function() { chat.style.display = chat.style.display === 'none' ? 'flex' : 'none'; };
+    
+        function addMsg(text, isUser) {
+            var div = document.createElement('div');
+            div.className = 'smartbot-msg ' + (isUser ? 'smartbot-user' : 'smartbot-bot');
+            div.textContent = text;
+            messages.appendChild(div);
+            messages.scrollTop = messages.scrollHeight;
+            return div;
+        }
+    
+        function readStream(r, div) {
+            var reader = r.body.getReader();
+            var decoder = new TextDecoder();
+            var buffer = '';
+            function handle(evt) {
+                var name = 'message', data = '';
+                evt.split('\n').forEach(function(line) {
+                    if (line.indexOf('event:') === 0) name = line.slice(6).trim();
+                    else if (line.indexOf('data:') === 0) data += line.slice(5).trim();
+                });
+                if (!data) return;
+                var payload = JSON.parse(data);
+                if (name === 'error') div.textContent = payload.error;
+                else if (payload.token) div.textContent += payload.token;
+                messages.scrollTop = messages.scrollHeight;
+            }
+            function pump() {
+                return reader.read().then(function(res) {
+                    if (res.done) return;
+                    buffer += decoder.decode(res.value, { stream: true });
+                    var events = buffer.split('\n\n');
+                    buffer = events.pop();
+                    events.forEach(handle);
+                    return pump();
+                });
+            }
+            return pump();
+        }
+    
+        function send() {
+            var q = input.value.trim();
+            if (!q) return;
+            addMsg(q, true);
+            input.value = '';
+            var div = addMsg('', false);
+            fetch(apiBase + '/api/query/' + botId + '/stream', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ query: q })
+            }).then(function(r) {
+                if (r.ok && r.body && window.TextDecoder) return readStream(r, div);
+                return r.json().then(function(d) { div.textContent = d.response || d.error; });
+            }).catch(function() { div.textContent = 'Sorry, something went wrong. Please try again.'; });
+        }
+    
+        sendBtn.onclick = send;
+        input.onkeypress = function(e) { if (e.key === 'Enter') send(); };
+    
+        document.getElementById('smartbot-header').textContent = cfg.name || defaults.name;
+        addMsg(cfg.welcome_message || defaults.welcome_message, false);
+    }
+    
+    fetch(apiBase + '/api/widget/' + botId + '/config')
+        .then(function(r) { return r.ok ? r.json() : {}; })
+        .catch(function() { return {}; })
+        .then(mount);
+})();
@@ -0,0 +1,62 @@
+"""The embeddable widget script, built once per process.
+
+widget/widget.js is minified, hashed and compressed when this module is
+imported, so serving it costs no per-request work. Brotli is produced
+when the optional `brotli` package is installed, gzip always. The content
+hash doubles as the version in /widget.<version>.js URLs, which can be
+cached forever. Plain /widget.js (used by older embed snippets) is cached
+briefly and revalidated with its ETag.
+"""
+from collections import namedtuple
+import gzip
+import hashlib
+import os
+import re
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+WIDGET_SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'widget', 'widget.js')
+WIDGET_MAX_AGE = int(os.getenv('WIDGET_MAX_AGE', 300))  # seconds, for unversioned URLs
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+# bodies: encoding ('br', 'gzip', 'identity') -> bytes
+WidgetAsset = namedtuple('WidgetAsset', 'version bodies')
+
+_COMMENT_LINE = re.compile(r'^\s*//.*$', re.MULTILINE)
+
+
+def minify(source):
+    """Strip comment-only lines, indentation and blank lines.
+
+    Line breaks are kept, so automatic semicolon insertion behaves exactly
+    as in the source.
+    """
+    source = _COMMENT_LINE.sub('', source)
+    return '\n'.join(line.strip() for line in source.splitlines() if line.strip()) + '\n'
+
+
+def build(path=WIDGET_SOURCE):
+    with open(path, encoding='utf-8') as f:
+        raw = minify(f.read()).encode('utf-8')
+    bodies = {'identity': raw, 'gzip': gzip.compress(raw, 9, mtime=0)}
+    if brotli is not None:
+        bodies['br'] = brotli.compress(raw, quality=11)
+    return WidgetAsset(hashlib.sha256(raw).hexdigest()[:12], bodies)
+
+
+asset = build()
+
+
+def pick_encoding(accept_encodings):
+    """Best available encoding for a request's Accept-Encoding (werkzeug Accept object)."""
+    for encoding in ('br', 'gzip'):
+        if encoding in asset.bodies and accept_encodings[encoding] > 0:
+            return encoding
+    return 'identity'
+
+
+def url(base_url):
+    return f"{base_url}/widget.{asset.version}.js"
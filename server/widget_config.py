@@ -0,0 +1,75 @@
+"""Public widget bootstrap config, cached per worker.
+
+The widget fetches its bot's display name, theme, position, colour and
+welcome message on every page view of every site that embeds it. Each
+bot's config is serialized once, with an ETag, and kept in memory for
+WIDGET_CONFIG_TTL seconds, so steady-state widget loads run no queries.
+update_bot_settings and delete_bot invalidate the entry in their own
+worker. Other workers pick up the change when their entry expires.
+Unknown bots are cached too, so made-up ids don't reach the database.
+"""
+from collections import namedtuple
+import hashlib
+import json
+import os
+
+from answer_cache import MemoryBackend
+from models import db, Organization, WidgetConfig
+
+WIDGET_CONFIG_TTL = int(os.getenv('WIDGET_CONFIG_TTL', 60))
+WIDGET_CONFIG_MAX_AGE = int(os.getenv('WIDGET_CONFIG_MAX_AGE', 60))  # browser caching, seconds
+WIDGET_CONFIG_CACHE_SIZE = int(os.getenv('WIDGET_CONFIG_CACHE_SIZE', 4096))
+
+FIELDS = ('theme', 'position', 'welcome_message', 'primary_color')
+# Bots that never saved settings get the WidgetConfig column defaults
+DEFAULTS = {field: WidgetConfig.__table__.c[field].default.arg for field in FIELDS}
+
+# body is the serialized JSON (None for unknown bots)
+CachedConfig = namedtuple('CachedConfig', 'body etag')
+
+_cache = MemoryBackend(max_size=WIDGET_CONFIG_CACHE_SIZE)
+_hits = 0
+_misses = 0
+
+
+def _load(org_id):
+    row = db.session.query(Organization.name, *[getattr(WidgetConfig, f) for f in FIELDS])\
+        .outerjoin(WidgetConfig, WidgetConfig.organization_id == Organization.id)\
+        .filter(Organization.id == org_id, Organization.is_deleted.is_(False))\
+        .first()
+    if row is None:
+        return CachedConfig(None, None)
+
+    config = {'bot_id': org_id, 'name': row.name}
+    for field in FIELDS:
+        value = getattr(row, field)
+        config[field] = value if value is not None else DEFAULTS[field]
+    body = json.dumps(config, sort_keys=True).encode('utf-8')
+    return CachedConfig(body, hashlib.sha1(body).hexdigest()[:16])
+
+
+def get(org_id):
+    """The CachedConfig for a bot, loading it on a miss."""
+    global _hits, _misses
+    cached = _cache.get(org_id)
+    if cached is not None:
+        _hits += 1
+        return cached
+    _misses += 1
+    cached = _load(org_id)
+    _cache.set(org_id, cached, WIDGET_CONFIG_TTL)
+    return cached
+
+
+def invalidate(org_id):
+    _cache.delete_prefix(org_id)
+
+
+def stats():
+    total = _hits + _misses
+    return {
+        'hits': _hits,
+        'misses': _misses,
+        'hit_rate': round(_hits / total, 4) if total else 0.0,
+        'entries': _cache.size(),
+    }